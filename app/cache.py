@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from . import http_client
+from .config import Config
+from .probe import HeaderParser, probe_image
+
+MAX_INPUT_SIZE = 10 * 1024 * 1024
+
+
+class InputError(Exception):
+    """Raised when a downloaded input is rejected."""
+
+
+class CachedInput:
+    def __init__(self, path, sha256, size, width, height, source='downloaded'):
+        # source is 'downloaded', 'deduplicated' (new download, known content) or 'revalidated' (304)
+        self.source = source
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.width = width
+        self.height = height
+
+
+class InputCache:
+    """Content-addressed cache of downloaded inputs.
+
+    Blobs live under ``objects/<sha[:2]>/<sha>`` with the probed dimensions
+    and other header metadata in a ``.json`` file next to them. ``urls/`` maps each input URL to the blob it
+    last resolved to, along with the validators used for conditional GETs.
+    The blob mtime is bumped on every hit and drives LRU eviction.
+    """
+
+    def __init__(self, root=None, max_bytes=None, min_age=None):
+        self.root = os.path.join(root or Config.CACHE_DIR, 'inputs')
+        self.max_bytes = Config.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.min_age = Config.CACHE_MIN_AGE if min_age is None else min_age
+
+    def _url_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'urls', key + '.json')
+
+    def _object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def _read_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, payload):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def _load_object(self, sha256):
+        path = self._object_path(sha256)
+        meta = self._read_json(path + '.json')
+        if meta is None or not os.path.exists(path):
+            return None
+        os.utime(path)
+        return CachedInput(path, sha256, meta['size'], meta.get('width'), meta.get('height'))
+
+    def touch(self, path):
+        """Mark a blob as just used, so eviction leaves it for at least ``min_age``; False if it is gone."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def probe(self, sha256):
+        """Return the (width, height) of a cached blob, probing it at most once."""
+        path = self._object_path(sha256)
+        meta = self._read_json(path + '.json')
+        if meta is None:
+            raise InputError('Input is not cached')
+        if meta.get('width') is None or meta.get('height') is None:
+            meta.update(probe_image(path))
+            self._write_json(path + '.json', meta)
+        return meta['width'], meta['height']
+
+    def fetch(self, url, use_cache=True):
+        """Return a ``CachedInput`` for ``url``, downloading only when needed.
+
+        With ``use_cache`` the previous ETag/Last-Modified are sent as
+        validators and a 304 reuses the cached blob without re-probing it.
+        Otherwise the input is always downloaded, but identical content still
+        resolves to the existing blob and its stored dimensions. JPEG, PNG
+        and WebP dimensions are read from the header during the download;
+        other blobs come back with ``width``/``height`` unset until they are
+        probed, see ``probe``.
+        """
+        url_path = self._url_path(url)
+        url_entry = self._read_json(url_path) if use_cache else None
+        cached = self._load_object(url_entry['sha256']) if url_entry else None
+
+        headers = {}
+        if cached is not None:
+            if url_entry.get('etag'):
+                headers['If-None-Match'] = url_entry['etag']
+            if url_entry.get('last_modified'):
+                headers['If-Modified-Since'] = url_entry['last_modified']
+
+        with http_client.open_url(url, headers=headers) as response:
+            if cached is not None and response.status_code == 304:
+                cached.source = 'revalidated'
+                return cached
+            response.raise_for_status()
+
+            if 'content-length' in response.headers and int(response.headers['content-length']) > MAX_INPUT_SIZE:
+                raise InputError('File is too large')
+            if 'content-type' in response.headers and 'application/json' in response.headers['content-type']:
+                raise InputError('Invalid file type')
+
+            entry = self._store(response)
+
+        self._write_json(url_path, {
+            'url': url,
+            'sha256': entry.sha256,
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified')
+        })
+        self.evict()
+        return entry
+
+    def _store(self, response):
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        # Reads the header as it streams past, so no ffprobe run is needed
+        parser = HeaderParser() if Config.INPUT_HEADER_PROBE else None
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in http_client.iter_content(response):
+                    size += len(chunk)
+                    # Servers can omit or understate content-length, so the limit is enforced on the body too
+                    if size > MAX_INPUT_SIZE:
+                        raise InputError('File is too large')
+                    digest.update(chunk)
+                    if parser is not None:
+                        parser.feed(chunk)
+                    f.write(chunk)
+            header = {'width': None, 'height': None}
+            if parser is not None:
+                parser.close()
+                header = parser.info()
+
+            sha256 = digest.hexdigest()
+            existing = self._load_object(sha256)
+            if existing is not None:
+                existing.source = 'deduplicated'
+                if existing.width is None and header['width'] is not None:
+                    existing.width, existing.height = header['width'], header['height']
+                    self._write_json(existing.path + '.json', dict(header, size=existing.size))
+                return existing
+
+            path = self._object_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            self._write_json(path + '.json', dict(header, size=size))
+            return CachedInput(path, sha256, size, header['width'], header['height'])
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self):
+        """Remove least recently used blobs until the cache fits ``max_bytes``.
+
+        A queued job can outlive ``min_age`` and find its blob gone; render
+        tasks fetch it again then, see ``restore_inputs`` in ``app.tasks``.
+        """
+        objects_dir = os.path.join(self.root, 'objects')
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(objects_dir):
+            for name in filenames:
+                if name.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        now = time.time()
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < self.min_age:
+                continue
+            for stale in (path, path + '.json'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+input_cache = InputCache()
@@ -1,4 +1,14 @@
+import os
+import time
+import shutil
 from celery import Celery
+from celery.signals import (
+    before_task_publish, task_prerun, worker_init, worker_process_init, worker_process_shutdown
+)
+from prometheus_client import start_http_server, multiprocess
+
+from .config import Config
+from .metrics import build_registry, observe_queue_wait, pipeline_queues
 
 def make_celery(app_name=__name__):
     celery = Celery(app_name)
@@ -7,5 +17,54 @@ def make_celery(app_name=__name__):
 
 celery_app = make_celery()
 
+# Flask app and pushed app context owned by this worker process
+_worker = {'pid': None, 'flask_app': None, 'context': None}
+
+def get_flask_app():
+    """The worker process's Flask app, built once rather than for every task.
+
+    Pool processes get theirs in ``worker_process_init``; thread and solo
+    pools, which never send that signal, build it on first use.
+    """
+    if _worker['pid'] != os.getpid():
+        from app import create_app
+        _worker.update(pid=os.getpid(), flask_app=create_app(), context=None)
+    return _worker['flask_app']
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    context = get_flask_app().app_context()
+    context.push()
+    _worker['context'] = context
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+@task_prerun.connect
+def record_queue_wait(task=None, args=None, **kwargs):
+    data = args[0] if args and isinstance(args[0], dict) else {}
+    observe_queue_wait(task.name, getattr(task.request, 'published_at', None), data)
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """Serve the worker's metrics, merged across pool processes, on WORKER_METRICS_PORT."""
+    multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        # Files left over from a previous run would be merged into the new totals
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+    if Config.WORKER_METRICS_PORT:
+        start_http_server(Config.WORKER_METRICS_PORT, registry=build_registry(pipeline_queues()))
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(pid=None, **kwargs):
+    if _worker['context'] is not None:
+        _worker['context'].pop()
+        _worker['context'] = None
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 # Import tasks to ensure they are registered with Celery
 import app.tasks
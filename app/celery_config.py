@@ -1,11 +1,40 @@
-from celery import Celery
-from app import create_app
 from .config import Config
 
-def create_celery_app(flask_app=None):
-    flask_app = flask_app or create_app()
-    celery = Celery(flask_app.import_name, broker=flask_app.config['CELERY_BROKER_URL'])
-    celery.conf.update(flask_app.config)
-    return celery
+broker_url = Config.CELERY_BROKER_URL
+result_backend = Config.CELERY_RESULT_BACKEND
 
-celery_app = create_celery_app()
+# Redis emulates priorities with one list per level; lower numbers are served first
+broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority'
+}
+
+# Each pipeline stage gets its own queue so fetch, probe, render and webhook
+# workers can be scaled and given their own concurrency independently.
+task_default_queue = 'celery'
+task_routes = {
+    'app.tasks.fetch_input_task': {'queue': 'fetch'},
+    'app.tasks.batch_input_task': {'queue': 'fetch'},
+    'app.tasks.fetch_timeline_task': {'queue': 'fetch'},
+    'app.tasks.probe_input_task': {'queue': 'probe'},
+    'app.tasks.probe_timeline_task': {'queue': 'probe'},
+    'app.tasks.create_video_task': {'queue': 'render'},
+    'app.tasks.create_timeline_task': {'queue': 'render'},
+    'app.tasks.render_segment_task': {'queue': 'render'},
+    'app.tasks.send_webhook_task': {'queue': 'webhooks'},
+    'app.tasks.flush_webhooks_task': {'queue': 'webhooks'},
+    'app.tasks.deliver_webhook_task': {'queue': 'webhooks'},
+    'app.tasks.sweep_webhooks_task': {'queue': 'webhooks'},
+    'app.tasks.report_failure_task': {'queue': 'webhooks'},
+    'app.tasks.send_batch_webhook_task': {'queue': 'webhooks'},
+    'app.tasks.report_batch_failure_task': {'queue': 'webhooks'},
+}
+
+# Run by the celery_beat service; picks up callbacks whose flush was lost
+beat_schedule = {
+    'sweep-webhooks': {
+        'task': 'app.tasks.sweep_webhooks_task',
+        'schedule': Config.WEBHOOK_SWEEP_INTERVAL
+    }
+}
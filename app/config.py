@@ -2,14 +2,107 @@ import os
 
 class Config:
     CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))
+    CACHE_MIN_AGE = int(os.getenv('CACHE_MIN_AGE', 300))
+    RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))
+    # Stills are decoded, oriented and framed once into a raw output-size frame that renders loop
+    PRESCALE_STILLS = os.getenv('PRESCALE_STILLS', 'true').lower() == 'true'
+    PRESCALE_CACHE_MAX_BYTES = int(os.getenv('PRESCALE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
     MOVIES_DIR = os.getenv('MOVIES_DIR', 'movies')
     DEFAULT_ZOOM = float(os.getenv('DEFAULT_ZOOM', 0.002))
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+    HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', 10))
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 16))
+    HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', 8))
+    HTTP_MAX_RESUMES = int(os.getenv('HTTP_MAX_RESUMES', 3))
+    # Read image dimensions from the JPEG/PNG/WebP header while downloading instead of running ffprobe
+    INPUT_HEADER_PROBE = os.getenv('INPUT_HEADER_PROBE', 'true').lower() == 'true'
+    MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 500))
+    MAX_TIMELINE_CLIPS = int(os.getenv('MAX_TIMELINE_CLIPS', 50))
+    MAX_RENDITIONS = int(os.getenv('MAX_RENDITIONS', 8))
+    STILL_SEGMENT_SECONDS = float(os.getenv('STILL_SEGMENT_SECONDS', 2))
+    # Motion clips and timelines are encoded in parallel segments of this length
+    # once they span two segments and duration * width * height reaches the minimum
+    SEGMENT_SECONDS = float(os.getenv('SEGMENT_SECONDS', 10))
+    SEGMENT_MIN_PIXEL_SECONDS = float(os.getenv('SEGMENT_MIN_PIXEL_SECONDS', 1920 * 1080 * 30))
+    # Playlist segment length for hls/dash output modes
+    STREAM_SEGMENT_SECONDS = float(os.getenv('STREAM_SEGMENT_SECONDS', 2))
+    DEFAULT_ENCODER_PROFILE = os.getenv('DEFAULT_ENCODER_PROFILE', 'balanced')
+    ENCODER_THREADS = int(os.getenv('ENCODER_THREADS', 0))
     SCHEME = os.getenv('SCHEME', 'https')
     PUBLIC_PORT = os.getenv('PUBLIC_PORT', '80')
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
     CELERY_LOG_LEVEL = os.getenv('CELERY_LOG_LEVEL', 'ERROR')
+    REDIS_URL = os.getenv('REDIS_URL', CELERY_RESULT_BACKEND)
+    STATUS_TTL = int(os.getenv('STATUS_TTL', 24 * 60 * 60))
+    JOB_TTL = int(os.getenv('JOB_TTL', 24 * 60 * 60))
+    # Fair-share scheduling: job cost is duration * framerate * output pixels. A tenant's
+    # queued and running cost is capped at its budget, and TENANT_WEIGHTS ("key:2,other:0.5")
+    # scales both the budget and the number of renders it may run at once.
+    TENANT_BACKLOG_BUDGET = float(os.getenv('TENANT_BACKLOG_BUDGET', 1920 * 1080 * 30 * 600))
+    TENANT_MAX_RENDERS = int(os.getenv('TENANT_MAX_RENDERS', 2))
+    TENANT_WEIGHTS = {
+        key: float(weight)
+        for key, weight in (item.split(':') for item in os.getenv('TENANT_WEIGHTS', '').split(',') if item)
+    }
+    TENANT_SLOT_TTL = int(os.getenv('TENANT_SLOT_TTL', 60 * 60))
+    TENANT_SLOT_RETRY_SECONDS = float(os.getenv('TENANT_SLOT_RETRY_SECONDS', 5))
+    # Output pixel-frames one render slot encodes per second, used for Retry-After
+    RENDER_PIXEL_RATE = float(os.getenv('RENDER_PIXEL_RATE', 1920 * 1080 * 60))
+    # Cost model: the prior is used until enough renders have been measured
+    COST_MODEL_MIN_SAMPLES = int(os.getenv('COST_MODEL_MIN_SAMPLES', 20))
+    COST_MODEL_RIDGE = float(os.getenv('COST_MODEL_RIDGE', 1e-3))
+    COST_MODEL_PRIOR_BITS_PER_PIXEL = float(os.getenv('COST_MODEL_PRIOR_BITS_PER_PIXEL', 0.02))
+    # Renders predicted to take at least this long go to the render_large pool
+    LARGE_RENDER_SECONDS = float(os.getenv('LARGE_RENDER_SECONDS', 60))
+    RENDER_CONCURRENCY = int(os.getenv('RENDER_CONCURRENCY', 2))
+    RENDER_LARGE_CONCURRENCY = int(os.getenv('RENDER_LARGE_CONCURRENCY', 1))
+    # Output storage: 'local' (MOVIES_DIR on the shared volume) or 's3'
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    STORAGE_CONTENT_ADDRESSED = os.getenv('STORAGE_CONTENT_ADDRESSED', 'false').lower() == 'true'
+    # Upload MP4s to S3 from ffmpeg's output pipe while encoding (as fragmented MP4)
+    STORAGE_STREAM_UPLOAD = os.getenv('STORAGE_STREAM_UPLOAD', 'true').lower() == 'true'
+    S3_BUCKET = os.getenv('S3_BUCKET', 'json2video')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+    S3_PUBLIC_URL = os.getenv('S3_PUBLIC_URL')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', 8 * 1024 * 1024))
+    S3_UPLOAD_CONCURRENCY = int(os.getenv('S3_UPLOAD_CONCURRENCY', 4))
+    FFMPEG_STALL_TIMEOUT = int(os.getenv('FFMPEG_STALL_TIMEOUT', 60))
+    WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0))
+    WEBHOOK_CONNECT_TIMEOUT = float(os.getenv('WEBHOOK_CONNECT_TIMEOUT', 3))
+    WEBHOOK_READ_TIMEOUT = float(os.getenv('WEBHOOK_READ_TIMEOUT', 10))
+    WEBHOOK_MAX_RETRIES = int(os.getenv('WEBHOOK_MAX_RETRIES', 8))
+    WEBHOOK_BACKOFF_BASE = float(os.getenv('WEBHOOK_BACKOFF_BASE', 2))
+    WEBHOOK_BACKOFF_MAX = float(os.getenv('WEBHOOK_BACKOFF_MAX', 600))
+    WEBHOOK_BATCH_WINDOW = float(os.getenv('WEBHOOK_BATCH_WINDOW', 0.5))
+    WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 50))
+    WEBHOOK_FLUSH_TTL = int(os.getenv('WEBHOOK_FLUSH_TTL', 60))
+    WEBHOOK_SWEEP_INTERVAL = float(os.getenv('WEBHOOK_SWEEP_INTERVAL', 60))
+    WEBHOOK_DEAD_LETTER_MAX = int(os.getenv('WEBHOOK_DEAD_LETTER_MAX', 10000))
     ALLOWED_DOMAINS = os.getenv('ALLOWED_DOMAINS', 'example.com,trusted.com').split(',')
+    # libx264 settings per speed/quality tier; threads 0 defers to ENCODER_THREADS
+    ENCODER_PROFILES = {
+        'fast': {
+            'preset': 'veryfast',
+            'crf': 26,
+            'tune': 'stillimage',
+            'threads': 0
+        },
+        'balanced': {
+            'preset': 'medium',
+            'crf': 23,
+            'tune': 'stillimage',
+            'threads': 0
+        },
+        'archive': {
+            'preset': 'slow',
+            'crf': 18,
+            'tune': 'stillimage',
+            'threads': 0
+        }
+    }
     ALLOWED_IPS = {
         'MAKE_US1': [
             '54.209.79.175',
@@ -0,0 +1,164 @@
+# app/cost_model.py
+"""Online least-squares model of render time and output size.
+
+Every single-process render adds its features and measured encode seconds
+and output bytes to sums kept in one Redis hash (``X'X`` and ``X'y``), so
+all API and worker processes share one model without storing samples.
+Predictions solve the ridge-regularized normal equations. Until enough
+renders have been observed a throughput-based prior is used instead.
+"""
+import time
+import logging
+import redis
+
+from .config import Config
+from .kenburns import motion_for
+from .metrics import queue_depths
+from .render_cache import render_params
+from .status import get_redis
+from .timeline import timeline_duration
+
+logger = logging.getLogger(__name__)
+
+MODEL_KEY = 'cost_model'
+FEATURES = ('intercept', 'input_mp', 'frame_mp', 'crop_frame_mp', 'motion_frame_mp')
+TARGETS = ('seconds', 'bytes')
+
+
+def _motion_share(data):
+    if 'timeline' in data:
+        clips = data['timeline']['clips']
+        return sum(1 for clip in clips if motion_for(clip)) / len(clips)
+    return 1.0 if motion_for(data) else 0.0
+
+
+def features(data, mean_input_mp=0.0):
+    """Feature vector of a request; ``mean_input_mp`` stands in for input sizes not probed yet."""
+    if 'timeline' in data:
+        duration = timeline_duration(data['timeline']['clips'])
+    else:
+        duration = float(data['duration'])
+    frames = duration * float(data['framerate'])
+    pixels = data['output_width'] * data['output_height']
+    pixels += sum(rendition['output_width'] * rendition['output_height'] for rendition in data.get('renditions', []))
+    frame_mp = frames * pixels / 1e6
+    if data.get('input_width') and data.get('input_height'):
+        input_mp = data['input_width'] * data['input_height'] / 1e6
+    else:
+        input_mp = mean_input_mp
+    crop = 1.0 if render_params(data)['crop'] else 0.0
+    return [1.0, input_mp, frame_mp, crop * frame_mp, _motion_share(data) * frame_mp]
+
+
+def _solve(matrix, vector):
+    """Solve ``matrix @ x = vector`` by Gaussian elimination with partial pivoting."""
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        if rows[column][column] == 0:
+            raise ZeroDivisionError('singular matrix')
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for k in range(column, size + 1):
+                rows[row][k] -= factor * rows[column][k]
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        total = sum(rows[row][k] * solution[k] for k in range(row + 1, size))
+        solution[row] = (rows[row][size] - total) / rows[row][row]
+    return solution
+
+
+def load():
+    """Current sums as floats, or an empty model if Redis is unreachable."""
+    try:
+        raw = get_redis().hgetall(MODEL_KEY)
+    except redis.RedisError as e:
+        logger.warning(f'Could not load cost model: {e}')
+        return {}
+    return {key.decode() if isinstance(key, bytes) else key: float(value) for key, value in raw.items()}
+
+
+def observe(data, seconds, size):
+    """Add one measured render to the model."""
+    x = features(data)
+    fields = {'n': 1.0}
+    for i in range(len(FEATURES)):
+        for j in range(i, len(FEATURES)):
+            fields[f'xx:{i}:{j}'] = x[i] * x[j]
+        fields[f'xy:seconds:{i}'] = x[i] * seconds
+        fields[f'xy:bytes:{i}'] = x[i] * size
+    try:
+        pipe = get_redis().pipeline()
+        for field, value in fields.items():
+            pipe.hincrbyfloat(MODEL_KEY, field, value)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f'Could not update cost model: {e}')
+
+
+def _prior(x):
+    pixel_frames = x[2] * 1e6
+    return {
+        'seconds': 1.0 + pixel_frames / Config.RENDER_PIXEL_RATE,
+        'bytes': pixel_frames * Config.COST_MODEL_PRIOR_BITS_PER_PIXEL / 8
+    }
+
+
+def predict(data, model=None):
+    """Predicted encode ``seconds`` and output ``bytes`` for a request."""
+    model = load() if model is None else model
+    samples = model.get('n', 0.0)
+    mean_input_mp = model.get('xx:0:1', 0.0) / samples if samples else 0.0
+    x = features(data, mean_input_mp)
+    if samples < Config.COST_MODEL_MIN_SAMPLES:
+        return _prior(x)
+
+    size = len(FEATURES)
+    xx = [[model.get(f'xx:{min(i, j)}:{max(i, j)}', 0.0) for j in range(size)] for i in range(size)]
+    for i in range(size):
+        xx[i][i] += Config.COST_MODEL_RIDGE
+    prediction = {}
+    try:
+        for target in TARGETS:
+            beta = _solve(xx, [model.get(f'xy:{target}:{i}', 0.0) for i in range(size)])
+            prediction[target] = sum(b * v for b, v in zip(beta, x))
+    except ZeroDivisionError:
+        return _prior(x)
+    return {'seconds': max(0.1, prediction['seconds']), 'bytes': max(0.0, prediction['bytes'])}
+
+
+def render_queue(prediction):
+    """Worker pool for a job: long renders go to the large pool so they cannot block short ones."""
+    return 'render_large' if prediction['seconds'] >= Config.LARGE_RENDER_SECONDS else 'render'
+
+
+def queue_wait(queue, model):
+    """Seconds until a new job on ``queue`` starts: waiting jobs times the mean render time, over the pool size."""
+    samples = model.get('n', 0.0)
+    if not samples:
+        return 0.0
+    mean_seconds = model.get('xy:seconds:0', 0.0) / samples
+    try:
+        waiting = queue_depths([queue])[queue]
+    except (redis.RedisError, ValueError) as e:
+        logger.warning(f'Could not read depth of {queue}: {e}')
+        return 0.0
+    workers = Config.RENDER_LARGE_CONCURRENCY if queue == 'render_large' else Config.RENDER_CONCURRENCY
+    return waiting * mean_seconds / max(1, workers)
+
+
+def estimate(data):
+    """Prediction, pool and ETA for a request; sets ``render_queue`` on ``data``."""
+    model = load()
+    prediction = predict(data, model)
+    queue = render_queue(prediction)
+    data['render_queue'] = queue
+    eta_seconds = queue_wait(queue, model) + prediction['seconds']
+    return {
+        'estimated_seconds': round(prediction['seconds'], 1),
+        'estimated_bytes': int(prediction['bytes']),
+        'eta_seconds': round(eta_seconds, 1),
+        'eta': int(time.time() + eta_seconds)
+    }
@@ -0,0 +1,213 @@
+# app/ffmpeg.py
+import os
+import math
+import time
+import threading
+import subprocess
+from .config import Config
+from .metrics import FFMPEG_EXITS
+
+# Fields from ffmpeg's -progress output that are worth publishing
+PROGRESS_FIELDS = ('frame', 'fps', 'speed', 'out_time', 'out_time_us', 'progress')
+
+def _read_progress(read_fd, on_progress, state):
+    """Parse ``key=value`` blocks from ffmpeg's -progress pipe; each block ends with ``progress=``."""
+    block = {}
+    with os.fdopen(read_fd, 'r') as progress_pipe:
+        for line in progress_pipe:
+            key, _, value = line.strip().partition('=')
+            if key in PROGRESS_FIELDS:
+                block[key] = value.strip()
+            if key == 'progress':
+                state['last_update'] = time.monotonic()
+                on_progress(block)
+                block = {}
+
+def _watch_stall(process, state, stall_timeout, done):
+    while not done.wait(1):
+        if time.monotonic() - state['last_update'] > stall_timeout:
+            state['stalled'] = True
+            process.kill()
+            return
+
+def _drain(process, stdout_sink, state):
+    try:
+        stdout_sink(process.stdout)
+    except Exception as e:
+        # Nothing reads the pipe any more, so ffmpeg would block on its next write
+        state['sink_error'] = e
+        process.kill()
+
+def _communicate(process, stdout_sink, state):
+    """Wait for ffmpeg; with ``stdout_sink`` its output pipe is handed to the sink on a thread."""
+    if stdout_sink is None:
+        return process.communicate()
+    drainer = threading.Thread(target=_drain, args=(process, stdout_sink, state), daemon=True)
+    drainer.start()
+    stderr = process.stderr.read()
+    process.wait()
+    drainer.join()
+    return b'', stderr
+
+def run_ffmpeg(command, on_progress=None, stall_timeout=None, stdout_sink=None):
+    """Run an ffmpeg command and return (stdout, stderr), raising CalledProcessError on failure.
+
+    With ``on_progress`` ffmpeg writes ``-progress`` reports to a dedicated
+    pipe that is parsed on a thread while the command runs. If no report
+    arrives for ``stall_timeout`` seconds the process is killed.
+    ``stdout_sink`` consumes the output of a command writing to ``pipe:1``
+    while it runs; an exception from the sink kills ffmpeg and is re-raised.
+    """
+    state = {}
+    if on_progress is None:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = _communicate(process, stdout_sink, state)
+    else:
+        read_fd, write_fd = os.pipe()
+        command = command[:1] + ['-progress', f'pipe:{write_fd}', '-nostats'] + command[1:]
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=(write_fd,))
+        finally:
+            # Only ffmpeg keeps the write end, so the reader sees EOF when it exits
+            os.close(write_fd)
+
+        state.update(last_update=time.monotonic(), stalled=False)
+        done = threading.Event()
+        reader = threading.Thread(target=_read_progress, args=(read_fd, on_progress, state), daemon=True)
+        reader.start()
+        if stall_timeout:
+            threading.Thread(target=_watch_stall, args=(process, state, stall_timeout, done), daemon=True).start()
+        try:
+            stdout, stderr = _communicate(process, stdout_sink, state)
+        finally:
+            done.set()
+        reader.join()
+        if state['stalled']:
+            stderr = (stderr or b'') + f'\nKilled after {stall_timeout}s without progress'.encode('utf-8')
+
+    FFMPEG_EXITS.labels(code=str(process.returncode)).inc()
+    if state.get('sink_error'):
+        raise state['sink_error']
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(returncode=process.returncode, cmd=command, output=stderr)
+    return stdout, stderr
+
+def encoder_args(profile=None, still=True):
+    """libx264 arguments for a named profile, defaulting to this worker's ``DEFAULT_ENCODER_PROFILE``."""
+    settings = Config.ENCODER_PROFILES[profile or Config.DEFAULT_ENCODER_PROFILE]
+    args = [
+        '-c:v', 'libx264',
+        '-preset', settings['preset'],
+        '-crf', str(settings['crf'])
+    ]
+    # stillimage tuning hurts quality once the picture moves
+    if settings.get('tune') and (still or settings['tune'] != 'stillimage'):
+        args += ['-tune', settings['tune']]
+    threads = settings.get('threads') or Config.ENCODER_THREADS
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+def split_command(input_args, source_filter, branches):
+    """Decode the input once and ``split`` it into one filter branch and encoded output per entry.
+
+    ``source_filter`` runs once before the split and may be empty. ``branches``
+    holds ``(filter chain, output arguments ending with the output file)``.
+    """
+    source = f"{source_filter}," if source_filter else ""
+    graph = f"[0:v]{source}split={len(branches)}" + "".join(f"[s{i}]" for i in range(len(branches)))
+    for index, (chain, _) in enumerate(branches):
+        graph += f";[s{index}]{chain}[o{index}]"
+    command = ['ffmpeg'] + input_args + ['-filter_complex', graph]
+    for index, (_, output_args) in enumerate(branches):
+        command += ['-map', f'[o{index}]'] + output_args
+    return command
+
+def still_image_command(input_file, video_filter, duration, framerate, output_file, gop=None, overwrite=False, encoder=None,
+                        raw_size=None):
+    """Encode ``duration`` seconds of a looped still image.
+
+    With ``raw_size`` the input is a prescaled raw yuv420p frame of that
+    ``(width, height)``, looped as a stream with nothing left to decode, and
+    ``video_filter`` may be None.
+    """
+    command = ['ffmpeg']
+    if overwrite:
+        command.append('-y')
+    if raw_size:
+        command += [
+            '-f', 'rawvideo',
+            '-pix_fmt', 'yuv420p',
+            '-s', f'{raw_size[0]}x{raw_size[1]}',
+            '-framerate', str(framerate),
+            '-stream_loop', '-1'
+        ]
+    else:
+        command += ['-loop', '1']
+    command += ['-i', input_file]
+    if video_filter:
+        command += ['-vf', video_filter]
+    command += [
+        '-t', str(duration),
+        '-pix_fmt', 'yuv420p',
+        '-r', str(framerate)
+    ]
+    if gop:
+        command += ['-g', str(gop)]
+    if encoder:
+        command += encoder
+    return command + [output_file]
+
+def motion_command(input_file, video_filter, frames, framerate, output_file, encoder=None):
+    """Encode ``frames`` frames generated by the filter graph from a single decoded image."""
+    command = [
+        'ffmpeg',
+        '-i', input_file,
+        '-vf', video_filter,
+        '-frames:v', str(frames),
+        '-pix_fmt', 'yuv420p',
+        '-r', str(framerate)
+    ]
+    if encoder:
+        command += encoder
+    return command + [output_file]
+
+def pipe_output(command):
+    """Send a command's MP4 to stdout instead of its output file.
+
+    A pipe cannot be seeked back to write the index, so the MP4 is fragmented.
+    """
+    return command[:-1] + ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', 'pipe:1']
+
+def segment_path(output_file):
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f'.{name}.segment.mp4')
+
+def loop_copy_command(segment_file, duration, output_file):
+    """Repeat an encoded segment up to ``duration`` with stream copy."""
+    return [
+        'ffmpeg',
+        '-stream_loop', '-1',
+        '-i', segment_file,
+        '-c', 'copy',
+        '-t', str(duration),
+        output_file
+    ]
+
+def looped_still_commands(input_file, video_filter, duration, framerate, output_file, segment_seconds, encoder=None,
+                          raw_size=None):
+    """Commands that encode one short segment and stream-copy it up to ``duration``.
+
+    Every frame of a still image is identical, so encoding ``segment_seconds``
+    once as a single GOP and repeating it with ``-stream_loop`` gives the same
+    picture for a fraction of the encode time. Returns the commands and the
+    intermediate segment file the caller should remove afterwards.
+    """
+    segment_file = segment_path(output_file)
+    gop = max(1, int(math.ceil(segment_seconds * framerate)))
+    commands = [
+        still_image_command(input_file, video_filter, segment_seconds, framerate, segment_file, gop=gop, overwrite=True,
+                            encoder=encoder, raw_size=raw_size),
+        loop_copy_command(segment_file, duration, output_file)
+    ]
+    return commands, segment_file
@@ -0,0 +1,124 @@
+# app/filters.py
+"""Video filter chains built as a structure and rendered in a canonical form.
+
+``FilterChain`` records each filter together with the frame size it
+produces, so the rendered string can leave out what does nothing: a scale,
+crop or pad to the size the frame already has, a scale that the next scale
+replaces, or a pixel format conversion to the format the frame is already
+in. A conversion is also moved past the crops and downscales that follow
+it, which makes it run on the fewest pixels, and usually in the same pass
+as the scale. Two chains that render the same frames therefore render the
+same string, which is what the render cache keys on.
+"""
+from .kenburns import base_size
+
+# Filters that only move or drop pixels, so a format conversion gives the same picture before or after them
+GEOMETRY = ('crop', 'scale', 'pad', 'hflip', 'vflip', 'transpose')
+
+
+class FilterChain:
+    """A linear chain of video filters applied to frames of a known size.
+
+    ``filter`` takes any other filter as text, with its output size when it
+    changes the frame size; such filters are assumed to keep the pixel format.
+    """
+
+    def __init__(self, width, height):
+        self.input_size = (int(width), int(height))
+        self.width, self.height = self.input_size
+        # (name, options, size after the filter)
+        self.steps = []
+
+    def _add(self, name, options, width=None, height=None):
+        if width is not None:
+            self.width, self.height = int(width), int(height)
+        self.steps.append((name, options, (self.width, self.height)))
+        return self
+
+    def scale(self, width, height):
+        return self._add('scale', f'{int(width)}:{int(height)}', width, height)
+
+    def crop(self, width, height, x, y):
+        return self._add('crop', f'{int(width)}:{int(height)}:{int(x)}:{int(y)}', width, height)
+
+    def pad(self, width, height, x, y):
+        return self._add('pad', f'{int(width)}:{int(height)}:{int(x)}:{int(y)}', width, height)
+
+    def format(self, pixel_format):
+        return self._add('format', pixel_format)
+
+    def filter(self, text, width=None, height=None):
+        name, _, options = text.partition('=')
+        return self._add(name, options, width, height)
+
+    def fit(self, output_width, output_height, crop):
+        """Frame the picture for the output size: a centre crop, or a scale to fit and a pad.
+
+        A crop larger than the picture is limited to it, leaving the final
+        scale to stretch it to the output size, as before.
+        """
+        width, height = self.width, self.height
+        if (width, height) == (output_width, output_height):
+            return self
+        if crop:
+            crop_width = min(width, output_width)
+            crop_height = min(height, output_height)
+            return self.crop(crop_width, crop_height, (width - crop_width) // 2, (height - crop_height) // 2)
+        if output_width * height <= output_height * width:
+            fit_width, fit_height = output_width, min(output_height, _even(height * output_width / width))
+        else:
+            fit_width, fit_height = min(output_width, _even(width * output_height / height)), output_height
+        self.scale(fit_width, fit_height)
+        return self.pad(output_width, output_height, (output_width - fit_width) // 2, (output_height - fit_height) // 2)
+
+    def canonical(self):
+        """The filters that change the picture, cheapest first, as ``name=options`` entries."""
+        steps = []
+        size = self.input_size
+        pixel_format = None
+        pending = None
+        for name, options, after in self.steps:
+            if name == 'format':
+                # Held back until a filter that makes the frame larger, or one it must not move past
+                pending = options
+                continue
+            if pending and (name not in GEOMETRY or after[0] * after[1] > size[0] * size[1]):
+                if pending != pixel_format:
+                    steps.append(('format', pending, size))
+                    pixel_format = pending
+                pending = None
+            if name in ('scale', 'crop', 'pad') and after == size:
+                continue
+            if name == 'scale' and steps and steps[-1][0] == 'scale':
+                # Scaling twice in a row only blurs more than scaling once
+                steps.pop()
+                size = steps[-1][2] if steps else self.input_size
+                if after == size:
+                    continue
+            steps.append((name, options, after))
+            size = after
+        if pending and pending != pixel_format:
+            steps.append(('format', pending, size))
+        return [f'{name}={options}' if options else name for name, options, _ in steps]
+
+    def __str__(self):
+        return ','.join(self.canonical())
+
+
+def _even(value):
+    """Nearest even size of at least 2, as yuv420p needs."""
+    return max(2, 2 * int(round(value / 2)))
+
+
+def framed_chain(input_width, input_height, output_width, output_height, crop):
+    """yuv420p frames of the input framed and scaled to the output size."""
+    chain = FilterChain(input_width, input_height).format('yuv420p')
+    return chain.fit(output_width, output_height, crop).scale(output_width, output_height)
+
+
+def motion_chain(input_width, input_height, output_width, output_height, crop, motion, zoompan):
+    """The input framed for the output, scaled to the largest zoom of ``motion``, then the ``zoompan`` filter."""
+    base_width, base_height = base_size(output_width, output_height, motion)
+    chain = FilterChain(input_width, input_height).format('yuv420p')
+    chain.fit(output_width, output_height, crop).scale(base_width, base_height)
+    return chain.filter(zoompan, output_width, output_height)
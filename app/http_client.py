@@ -0,0 +1,110 @@
+# app/http_client.py
+import os
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import Config
+
+_local = {'pid': None, 'session': None}
+_lock = threading.Lock()
+_origin_slots = {}
+
+# Errors raised while streaming a body that are worth a ranged retry
+RESUMABLE_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ReadTimeout
+)
+
+
+def get_session():
+    """Process-wide session with per-host keep-alive connection pools.
+
+    Created lazily and recreated after a fork, so prefork workers never share
+    sockets with their parent.
+    """
+    with _lock:
+        if _local['pid'] != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=Config.HTTP_POOL_HOSTS,
+                pool_maxsize=Config.HTTP_POOL_SIZE,
+                max_retries=Retry(connect=2, read=0, status=0, backoff_factor=0.2)
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _local['pid'] = os.getpid()
+            _local['session'] = session
+            _origin_slots.clear()
+        return _local['session']
+
+
+def _origin(url):
+    parsed = urlparse(url)
+    return f'{parsed.scheme}://{parsed.netloc}'
+
+
+@contextmanager
+def origin_slot(url):
+    """Limit concurrent requests to one origin to ``HTTP_MAX_PER_HOST``."""
+    origin = _origin(url)
+    with _lock:
+        slot = _origin_slots.setdefault(origin, threading.BoundedSemaphore(Config.HTTP_MAX_PER_HOST))
+    with slot:
+        yield
+
+
+@contextmanager
+def open_url(url, headers=None, timeout=None):
+    """Stream a GET over the pooled session, holding an origin slot until the body is consumed."""
+    with origin_slot(url):
+        response = get_session().get(url, headers=headers, stream=True, timeout=timeout or Config.HTTP_TIMEOUT)
+        try:
+            yield response
+        finally:
+            response.close()
+
+
+def iter_content(response, chunk_size=64 * 1024, max_resumes=None):
+    """Iterate a streamed body, resuming with a Range request if the connection drops.
+
+    Resuming needs the server to advertise ``Accept-Ranges: bytes`` and a
+    validator, sent as ``If-Range`` so a changed resource is never spliced
+    onto the bytes already received.
+    """
+    max_resumes = Config.HTTP_MAX_RESUMES if max_resumes is None else max_resumes
+    validator = response.headers.get('etag') or response.headers.get('last-modified')
+    resumable = 'bytes' in response.headers.get('accept-ranges', '') and validator is not None
+    received = 0
+    resumes = 0
+    current = response
+    while True:
+        try:
+            for chunk in current.iter_content(chunk_size=chunk_size):
+                received += len(chunk)
+                yield chunk
+            return
+        except RESUMABLE_ERRORS:
+            if not resumable or resumes >= max_resumes:
+                raise
+            resumes += 1
+            headers = dict(response.request.headers)
+            headers['Range'] = f'bytes={received}-'
+            headers['If-Range'] = validator
+            if current is not response:
+                current.close()
+            current = get_session().get(response.request.url, headers=headers, stream=True,
+                                        timeout=Config.HTTP_TIMEOUT)
+            if current.status_code != 206:
+                current.close()
+                raise
+
+
+def post(url, json=None, timeout=None):
+    with origin_slot(url):
+        return get_session().post(url, json=json, timeout=timeout or Config.HTTP_TIMEOUT)
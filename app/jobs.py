@@ -0,0 +1,98 @@
+# app/jobs.py
+import os
+import json
+import time
+import hashlib
+import logging
+import redis
+
+from .config import Config
+from .render_cache import render_params
+from .renditions import RENDITION_FIELDS
+from .status import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Claim a job key unless a live (not failed) job already holds it and the
+# request may reuse it; returns the holder. The key joins its record's index.
+CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if ARGV[3] == '1' and current and cjson.decode(current)['state'] ~= 'failed' then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return false
+"""
+
+
+def params_hash(data):
+    """Hash of the input URL (or timeline) and every render parameter, so only identical requests share a job."""
+    request = {'input_url': data.get('input_url'), 'params': render_params(data)}
+    if 'timeline' in data:
+        request['timeline'] = data['timeline']
+    if data.get('output_mode', 'mp4') != 'mp4':
+        request['output_mode'] = data['output_mode']
+    if data.get('renditions'):
+        request['renditions'] = [{field: rendition.get(field) for field in RENDITION_FIELDS}
+                                 for rendition in data['renditions']]
+    payload = json.dumps(request, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def job_key(api_key, record_id, digest):
+    return f'job:{api_key}:{record_id}:{digest}'
+
+
+def job_index_key(api_key, record_id):
+    return f'jobs:{api_key}:{record_id}'
+
+
+def register(data, filename):
+    """Register a submission in the job registry.
+
+    Returns ``(job, created)``. When an identical request for the same
+    ``record_id`` is queued, running or already completed, ``created`` is
+    False and ``job`` is that job, including the filename it was given.
+    A failed job is replaced so the request can be retried, and so is any
+    job when ``cache`` is false, since the content behind the same URL may
+    have changed and must be rendered again. If Redis is
+    unreachable the submission goes ahead without deduplication.
+    """
+    digest = params_hash(data)
+    key = job_key(data['api_key'], data['record_id'], digest)
+    job = {
+        'record_id': data['record_id'],
+        'params_hash': digest,
+        'filename': filename,
+        'state': 'queued',
+        'updated_at': time.time()
+    }
+    if data.get('renditions'):
+        job['renditions'] = [os.path.basename(rendition['output_file']) for rendition in data['renditions']]
+    try:
+        reuse = 1 if data.get('cache', True) else 0
+        current = get_redis().register_script(CLAIM_SCRIPT)(
+            keys=[key, job_index_key(data['api_key'], data['record_id'])],
+            args=[json.dumps(job), Config.JOB_TTL, reuse])
+    except redis.RedisError as e:
+        logger.warning(f'Could not register job for {data["record_id"]}: {e}')
+        return job, True
+    if current:
+        return json.loads(current), False
+    data['job_key'] = key
+    return job, True
+
+
+def find_jobs(api_key, record_id):
+    """Every registered job for a record, one per distinct set of parameters."""
+    client = get_redis()
+    index = job_index_key(api_key, record_id)
+    keys = sorted(client.smembers(index))
+    values = client.mget(keys) if keys else []
+    expired = [key for key, value in zip(keys, values) if not value]
+    if expired:
+        client.srem(index, *expired)
+    jobs = [json.loads(value) for value in values if value]
+    return sorted(jobs, key=lambda job: job['updated_at'], reverse=True)
@@ -0,0 +1,128 @@
+# app/kenburns.py
+"""Keyframed pan/zoom ("Ken Burns") motion rendered with a single-frame zoompan.
+
+Running zoompan on a looped input decodes, converts and crops the full
+resolution source for every output frame. Instead the source is decoded and
+scaled once to the output size times the largest zoom, and zoompan emits
+every frame of the clip from that one prescaled picture (``d=frames``).
+"""
+import math
+
+# zoompan clamps zoom to this range
+MIN_ZOOM = 1.0
+MAX_ZOOM = 10.0
+# Largest prescaled picture (8K); beyond it zoompan enlarges the view instead of the picture holding more pixels
+MAX_BASE_PIXELS = 7680 * 4320
+
+# Easing curves over progress ``p`` in [0, 1], as ffmpeg expressions
+EASINGS = {
+    'linear': '{p}',
+    'ease-in': '({p})*({p})',
+    'ease-out': '({p})*(2-({p}))',
+    'ease-in-out': '(1-cos(PI*({p})))/2'
+}
+
+
+def motion_for(data):
+    """Motion for a request, or None for a still clip.
+
+    An explicit ``motion`` object wins. Otherwise a non-zero legacy ``zoom``
+    level (-100..100) becomes a linear centred zoom from 1x to ``1 + |zoom|/100``,
+    reversed for negative levels, matching the 2x cap of the old filter.
+    """
+    motion = data.get('motion')
+    if motion:
+        return {
+            'keyframes': _keyframes(motion),
+            'easing': motion.get('easing', 'linear')
+        }
+    zoom = float(data.get('zoom') or 0)
+    if zoom == 0:
+        return None
+    zooms = [MIN_ZOOM, MIN_ZOOM + abs(zoom) / 100]
+    if zoom < 0:
+        zooms.reverse()
+    return {
+        'keyframes': [
+            {'at': 0.0, 'zoom': zooms[0], 'x': 0.5, 'y': 0.5},
+            {'at': 1.0, 'zoom': zooms[1], 'x': 0.5, 'y': 0.5}
+        ],
+        'easing': 'linear'
+    }
+
+
+def _keyframes(motion):
+    """Keyframes sorted by time with defaults filled in and the clip's ends covered."""
+    focus = motion.get('focus') or {}
+    raw = motion['keyframes']
+    keyframes = []
+    for index, keyframe in enumerate(raw):
+        keyframes.append({
+            # Keyframes without a time are spread evenly over the clip
+            'at': float(keyframe.get('at', index / (len(raw) - 1) if len(raw) > 1 else 0)),
+            'zoom': float(keyframe['zoom']),
+            'x': float(keyframe.get('x', focus.get('x', 0.5))),
+            'y': float(keyframe.get('y', focus.get('y', 0.5)))
+        })
+    keyframes.sort(key=lambda keyframe: keyframe['at'])
+    if keyframes[0]['at'] > 0:
+        keyframes.insert(0, dict(keyframes[0], at=0.0))
+    if keyframes[-1]['at'] < 1:
+        keyframes.append(dict(keyframes[-1], at=1.0))
+    return keyframes
+
+
+def base_size(width, height, motion):
+    """Size to prescale the source to: the output times the largest zoom, rounded up to even.
+
+    The zoom is capped so the picture stays within ``MAX_BASE_PIXELS``: at
+    ``MAX_ZOOM`` a 1080p output would otherwise need a 19200x10800 frame.
+    zoompan works in fractions of the picture, so the motion is the same,
+    only deep zooms are less sharp.
+    """
+    zoom = max(keyframe['zoom'] for keyframe in motion['keyframes'])
+    zoom = max(1.0, min(zoom, math.sqrt(MAX_BASE_PIXELS / (width * height))))
+    return 2 * math.ceil(width * zoom / 2), 2 * math.ceil(height * zoom / 2)
+
+
+def _track(keyframes, key, frames, easing, frame_var):
+    """Piecewise expression for one keyframed value over output frames ``0..frames-1``."""
+    points = [(round(keyframe['at'] * (frames - 1)), keyframe[key]) for keyframe in keyframes]
+    expr = f'{points[-1][1]:g}'
+    if len({value for _, value in points}) == 1:
+        return expr
+    for (f0, v0), (f1, v1) in reversed(list(zip(points, points[1:]))):
+        if f1 <= f0:
+            continue
+        if v0 == v1:
+            segment = f'{v0:g}'
+        else:
+            progress = EASINGS[easing].format(p=f'({frame_var}-{f0})/{f1 - f0}')
+            segment = f'{v0:g}+({v1 - v0:g})*{progress}'
+        expr = f'if(lt({frame_var},{f1}),{segment},{expr})'
+    return expr
+
+
+def zoompan_filter(motion, frames, framerate, width, height, frame_var='on', duration_frames=None, first_frame=0):
+    """zoompan producing ``frames`` frames of ``width``x``height`` from a single input picture.
+
+    The focal point (``x``/``y``, as a fraction of the picture) is kept at the
+    centre of the view and clamped so the view never leaves the picture.
+    ``first_frame`` and ``duration_frames`` render only part of the clip, for
+    segmented encoding; ``frame_var`` lets the benchmark build the naive
+    one-output-per-input-frame variant from the same keyframes.
+    """
+    if first_frame:
+        frame_var = f'({frame_var}+{first_frame})'
+    keyframes = motion['keyframes']
+    easing = motion['easing']
+    zoom = _track(keyframes, 'zoom', frames, easing, frame_var)
+    focus_x = _track(keyframes, 'x', frames, easing, frame_var)
+    focus_y = _track(keyframes, 'y', frames, easing, frame_var)
+    return (
+        f"zoompan=z='{zoom}'"
+        f":x='clip(({focus_x})*iw-iw/zoom/2,0,iw-iw/zoom)'"
+        f":y='clip(({focus_y})*ih-ih/zoom/2,0,ih-ih/zoom)'"
+        f":d={frames if duration_frames is None else duration_frames}"
+        f":s={width}x{height}:fps={framerate}"
+    )
@@ -0,0 +1,133 @@
+# app/metrics.py
+import os
+import time
+import hashlib
+from contextlib import contextmanager
+
+import redis
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .config import Config
+from .celery_config import broker_transport_options
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    'json2video_stage_seconds',
+    'Time spent in each pipeline stage',
+    ['stage', 'tenant', 'resolution'],
+    buckets=STAGE_BUCKETS
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'json2video_queue_wait_seconds',
+    'Time between a task being published and a worker starting it',
+    ['task', 'tenant'],
+    buckets=STAGE_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    'json2video_cache_requests_total',
+    'Cache lookups by cache and result',
+    ['cache', 'result']
+)
+FFMPEG_EXITS = Counter(
+    'json2video_ffmpeg_exit_total',
+    'ffmpeg runs by exit code',
+    ['code']
+)
+
+def tenant_label(api_key):
+    """Stable label for a tenant that does not expose its API key: a truncated sha256 of the key."""
+    if not api_key:
+        return 'unknown'
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+def labels_for(data):
+    """Tenant and output resolution labels for a pipeline payload."""
+    return {
+        'tenant': tenant_label(data.get('api_key')),
+        'resolution': f"{data.get('output_width')}x{data.get('output_height')}"
+    }
+
+def label_fields(data):
+    """Just the fields ``labels_for`` reads, to carry with work that leaves the pipeline payload behind."""
+    return {field: data.get(field) for field in ('api_key', 'output_width', 'output_height') if data.get(field)}
+
+@contextmanager
+def time_stage(stage, data):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage, **labels_for(data)).observe(time.perf_counter() - start)
+
+def observe_queue_wait(task_name, published_at, data):
+    if published_at is None:
+        return
+    wait = max(0.0, time.time() - float(published_at))
+    QUEUE_WAIT_SECONDS.labels(task=task_name, tenant=labels_for(data)['tenant']).observe(wait)
+
+
+def queue_depths(queues):
+    """Messages waiting in each Celery queue on the Redis broker.
+
+    The transport keeps a message with a non-zero priority in a list of its
+    own (``render:3``), so every queue's depth sums its base list and those.
+    Raises ``redis.RedisError`` or ``ValueError`` when the broker cannot be read.
+    """
+    sep = broker_transport_options['sep']
+    names = [[queue] + [f'{queue}{sep}{level}' for level in broker_transport_options['priority_steps'] if level]
+             for queue in queues]
+    client = redis.Redis.from_url(Config.CELERY_BROKER_URL, socket_timeout=1, socket_connect_timeout=1)
+    pipe = client.pipeline()
+    for name in (name for lists in names for name in lists):
+        pipe.llen(name)
+    lengths = iter(pipe.execute())
+    return {queue: sum(next(lengths) for _ in lists) for queue, lists in zip(queues, names)}
+
+
+class QueueDepthCollector:
+    """Reads the depth of every Celery queue from the Redis broker at scrape time."""
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    def collect(self):
+        gauge = GaugeMetricFamily('json2video_queue_depth', 'Messages waiting in each Celery queue', labels=['queue'])
+        try:
+            for queue, depth in queue_depths(self.queues).items():
+                gauge.add_metric([queue], depth)
+        except (redis.RedisError, ValueError):
+            pass
+        yield gauge
+
+
+class _ProcessCollector:
+    """Exposes this process's default registry through another registry."""
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def build_registry(queues=None):
+    """Registry to expose, merging per-process files when ``PROMETHEUS_MULTIPROC_DIR`` is set."""
+    registry = CollectorRegistry()
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_ProcessCollector())
+    if queues:
+        registry.register(QueueDepthCollector(queues))
+    return registry
+
+
+def pipeline_queues():
+    from .celery_config import task_default_queue, task_routes
+    # Large renders are sent to render_large per job rather than by route
+    return sorted({task_default_queue, 'render_large'} | {route['queue'] for route in task_routes.values()})
+
+
+def render_metrics(registry):
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,145 @@
+# app/prescale.py
+"""Still inputs decoded once and kept at the exact output size.
+
+A looped still otherwise decodes the source, converts it to yuv420p and
+crops or scales it again for every frame encoded, at the full input
+resolution. ``PrescaleCache.prepare`` does that work in a single ffmpeg run:
+it applies the EXIF orientation, frames the picture for the output and writes
+one raw yuv420p frame of exactly the output size. Frames are keyed by input
+content and framing, so every render of a still at a size it was already
+rendered at reuses them, and the render itself only loops and encodes.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+
+from .config import Config
+from .ffmpeg import run_ffmpeg
+from .filters import FilterChain
+from .metrics import CACHE_REQUESTS
+from .probe import read_header
+from .storage import file_sha256
+
+# ffmpeg filters that display an image with this EXIF orientation upright
+ORIENTATION_FILTERS = {
+    1: [],
+    2: ['hflip'],
+    3: ['hflip', 'vflip'],
+    4: ['vflip'],
+    5: ['transpose=cclock_flip'],
+    6: ['transpose=clock'],
+    7: ['transpose=clock_flip'],
+    8: ['transpose=cclock']
+}
+
+
+def oriented_size(width, height, orientation):
+    """Size of a picture once its orientation has been applied; 5-8 turn it on its side."""
+    return (height, width) if orientation >= 5 else (width, height)
+
+
+def prescale_filter(input_width, input_height, orientation, output_width, output_height, crop):
+    """Orientation, framing and the final scale, with the pixel format converted at output size."""
+    chain = FilterChain(input_width, input_height)
+    for orientation_filter in ORIENTATION_FILTERS[orientation]:
+        chain.filter(orientation_filter, *oriented_size(input_width, input_height, orientation))
+    chain.fit(output_width, output_height, crop).scale(output_width, output_height)
+    return str(chain.format('yuv420p'))
+
+
+def prescale_command(input_file, video_filter, frame_file):
+    """Decode one frame and write it as raw yuv420p; ffmpeg's own autorotation is off so it is applied once."""
+    return [
+        'ffmpeg',
+        '-y',
+        '-noautorotate',
+        '-i', input_file,
+        '-vf', video_filter,
+        '-frames:v', '1',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'yuv420p',
+        frame_file
+    ]
+
+
+class PrescaleCache:
+    """Raw output-size frames of still inputs under ``prescaled/<key[:2]>/<key>.yuv``.
+
+    The frame mtime is bumped on every hit and drives LRU eviction, like the
+    input cache; frames used within ``min_age`` are never evicted so a render
+    cannot lose the frame it is about to read.
+    """
+
+    def __init__(self, root=None, max_bytes=None, min_age=None):
+        self.root = os.path.join(root or Config.CACHE_DIR, 'prescaled')
+        self.max_bytes = Config.PRESCALE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.min_age = Config.CACHE_MIN_AGE if min_age is None else min_age
+
+    def _frame_path(self, key):
+        return os.path.join(self.root, key[:2], key + '.yuv')
+
+    def prepare(self, data):
+        """Path of the raw frame for a still render of ``data``, creating it on a miss."""
+        input_file = data['cached_input_file']
+        output_width, output_height = int(data['output_width']), int(data['output_height'])
+        crop = data['crop']
+        payload = json.dumps({
+            'input': data.get('input_sha256') or file_sha256(input_file),
+            'output_width': output_width,
+            'output_height': output_height,
+            'crop': crop
+        }, sort_keys=True)
+        path = self._frame_path(hashlib.sha256(payload.encode('utf-8')).hexdigest())
+        try:
+            os.utime(path)
+            CACHE_REQUESTS.labels(cache='prescale', result='hit').inc()
+            return path
+        except FileNotFoundError:
+            CACHE_REQUESTS.labels(cache='prescale', result='miss').inc()
+
+        orientation = read_header(input_file).orientation
+        video_filter = prescale_filter(data['input_width'], data['input_height'], orientation, output_width,
+                                       output_height, crop)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}'
+        try:
+            run_ffmpeg(prescale_command(input_file, video_filter, tmp_path))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used frames until the cache fits ``max_bytes``."""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith('.yuv'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        now = time.time()
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < self.min_age:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+prescale_cache = PrescaleCache()
@@ -0,0 +1,441 @@
+# app/probe.py
+"""Image metadata read from the first bytes of a file, without ffprobe.
+
+``HeaderParser`` is fed a body chunk by chunk, while it is downloaded or
+read back from the input cache, and picks the width, height, EXIF
+orientation, colour space and whether the image is animated out of the JPEG,
+PNG, GIF, WebP or AVIF header. ``probe_image`` only runs ffprobe for
+containers the parser does not recognise.
+"""
+from .utils import probe_dimensions
+
+READ_SIZE = 64 * 1024
+# Give up if the header has not turned up this far into the file
+MAX_HEADER_BYTES = 512 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers; C4, C8 and CC share the range but are not frames
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+# Start of scan and end of image: no frame header can follow
+JPEG_END_MARKERS = {0xDA, 0xD9}
+JPEG_APP1 = 0xE1
+JPEG_APP14 = 0xEE
+JPEG_COLORSPACES = {1: 'gray', 3: 'yuv', 4: 'cmyk'}
+PNG_COLORSPACES = {0: 'gray', 2: 'rgb', 3: 'palette', 4: 'gray', 6: 'rgb'}
+# EXIF orientation for an AVIF irot angle, in quarter turns anticlockwise
+IROT_ORIENTATIONS = (1, 8, 3, 6)
+AVIF_BRANDS = {b'avif', b'avis'}
+
+
+def exif_orientation(tiff):
+    """Orientation tag (1-8) of an EXIF TIFF block; 1 when it is absent or unreadable."""
+    order = {b'II': 'little', b'MM': 'big'}.get(bytes(tiff[:2]))
+    if order is None or len(tiff) < 8:
+        return 1
+    ifd = int.from_bytes(tiff[4:8], order)
+    if ifd + 2 > len(tiff):
+        return 1
+    for index in range(int.from_bytes(tiff[ifd:ifd + 2], order)):
+        entry = ifd + 2 + 12 * index
+        if entry + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+            value = int.from_bytes(tiff[entry + 8:entry + 10], order)
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+
+def iter_boxes(data):
+    """``(type, body)`` of each ISOBMFF box in ``data``, stopping at the first malformed one."""
+    position = 0
+    while position + 8 <= len(data):
+        size = int.from_bytes(data[position:position + 4], 'big')
+        header = 8
+        if size == 1:
+            size = int.from_bytes(data[position + 8:position + 16], 'big')
+            header = 16
+        elif size == 0:
+            size = len(data) - position
+        if size < header or position + size > len(data):
+            return
+        yield bytes(data[position + 4:position + 8]), data[position + header:position + size]
+        position += size
+
+
+def item_properties(ipma):
+    """Property indexes (1-based) of every item in an ``ipma`` box."""
+    version, flags = ipma[0], int.from_bytes(ipma[1:4], 'big')
+    id_size = 2 if version < 1 else 4
+    index_size = 2 if flags & 1 else 1
+    index_mask = 0x7FFF if flags & 1 else 0x7F
+    position = 8
+    items = {}
+    for _ in range(int.from_bytes(ipma[4:8], 'big')):
+        if position + id_size + 1 > len(ipma):
+            break
+        item = int.from_bytes(ipma[position:position + id_size], 'big')
+        count = ipma[position + id_size]
+        position += id_size + 1
+        indexes = []
+        for _ in range(count):
+            if position + index_size > len(ipma):
+                break
+            indexes.append(int.from_bytes(ipma[position:position + index_size], 'big') & index_mask)
+            position += index_size
+        items[item] = indexes
+    return items
+
+
+class HeaderParser:
+    """Incremental header reader; ``done`` is set once it has an answer or gave up."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # Bytes still to be dropped as they arrive, for segments nothing is read from
+        self.skip = 0
+        self.position = 0
+        self.format = None
+        self.width = None
+        self.height = None
+        self.orientation = 1
+        self.colorspace = None
+        self.animated = False
+        self.done = False
+        # Format-specific progress: JPEG Adobe transform, GIF frames and sub-blocks, AVIF brand check
+        self.adobe_transform = None
+        self.frames = 0
+        self.looping = False
+        self.in_sub_blocks = False
+        self.brand_checked = False
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        if self.skip:
+            skipped = min(self.skip, len(chunk))
+            self.skip -= skipped
+            self.position += skipped
+            chunk = chunk[skipped:]
+        self.buffer += chunk
+        try:
+            if self.format is None:
+                self._detect()
+            if self.format is not None and not self.done:
+                getattr(self, f'_parse_{self.format}')()
+        except (IndexError, ValueError):
+            # A corrupt header is left to ffprobe
+            self._reject()
+        if not self.done and self.position + len(self.buffer) > MAX_HEADER_BYTES:
+            # Out of budget before a second frame turned up: a GIF that loops is taken to be animated
+            self.animated = self.animated or self.looping
+            self.close()
+
+    def close(self):
+        """End of input: keep whatever was read so far."""
+        if not self.done:
+            self.done = True
+            self.buffer = bytearray()
+
+    @property
+    def dimensions(self):
+        """``(width, height)``, or None when the header did not give them."""
+        if self.width and self.height:
+            return self.width, self.height
+        return None
+
+    def info(self):
+        """Everything read from the header, as stored next to a cached input."""
+        dimensions = self.dimensions or (None, None)
+        return {
+            'format': self.format if self.dimensions else None,
+            'width': dimensions[0],
+            'height': dimensions[1],
+            'orientation': self.orientation,
+            'colorspace': self.colorspace,
+            'animated': self.animated
+        }
+
+    def _reject(self):
+        self.width = self.height = None
+        self.close()
+
+    def _consume(self, size):
+        """Drop ``size`` bytes, including any that have not arrived yet."""
+        available = min(size, len(self.buffer))
+        del self.buffer[:available]
+        self.position += available
+        self.skip = size - available
+
+    def _detect(self):
+        head = bytes(self.buffer[:12])
+        if head.startswith(b'\xff\xd8\xff'):
+            self.format = 'jpeg'
+            self._consume(2)
+        elif head.startswith(PNG_SIGNATURE):
+            self.format = 'png'
+            self._consume(len(PNG_SIGNATURE))
+        elif head[:6] in (b'GIF87a', b'GIF89a'):
+            self.format = 'gif'
+        elif len(head) == 12 and head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            self.format = 'webp'
+            self._consume(12)
+        elif head[4:8] == b'ftyp':
+            # ISOBMFF; the brands decide whether it is an AVIF or a video for ffprobe
+            self.format = 'avif'
+        elif len(head) == 12:
+            self._reject()
+
+    def _parse_jpeg(self):
+        buffer = self.buffer
+        while not self.done:
+            if len(buffer) < 2:
+                return
+            if buffer[0] != 0xFF:
+                return self._reject()
+            marker = buffer[1]
+            if marker == 0xFF:
+                # Fill byte before the marker
+                self._consume(1)
+                continue
+            if marker in JPEG_STANDALONE_MARKERS:
+                self._consume(2)
+                continue
+            if marker in JPEG_END_MARKERS:
+                return self._reject()
+            if len(buffer) < 4:
+                return
+            length = 2 + int.from_bytes(buffer[2:4], 'big')
+            if marker in JPEG_SOF_MARKERS:
+                if len(buffer) < 10:
+                    return
+                self.height = int.from_bytes(buffer[5:7], 'big')
+                self.width = int.from_bytes(buffer[7:9], 'big')
+                self.colorspace = JPEG_COLORSPACES.get(buffer[9])
+                if self.adobe_transform == 0 and buffer[9] == 3:
+                    self.colorspace = 'rgb'
+                elif self.adobe_transform == 2 and buffer[9] == 4:
+                    self.colorspace = 'ycck'
+                return self.close()
+            if marker in (JPEG_APP1, JPEG_APP14):
+                # Read whole; a segment is at most 64 KB
+                if len(buffer) < length:
+                    return
+                segment = bytes(buffer[4:length])
+                if marker == JPEG_APP1 and segment.startswith(b'Exif\0\0'):
+                    self.orientation = exif_orientation(segment[6:])
+                elif marker == JPEG_APP14 and segment.startswith(b'Adobe') and len(segment) >= 12:
+                    self.adobe_transform = segment[11]
+            # Other segments, such as EXIF thumbnails in APP2+, are dropped as they stream past
+            self._consume(length)
+
+    def _parse_png(self):
+        buffer = self.buffer
+        while not self.done:
+            if len(buffer) < 8:
+                return
+            length = int.from_bytes(buffer[0:4], 'big')
+            kind = bytes(buffer[4:8])
+            if self.width is None and kind != b'IHDR':
+                return self._reject()
+            if kind in (b'IDAT', b'IEND'):
+                return self.close()
+            if kind in (b'IHDR', b'acTL', b'eXIf'):
+                if len(buffer) < 8 + length:
+                    return
+                data = bytes(buffer[8:8 + length])
+                if kind == b'IHDR':
+                    if length < 13:
+                        return self._reject()
+                    self.width = int.from_bytes(data[0:4], 'big')
+                    self.height = int.from_bytes(data[4:8], 'big')
+                    self.colorspace = PNG_COLORSPACES.get(data[9])
+                elif kind == b'acTL':
+                    # APNG: more than one frame before the image data
+                    self.animated = int.from_bytes(data[0:4], 'big') > 1
+                else:
+                    self.orientation = exif_orientation(data)
+            # Length, type and CRC around the data
+            self._consume(length + 12)
+
+    def _parse_gif(self):
+        buffer = self.buffer
+        if self.width is None:
+            if len(buffer) < 13:
+                return
+            self.width = int.from_bytes(buffer[6:8], 'little')
+            self.height = int.from_bytes(buffer[8:10], 'little')
+            self.colorspace = 'palette'
+            flags = buffer[10]
+            self._consume(13 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0))
+        while not self.done:
+            if not buffer:
+                return
+            if self.in_sub_blocks:
+                # Extension and image data come as length-prefixed blocks ending with an empty one
+                if buffer[0] == 0:
+                    self.in_sub_blocks = False
+                self._consume(buffer[0] + 1)
+                continue
+            block = buffer[0]
+            if block == 0x21:
+                if len(buffer) < 14:
+                    return
+                if buffer[1] == 0xFF and bytes(buffer[3:14]) == b'NETSCAPE2.0':
+                    # Encoders add the looping extension to single frames too, so it is only a hint
+                    self.looping = True
+                self._consume(2)
+                self.in_sub_blocks = True
+            elif block == 0x2C:
+                if len(buffer) < 10:
+                    return
+                self.frames += 1
+                if self.frames > 1:
+                    self.animated = True
+                    return self.close()
+                flags = buffer[9]
+                # Descriptor, local colour table and the LZW code size before the data blocks
+                self._consume(10 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0) + 1)
+                self.in_sub_blocks = True
+            else:
+                # Trailer, or data past a corrupt block: the logical screen is still valid
+                return self.close()
+
+    def _parse_webp(self):
+        buffer = self.buffer
+        while not self.done:
+            if len(buffer) < 8:
+                return
+            kind = bytes(buffer[0:4])
+            size = int.from_bytes(buffer[4:8], 'little')
+            if kind == b'VP8X':
+                if len(buffer) < 18:
+                    return
+                # Extended format: flags, then 24-bit canvas width and height minus one
+                self.animated = bool(buffer[8] & 0x02)
+                self.width = int.from_bytes(buffer[12:15], 'little') + 1
+                self.height = int.from_bytes(buffer[15:18], 'little') + 1
+            elif kind == b'VP8 ':
+                if len(buffer) < 18:
+                    return
+                if bytes(buffer[11:14]) != b'\x9d\x01\x2a':
+                    return self._reject()
+                if self.width is None:
+                    # Lossy: 14-bit sizes after the frame tag and start code
+                    self.width = int.from_bytes(buffer[14:16], 'little') & 0x3FFF
+                    self.height = int.from_bytes(buffer[16:18], 'little') & 0x3FFF
+                self.colorspace = 'yuv'
+                return self.close()
+            elif kind == b'VP8L':
+                if len(buffer) < 13:
+                    return
+                if buffer[8] != 0x2F:
+                    return self._reject()
+                if self.width is None:
+                    # Lossless: 14-bit width and height minus one packed after the signature byte
+                    bits = int.from_bytes(buffer[9:13], 'little')
+                    self.width = (bits & 0x3FFF) + 1
+                    self.height = ((bits >> 14) & 0x3FFF) + 1
+                self.colorspace = 'rgb'
+                return self.close()
+            elif kind == b'ANMF':
+                # Animation frames follow; the canvas came from VP8X
+                return self.close()
+            elif kind == b'EXIF':
+                if len(buffer) < 8 + size:
+                    return
+                tiff = bytes(buffer[8:8 + size])
+                self.orientation = exif_orientation(tiff[6:] if tiff.startswith(b'Exif\0\0') else tiff)
+            elif self.width is None and kind not in (b'ICCP', b'ANIM', b'ALPH'):
+                return self._reject()
+            # Chunks are padded to an even size
+            self._consume(8 + size + (size & 1))
+
+    def _parse_avif(self):
+        buffer = self.buffer
+        while not self.done:
+            if len(buffer) < 16:
+                return
+            size = int.from_bytes(buffer[0:4], 'big')
+            kind = bytes(buffer[4:8])
+            header = 8
+            if size == 1:
+                size = int.from_bytes(buffer[8:16], 'big')
+                header = 16
+            if size < header:
+                return self._reject()
+            if kind == b'ftyp':
+                if len(buffer) < size:
+                    return
+                brands = {bytes(buffer[i:i + 4]) for i in range(header, size, 4) if i != header + 4}
+                if not AVIF_BRANDS & brands:
+                    return self._reject()
+                # An image sequence rather than a still
+                self.animated = b'avis' in brands
+                self.brand_checked = True
+            elif not self.brand_checked:
+                return self._reject()
+            elif kind == b'meta':
+                if size > MAX_HEADER_BYTES:
+                    return self._reject()
+                if len(buffer) < size:
+                    return
+                # A full box: version and flags before the children
+                self._read_avif_meta(bytes(buffer[header + 4:size]))
+                if self.dimensions is None:
+                    return self._reject()
+                return self.close()
+            self._consume(size)
+
+    def _read_avif_meta(self, meta):
+        primary = None
+        properties = []
+        associations = {}
+        for kind, body in iter_boxes(meta):
+            if kind == b'pitm':
+                primary = int.from_bytes(body[4:6] if body[0] == 0 else body[4:8], 'big')
+            elif kind == b'iprp':
+                for child, child_body in iter_boxes(body):
+                    if child == b'ipco':
+                        properties = list(iter_boxes(child_body))
+                    elif child == b'ipma':
+                        associations.update(item_properties(child_body))
+        indexes = associations.get(primary) or range(1, len(properties) + 1)
+        for index in indexes:
+            if not 1 <= index <= len(properties):
+                continue
+            kind, body = properties[index - 1]
+            if kind == b'ispe' and len(body) >= 12 and self.width is None:
+                self.width = int.from_bytes(body[4:8], 'big')
+                self.height = int.from_bytes(body[8:12], 'big')
+            elif kind == b'irot' and body:
+                self.orientation = IROT_ORIENTATIONS[body[0] & 3]
+            elif kind == b'pixi' and len(body) >= 5 and body[4] == 1:
+                self.colorspace = 'gray'
+            elif kind == b'colr' and body[:4] == b'nclx' and len(body) >= 10 and self.colorspace is None:
+                # Identity matrix coefficients mean the planes are GBR
+                self.colorspace = 'rgb' if int.from_bytes(body[8:10], 'big') == 0 else 'yuv'
+        if self.colorspace is None:
+            self.colorspace = 'yuv'
+
+
+def read_header(path):
+    """A ``HeaderParser`` fed the start of the file at ``path``."""
+    parser = HeaderParser()
+    with open(path, 'rb') as f:
+        while not parser.done:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                parser.close()
+                break
+            parser.feed(chunk)
+    return parser
+
+
+def probe_image(path):
+    """Header metadata of a file; ffprobe is only run for containers the parser cannot read."""
+    info = read_header(path).info()
+    if info['width'] is None:
+        info['width'], info['height'] = probe_dimensions(path)
+    return info
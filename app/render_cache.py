@@ -0,0 +1,157 @@
+import os
+import json
+import fcntl
+import shutil
+import uuid
+import hashlib
+
+from .config import Config
+from .filters import framed_chain
+from .utils import as_bool
+
+# Linux FICLONE ioctl, used to reflink when hard links are not possible
+FICLONE = 0x40049409
+
+RENDER_PARAMS = ('framerate', 'duration', 'crop', 'zoom', 'motion', 'output_width', 'output_height', 'profile')
+TIMELINE_CLIP_PARAMS = ('type', 'duration', 'start', 'crop', 'zoom', 'motion', 'transition')
+TIMELINE_AUDIO_PARAMS = ('volume', 'fade_out')
+
+
+def _normalize(name, value):
+    if name == 'crop':
+        return as_bool(value)
+    if name in ('output_width', 'output_height'):
+        return int(value)
+    if name == 'profile':
+        return value or Config.DEFAULT_ENCODER_PROFILE
+    if name == 'motion':
+        # Serialized with sort_keys by the caller
+        return value or None
+    # 30, 30.0 and "30" all render the same clip
+    return round(float(value or 0), 6)
+
+
+def render_params(data):
+    """Normalized values of every request parameter that affects the rendered output."""
+    return {name: _normalize(name, data.get(name)) for name in RENDER_PARAMS}
+
+
+def render_key(input_sha256, data):
+    """Canonical hash of the input content plus every parameter that affects the output.
+
+    With the input size known, ``crop`` is replaced by the canonical framing
+    graph, so requests that frame the input the same way share a render, e.g.
+    crop and pad when the sizes already match.
+    """
+    params = render_params(data)
+    graph = None
+    if data.get('input_width') and data.get('input_height'):
+        graph = str(framed_chain(data['input_width'], data['input_height'], params['output_width'],
+                                 params['output_height'], params.pop('crop')))
+    payload = json.dumps({'input': input_sha256, 'params': params, 'graph': graph}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def timeline_key(data):
+    """Canonical hash of a timeline: every clip's content and settings, the audio track and output parameters."""
+    timeline = data['timeline']
+    clips = [
+        dict({field: clip.get(field) for field in TIMELINE_CLIP_PARAMS}, input=clip['input_sha256'])
+        for clip in timeline['clips']
+    ]
+    audio = timeline.get('audio')
+    if audio:
+        audio = dict({field: audio.get(field) for field in TIMELINE_AUDIO_PARAMS}, input=audio['input_sha256'])
+    params = {name: _normalize(name, data.get(name)) for name in ('framerate', 'output_width', 'output_height', 'profile')}
+    payload = json.dumps({'clips': clips, 'audio': audio, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def link_file(src, dst):
+    """Hard-link ``src`` to ``dst``, falling back to a reflink and then a copy."""
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+
+
+class RenderCache:
+    """Finished renders keyed by ``render_key``.
+
+    Outputs in ``MOVIES_DIR`` are hard links to the cached file whenever the
+    filesystem allows it, so the link count doubles as a reference count:
+    an entry with ``st_nlink == 1`` is only held by the cache. Eviction only
+    drops unreferenced entries, least recently used first, until those fit
+    in ``max_bytes``; referenced entries cost no extra disk space.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = os.path.join(root or Config.CACHE_DIR, 'renders')
+        self.max_bytes = Config.RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, key[:2], key + '.mp4')
+
+    def lookup(self, key, output_file):
+        """Materialize a cached render at ``output_file``; return False on a miss."""
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            return False
+        try:
+            os.utime(path)
+            os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+            link_file(path, output_file)
+        except FileNotFoundError:
+            # Evicted between the existence check and the link
+            return False
+        return True
+
+    def store(self, key, output_file):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}'
+        link_file(output_file, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def references(self, key):
+        """Number of outputs still sharing the cached file."""
+        try:
+            return os.stat(self._entry_path(key)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def evict(self):
+        unreferenced = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_nlink > 1:
+                    continue
+                unreferenced.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        for mtime, size, path in sorted(unreferenced):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+render_cache = RenderCache()
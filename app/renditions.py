@@ -0,0 +1,63 @@
+# app/renditions.py
+"""Render several output sizes of one input from a single decode.
+
+The source is decoded once, then ``split`` feeds one branch per rendition
+with its own framing, scale, pixel format conversion at that rendition's
+size (and zoompan for motion clips) and encoder settings, all written by the
+same ffmpeg process.
+"""
+import math
+
+from .config import Config
+from .ffmpeg import split_command, encoder_args, segment_path, loop_copy_command
+from .filters import framed_chain, motion_chain
+from .kenburns import zoompan_filter
+
+RENDITION_FIELDS = ('output_width', 'output_height', 'crop', 'profile')
+
+
+def rendition_outputs(data):
+    """The primary output followed by every rendition; renditions inherit ``crop`` and ``profile``."""
+    defaults = {'crop': data['crop'], 'profile': data.get('profile')}
+    primary = dict(defaults, output_width=data['output_width'], output_height=data['output_height'],
+                   output_file=data['output_file'])
+    return [primary] + [dict(defaults, **rendition) for rendition in data.get('renditions', [])]
+
+
+def rendition_commands(data, outputs, motion=None):
+    """Commands rendering ``outputs`` in one decode; returns (commands, intermediate files to remove)."""
+    framerate = data['framerate']
+    duration = data['duration']
+    input_file = data['cached_input_file']
+
+    if motion:
+        frames = max(1, int(round(duration * framerate)))
+        branches = []
+        for output in outputs:
+            width, height = output['output_width'], output['output_height']
+            chain = motion_chain(data['input_width'], data['input_height'], width, height, output['crop'], motion,
+                                 zoompan_filter(motion, frames, framerate, width, height))
+            branches.append((str(chain), ['-frames:v', str(frames), '-pix_fmt', 'yuv420p', '-r', str(framerate)]
+                             + encoder_args(output['profile'], still=False) + [output['output_file']]))
+        return [split_command(['-i', input_file], '', branches)], []
+
+    # Still clips encode one GOP per rendition and stream-copy it, as for a single output
+    looped = duration > Config.STILL_SEGMENT_SECONDS
+    seconds = Config.STILL_SEGMENT_SECONDS if looped else duration
+    branches = []
+    loops = []
+    for output in outputs:
+        target = segment_path(output['output_file']) if looped else output['output_file']
+        output_args = ['-t', str(seconds), '-pix_fmt', 'yuv420p', '-r', str(framerate)]
+        if looped:
+            output_args += ['-g', str(max(1, int(math.ceil(seconds * framerate))))]
+            loops.append(loop_copy_command(target, duration, output['output_file']))
+        chain = framed_chain(data['input_width'], data['input_height'], output['output_width'],
+                             output['output_height'], output['crop'])
+        branches.append((str(chain), output_args + encoder_args(output['profile']) + [target]))
+
+    command = split_command(['-loop', '1', '-i', input_file], '', branches)
+    if looped:
+        command.insert(1, '-y')
+        return [command] + loops, [segment_path(output['output_file']) for output in outputs]
+    return [command], []
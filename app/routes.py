@@ -1,12 +1,17 @@
 import os
-import json
-import subprocess
-import requests
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.utils import secure_filename
-from .validations import validate_json, validate_api_key, is_valid_record_id, is_valid_url, is_valid_framerate, is_valid_duration, is_valid_cache, is_valid_zoom_level, is_valid_crop, is_valid_dimension
+import uuid
+import redis
+from flask import Blueprint, Response, request, jsonify, current_app
+from .validations import validate_json, validate_api_key, video_request_error, timeline_request_error, is_valid_record_id, is_valid_url, input_schema, batch_schema, batch_job_schema, timeline_schema
 from .utils import generate_random_filename
 from .config import Config
+from .metrics import build_registry, pipeline_queues, render_metrics
+from .status import set_status, get_status
+from .jobs import register as register_job, find_jobs
+from .timeline import timeline_duration
+from .streaming import is_streaming, playlist_path
+from .scheduling import admit
+from .cost_model import estimate as estimate_cost
 
 main_bp = Blueprint('main', __name__)
 
@@ -16,89 +21,62 @@ def validate():
     """Endpoint to validate the API key."""
     return jsonify({'message': 'API key is valid'}), 200
 
+@main_bp.route('/metrics', methods=['GET'])
+@validate_api_key(pass_api_key=False)
+def metrics():
+    """Prometheus metrics for this process plus the current queue depths; tenants are labelled by a key hash."""
+    body, content_type = render_metrics(build_registry(pipeline_queues()))
+    return Response(body, mimetype=content_type)
+
+@main_bp.route('/status/<record_id>', methods=['GET'])
+@validate_api_key(pass_api_key=True)
+def status(record_id, api_key):
+    """Latest pipeline state and ffmpeg progress for a record."""
+    if not is_valid_record_id(record_id):
+        return jsonify({'error': 'Invalid record ID'}), 400
+    try:
+        job_status = get_status(api_key, record_id)
+    except redis.RedisError as e:
+        current_app.logger.warning(f'Could not read status for {record_id}: {e}')
+        return jsonify({'error': 'Status temporarily unavailable'}), 503
+    if job_status is None:
+        return jsonify({'error': 'Unknown record ID'}), 404
+    return jsonify(job_status), 200
+
+@main_bp.route('/jobs/<record_id>', methods=['GET'])
+@validate_api_key(pass_api_key=True)
+def jobs(record_id, api_key):
+    """Registered jobs for a record, one per distinct set of render parameters."""
+    if not is_valid_record_id(record_id):
+        return jsonify({'error': 'Invalid record ID'}), 400
+    try:
+        record_jobs = find_jobs(api_key, record_id)
+    except redis.RedisError as e:
+        current_app.logger.warning(f'Could not read jobs for {record_id}: {e}')
+        return jsonify({'error': 'Jobs temporarily unavailable'}), 503
+    if not record_jobs:
+        return jsonify({'error': 'Unknown record ID'}), 404
+    return jsonify({'record_id': record_id, 'jobs': record_jobs}), 200
+
 @main_bp.route('/create-video', methods=['POST'])
 @validate_api_key(pass_api_key=True)
 def create_video(api_key):
-    from app.tasks import create_video_task  # Import here to avoid circular import
+    from app.tasks import create_video_pipeline, create_timeline_pipeline, report_failure_task  # Import here to avoid circular import
     data = request.json
+    # A timeline describes several clips instead of a single input_url
+    is_timeline = isinstance(data, dict) and 'timeline' in data
 
-    is_valid, error = validate_json(data)
+    is_valid, error = validate_json(data, schema=timeline_schema if is_timeline else input_schema)
     if not is_valid:
         return jsonify({'error': f'Invalid input data'}), 400
 
-    record_id = data['record_id']
-    input_url = data['input_url']
-    framerate = data['framerate']
-    duration = data['duration']
-    cache = data['cache']
-    zoom = data['zoom']
-    crop = data['crop']
-    output_width = data['output_width']
-    output_height = data['output_height']
-    webhook_url = data.get('webhook_url')
-
-    if not is_valid_record_id(record_id):
-        return jsonify({'error': 'Invalid record ID'}), 400
-    if not is_valid_url(input_url):
-        return jsonify({'error': 'Invalid input URL'}), 400
-    if webhook_url and not is_valid_url(webhook_url):
-        return jsonify({'error': 'Invalid webhook URL'}), 400
-    if not is_valid_framerate(framerate):
-        return jsonify({'error': 'Invalid framerate'}), 400
-    if not is_valid_duration(duration):
-        return jsonify({'error': 'Invalid duration level'}), 400
-    if not is_valid_cache(cache):
-        return jsonify({'error': 'Invalid cache value'}), 400
-    if not is_valid_zoom_level(zoom):
-        return jsonify({'error': 'Invalid zoom level'}), 400
-    if not is_valid_crop(crop):
-        return jsonify({'error': 'Invalid crop value'}), 400
-    if not is_valid_dimension(output_width):
-        return jsonify({'error': 'Invalid output width'}), 400
-    if not is_valid_dimension(output_height):
-        return jsonify({'error': 'Invalid output height'}), 400
-
+    error = timeline_request_error(data) if is_timeline else video_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    if is_timeline:
+        data['duration'] = timeline_duration(data['timeline']['clips'])
 
-    try:
-        # Validate and sanitize URL again before making a request
-        if not is_valid_url(input_url):
-            return jsonify({'error': 'Invalid input URL'}), 400
-
-        response = requests.get(input_url, stream=True, timeout=10)
-        response.raise_for_status()
-
-        # Validate response content type and length
-        if 'content-length' in response.headers and int(response.headers['content-length']) > 10 * 1024 * 1024:
-            return jsonify({'error': 'File is too large'}), 400
-        if 'content-type' in response.headers and 'application/json' in response.headers['content-type']:
-            return jsonify({'error': 'Invalid file type'}), 400
-
-        # Process the response as required
-        cached_input_file = generate_random_filename()
-        with open(cached_input_file, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        ffprobe_command = [
-            'ffprobe',
-            '-v', 'error',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
-            '-of', 'json',
-            cached_input_file
-        ]
-        process = subprocess.Popen(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-
-        if process.returncode != 0:
-            current_app.logger.error(f'ffprobe error: {stderr.decode("utf-8")}')
-            raise Exception(f'ffprobe failed with error: {stderr.decode("utf-8")}')
-        
-        dimensions = json.loads(stdout.decode('utf-8'))
-        data['input_width'] = dimensions['streams'][0]['width']
-        data['input_height'] = dimensions['streams'][0]['height']
-    except requests.RequestException as e:
-        return jsonify({'error': f'Failed to download input file'}), 400
+    record_id = data['record_id']
 
     # Generate a random filename for the output file
     movies_folder = Config.MOVIES_DIR
@@ -106,18 +84,185 @@ def create_video(api_key):
     output_file = os.path.join(movies_folder, filename)
     
     data['request_host'] = request.host
-    data['cached_input_file'] = cached_input_file
+    data['api_key'] = api_key
     data['output_file'] = output_file
+    assign_renditions(data)
+
+    # Predict the render time (which also picks the worker pool) before anything is queued
+    estimate = estimate_cost(data)
+    if 'deadline' in data and estimate['eta_seconds'] > data['deadline']:
+        return jsonify(dict(estimate, error='Deadline cannot be met')), 422
 
-    create_video_task.apply_async(args=[data])
+    # An identical request for this record attaches to the job already registered
+    job, created = register_job(data, filename)
+    if not created:
+        response_payload = {
+            'record_id': record_id,
+            **filename_fields(job['filename'], job),
+            'message': duplicate_message(job),
+            'output_height': data['output_height'],
+            'output_width': data['output_width']
+        }
+        if data.get('renditions'):
+            response_payload['renditions'] = rendition_summaries(data, job.get('renditions'))
+        if is_streaming(data):
+            response_payload['playlist'] = playlist_url(data, job['filename'])
+        return jsonify(response_payload), 202
+
+    # Tenants over their backlog budget are asked to come back later
+    admitted, retry_after = admit(data)
+    if not admitted:
+        # A failed job can be registered again when the client retries
+        set_status(data, 'failed', error='Backlog over budget')
+        return over_budget_response(retry_after)
+
+    if is_streaming(data):
+        # Players can open the playlist before the encode finishes
+        data['playlist_url'] = playlist_url(data, filename)
+    set_status(data, 'queued', filename=filename)
+    pipeline = create_timeline_pipeline(data) if is_timeline else create_video_pipeline(data)
+    pipeline.apply_async(link_error=report_failure_task.s())
 
     response_payload = {
         'record_id': record_id, 
-        'filename': filename, 
+        **filename_fields(filename), 
         'message': 'Video processing started', 
-        'input_height': data['input_height'], 
-        'input_width': data['input_width'],
         'output_height': data['output_height'], 
         'output_width': data['output_width']
     }
-    return jsonify(response_payload), 200
+    response_payload.update(estimate)
+    if data.get('renditions'):
+        response_payload['renditions'] = rendition_summaries(data)
+    if is_streaming(data):
+        response_payload['playlist'] = data['playlist_url']
+    return jsonify(response_payload), 202
+
+@main_bp.route('/create-videos', methods=['POST'])
+@validate_api_key(pass_api_key=True)
+def create_videos(api_key):
+    """Validate and enqueue many jobs at once; each distinct input URL is fetched only once."""
+    from app.tasks import create_batch_pipeline  # Import here to avoid circular import
+    payload = request.json
+
+    is_valid, error = validate_json(payload, schema=batch_schema)
+    if not is_valid:
+        return jsonify({'error': f'Invalid input data'}), 400
+    if len(payload['jobs']) > Config.MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many jobs, the limit is {Config.MAX_BATCH_SIZE}'}), 400
+    batch_webhook_url = payload.get('webhook_url')
+    if batch_webhook_url and not is_valid_url(batch_webhook_url):
+        return jsonify({'error': 'Invalid webhook URL'}), 400
+
+    results = []
+    accepted = []
+    for index, data in enumerate(payload['jobs']):
+        is_valid, error = validate_json(data, schema=batch_job_schema)
+        error = 'Invalid input data' if not is_valid else video_request_error(data)
+        if error:
+            results.append({'index': index, 'record_id': data.get('record_id'), 'error': error})
+            continue
+
+        filename = generate_random_filename()
+        data['request_host'] = request.host
+        data['api_key'] = api_key
+        data['output_file'] = os.path.join(Config.MOVIES_DIR, filename)
+        assign_renditions(data)
+        estimate = estimate_cost(data)
+        if 'deadline' in data and estimate['eta_seconds'] > data['deadline']:
+            results.append(dict(estimate, index=index, record_id=data['record_id'], error='Deadline cannot be met'))
+            continue
+        job, created = register_job(data, filename)
+        if not created:
+            result = {
+                'index': index,
+                'record_id': data['record_id'],
+                **filename_fields(job['filename'], job),
+                'message': duplicate_message(job)
+            }
+            if data.get('renditions'):
+                result['renditions'] = rendition_summaries(data, job.get('renditions'))
+            if is_streaming(data):
+                result['playlist'] = playlist_url(data, job['filename'])
+            results.append(result)
+            continue
+        admitted, retry_after = admit(data)
+        if not admitted:
+            set_status(data, 'failed', error='Backlog over budget')
+            results.append({'index': index, 'record_id': data['record_id'], 'error': 'Backlog over budget',
+                            'retry_after': retry_after})
+            continue
+        accepted.append(data)
+        result = {
+            'index': index,
+            'record_id': data['record_id'],
+            **filename_fields(filename),
+            'message': 'Video processing started'
+        }
+        result.update(estimate)
+        if data.get('renditions'):
+            result['renditions'] = rendition_summaries(data)
+        if is_streaming(data):
+            data['playlist_url'] = result['playlist'] = playlist_url(data, filename)
+        results.append(result)
+
+    if not accepted:
+        if any('filename' in result for result in results):
+            # Every valid job was already registered
+            return jsonify({'batch_id': None, 'results': results}), 202
+        waits = [result['retry_after'] for result in results if 'retry_after' in result]
+        if waits:
+            return over_budget_response(min(waits), results)
+        return jsonify({'error': 'No valid jobs', 'results': results}), 400
+
+    batch = {
+        'batch_id': uuid.uuid4().hex,
+        'api_key': api_key,
+        'webhook_url': batch_webhook_url
+    }
+    for data in accepted:
+        set_status(data, 'queued', filename=os.path.basename(data['output_file']), batch_id=batch['batch_id'])
+    create_batch_pipeline(accepted, batch).apply_async()
+
+    return jsonify({'batch_id': batch['batch_id'], 'results': results}), 202
+
+def duplicate_message(job):
+    if job['state'] == 'completed':
+        return 'Video already created'
+    return 'Video processing already in progress'
+
+def assign_renditions(data):
+    """Give every requested rendition its own output file next to the primary one."""
+    for rendition in data.get('renditions', []):
+        rendition['output_file'] = os.path.join(Config.MOVIES_DIR, generate_random_filename())
+
+def filename_fields(filename, job=None):
+    """``filename`` for a response, flagged as provisional while content addressed storage may still rename it.
+
+    A content addressed output is moved to ``objects/<sha256>`` once rendered,
+    so until ``job`` has completed the final name (renditions included) is only
+    reported by ``GET /status/<record_id>`` and the webhook.
+    """
+    fields = {'filename': filename}
+    if Config.STORAGE_CONTENT_ADDRESSED:
+        fields['filename_final'] = bool(job) and job.get('state') == 'completed'
+    return fields
+
+def rendition_summaries(data, filenames=None):
+    """Filename and size of each rendition; ``filenames`` come from an existing job."""
+    if filenames is None:
+        filenames = [os.path.basename(rendition['output_file']) for rendition in data['renditions']]
+    return [
+        {'filename': filename, 'output_width': rendition['output_width'], 'output_height': rendition['output_height']}
+        for filename, rendition in zip(filenames, data['renditions'])
+    ]
+
+def playlist_url(data, filename):
+    """Public URL of the HLS/DASH playlist written alongside ``filename``."""
+    from app.tasks import output_url  # Import here to avoid circular import
+    return output_url(data['request_host'], playlist_path(os.path.join(Config.MOVIES_DIR, filename), data['output_mode']))
+
+def over_budget_response(retry_after, results=None):
+    payload = {'error': 'Too many videos in progress for this API key', 'retry_after': retry_after}
+    if results is not None:
+        payload['results'] = results
+    return jsonify(payload), 429, {'Retry-After': str(retry_after)}
@@ -0,0 +1,173 @@
+# app/scheduling.py
+"""Per-tenant admission control, fair-share priorities and render concurrency quotas.
+
+Every job is charged its estimated cost (duration x framerate x output
+pixels) against its API key's backlog budget while it is queued or
+rendering. A tenant over budget is turned away with a Retry-After, and the
+fuller its backlog the lower the Celery priority of its new renders, so a
+burst from one key cannot starve the others. Render workers additionally cap
+how many renders of one key run at the same time.
+"""
+import math
+import time
+import uuid
+import logging
+import redis
+
+from .config import Config
+from .status import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Celery priorities; the Redis transport serves lower numbers first
+PRIORITIES = {'high': 0, 'normal': 3, 'low': 6}
+# Steps a job is demoted by as its tenant's backlog approaches the budget
+MAX_DEMOTION = 3
+
+# Drop lapsed charges, then charge a job's cost unless the tenant already has a backlog and the job would
+# exceed the budget. Returns {admitted, backlog}. An idle tenant is always admitted so oversized jobs can still run.
+# Each charge is a "<charge_id>:<cost>" member scored by its deadline, so a charge leaked by a worker that died
+# lapses on its own instead of holding the tenant's budget for as long as the tenant keeps submitting.
+ADMIT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+local backlog = 0
+for _, charge in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    backlog = backlog + tonumber(string.match(charge, ':(%d+)$'))
+end
+local cost = tonumber(ARGV[1])
+if backlog > 0 and backlog + cost > tonumber(ARGV[2]) then
+    return {0, backlog}
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[5])
+return {1, backlog}
+"""
+
+
+def job_cost(data):
+    """Estimated render cost in output pixel-frames, renditions included."""
+    pixels = data['output_width'] * data['output_height']
+    pixels += sum(rendition['output_width'] * rendition['output_height'] for rendition in data.get('renditions', []))
+    return max(1, int(float(data['duration']) * float(data['framerate']) * pixels))
+
+
+def tenant_weight(api_key):
+    return Config.TENANT_WEIGHTS.get(api_key, 1.0)
+
+
+def tenant_budget(api_key):
+    return Config.TENANT_BACKLOG_BUDGET * tenant_weight(api_key)
+
+
+def tenant_slots(api_key):
+    return max(1, int(round(Config.TENANT_MAX_RENDERS * tenant_weight(api_key))))
+
+
+def _backlog_key(api_key):
+    return f'backlog:{api_key}'
+
+
+def _charge_member(charge_id, cost):
+    return f'{charge_id}:{cost}'
+
+
+def _slots_key(api_key):
+    return f'renders:{api_key}'
+
+
+def retry_after(api_key, backlog, cost):
+    """Seconds until the tenant's running renders should have drained enough backlog for ``cost``."""
+    excess = backlog + cost - tenant_budget(api_key)
+    return max(1, int(math.ceil(excess / (Config.RENDER_PIXEL_RATE * tenant_slots(api_key)))))
+
+
+def render_priority(data, backlog):
+    """Requested priority class, demoted as the tenant's backlog fills its budget."""
+    demotion = min(MAX_DEMOTION, int(MAX_DEMOTION * backlog / tenant_budget(data['api_key'])))
+    return min(9, PRIORITIES[data.get('priority', 'normal')] + demotion)
+
+
+def admit(data):
+    """Charge a job against its tenant's backlog budget.
+
+    Returns ``(admitted, retry_after)``. Admitted jobs get ``cost``,
+    ``charge_id`` and ``render_priority`` set on ``data``. A charge that is
+    never released lapses ``JOB_TTL`` after it was made. If Redis is
+    unreachable the job is admitted at its requested priority.
+    """
+    api_key = data['api_key']
+    cost = job_cost(data)
+    charge_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        admitted, backlog = get_redis().register_script(ADMIT_SCRIPT)(
+            keys=[_backlog_key(api_key)],
+            args=[cost, int(tenant_budget(api_key)), now + Config.JOB_TTL, now, _charge_member(charge_id, cost)])
+    except redis.RedisError as e:
+        logger.warning(f'Could not check backlog for {data["record_id"]}: {e}')
+        data['render_priority'] = PRIORITIES[data.get('priority', 'normal')]
+        return True, None
+    if not admitted:
+        return False, retry_after(api_key, int(backlog), cost)
+    data['cost'] = cost
+    data['charge_id'] = charge_id
+    data['render_priority'] = render_priority(data, int(backlog))
+    return True, None
+
+
+def release(data):
+    """Return a finished or failed job's cost to its tenant's budget; releasing it again does nothing."""
+    if not data.get('charge_id'):
+        return
+    try:
+        get_redis().zrem(_backlog_key(data['api_key']), _charge_member(data['charge_id'], data['cost']))
+    except redis.RedisError as e:
+        logger.warning(f'Could not release backlog for {data["record_id"]}: {e}')
+
+
+def render_options(data):
+    """apply_async options carrying a job's render priority and worker pool."""
+    options = {}
+    if data.get('render_priority') is not None:
+        options['priority'] = data['render_priority']
+    if data.get('render_queue'):
+        options['queue'] = data['render_queue']
+    return options
+
+
+def acquire_slot(data, slot_id):
+    """Take one of the tenant's concurrent render slots for ``slot_id``; False when they are all in use.
+
+    Each slot is a member of a sorted set scored by its deadline, so a slot
+    leaked by a worker that died mid-render lapses ``TENANT_SLOT_TTL`` after
+    it was taken, however often the tenant's other tasks poll for one.
+    """
+    if not data.get('api_key'):
+        return True
+    api_key = data['api_key']
+    key = _slots_key(api_key)
+    now = time.time()
+    try:
+        client = get_redis()
+        pipeline = client.pipeline()
+        pipeline.zremrangebyscore(key, '-inf', now)
+        pipeline.zadd(key, {slot_id: now + Config.TENANT_SLOT_TTL})
+        pipeline.zcard(key)
+        pipeline.expire(key, Config.TENANT_SLOT_TTL)
+        running = pipeline.execute()[2]
+        # Two tasks racing for the last slot can both back off, but a tenant never runs more than its quota
+        if running > tenant_slots(api_key):
+            client.zrem(key, slot_id)
+            return False
+        return True
+    except redis.RedisError as e:
+        logger.warning(f'Could not check render slots for {data["record_id"]}: {e}')
+        return True
+
+
+def release_slot(data, slot_id):
+    if not data.get('api_key'):
+        return
+    try:
+        get_redis().zrem(_slots_key(data['api_key']), slot_id)
+    except redis.RedisError as e:
+        logger.warning(f'Could not release render slot for {data["record_id"]}: {e}')
@@ -0,0 +1,53 @@
+# app/segments.py
+"""Split a render into frame ranges encoded on different workers and joined without re-encoding.
+
+Each segment is its own ffmpeg run, so it starts on a keyframe, and all
+segments use the same encoder settings, which lets the concat demuxer join
+them with stream copy.
+"""
+import os
+
+from .config import Config
+
+
+def should_segment(total_frames, framerate, width, height):
+    """Segment outputs of at least two segments whose pixel volume is worth spreading out."""
+    if Config.SEGMENT_SECONDS <= 0:
+        return False
+    seconds = total_frames / framerate
+    return seconds >= 2 * Config.SEGMENT_SECONDS and seconds * width * height >= Config.SEGMENT_MIN_PIXEL_SECONDS
+
+
+def segment_ranges(total_frames, framerate, segment_seconds=None):
+    """``(first_frame, frames)`` for every segment; only the last one may be shorter."""
+    size = max(1, int(round((segment_seconds or Config.SEGMENT_SECONDS) * framerate)))
+    return [(first, min(size, total_frames - first)) for first in range(0, total_frames, size)]
+
+
+def part_path(output_file, index):
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f'.{name}.part{index:04d}.mp4')
+
+
+def parts_list_path(output_file):
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f'.{name}.parts.txt')
+
+
+def write_concat_list(segment_files, list_file):
+    with open(list_file, 'w') as f:
+        for path in segment_files:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+
+
+def concat_command(list_file, output_file, audio_file=None, audio_chain=None):
+    """Join the segments with stream copy, muxing in the audio track when there is one."""
+    command = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', list_file]
+    if audio_file:
+        command += [
+            '-i', audio_file,
+            '-filter_complex', f'[1:a]{audio_chain}[aout]',
+            '-map', '0:v', '-map', '[aout]',
+            '-c:a', 'aac'
+        ]
+    return command + ['-c:v', 'copy', output_file]
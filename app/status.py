@@ -0,0 +1,55 @@
+# app/status.py
+import json
+import time
+import logging
+import redis
+
+from .config import Config
+from .storage import output_filename
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+def get_redis():
+    """Process-wide Redis client for job state, created on first use."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(Config.REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+def status_key(api_key, record_id):
+    return f'status:{api_key}:{record_id}'
+
+def set_status(data, state, **fields):
+    """Publish the state of a job so ``GET /status/<record_id>`` can report it.
+
+    Status is scoped to the tenant, so payloads that did not come through the
+    API (and have no ``api_key``) are not published. Jobs in the registry
+    (see ``app.jobs``) have their entry updated too. Redis errors are logged
+    and never fail the pipeline.
+    """
+    if not data.get('api_key'):
+        return
+    payload = {
+        'record_id': data['record_id'],
+        'state': state,
+        'updated_at': time.time()
+    }
+    payload.update(fields)
+    try:
+        client = get_redis()
+        client.set(status_key(data['api_key'], data['record_id']), json.dumps(payload), ex=Config.STATUS_TTL)
+        if data.get('job_key'):
+            entry = dict(payload, params_hash=data['job_key'].rsplit(':', 1)[1],
+                         filename=output_filename(data['output_file']))
+            if data.get('renditions'):
+                entry['renditions'] = [output_filename(rendition['output_file']) for rendition in data['renditions']]
+            # xx: never recreate an entry that has already expired
+            client.set(data['job_key'], json.dumps(entry), xx=True, keepttl=True)
+    except redis.RedisError as e:
+        logger.warning(f'Could not publish status for {data["record_id"]}: {e}')
+
+def get_status(api_key, record_id):
+    value = get_redis().get(status_key(api_key, record_id))
+    return json.loads(value) if value else None
@@ -0,0 +1,269 @@
+# app/storage.py
+"""Where finished outputs are kept and how their public URLs are built.
+
+``local`` leaves files in ``MOVIES_DIR`` on the volume the web container
+serves. ``s3`` uploads them to an S3-compatible bucket (boto3 is only needed
+for this backend) so render nodes need no shared filesystem; there the MP4
+can also be uploaded in parts straight from ffmpeg's output pipe while the
+encode runs. ``STORAGE_CONTENT_ADDRESSED`` stores every MP4 under the hash
+of its content, so identical outputs are kept once.
+
+Backends take the local path an output was rendered to (under
+``MOVIES_DIR``) and derive the object name from it. ``save`` returns the path
+the output ends up under, which differs from the rendered one once content
+addressed, along with its public URL.
+"""
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+# S3 rejects multipart parts smaller than this, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+CONTENT_TYPES = {'.mp4': 'video/mp4', '.m4s': 'video/iso.segment', '.m3u8': 'application/vnd.apple.mpegurl',
+                 '.mpd': 'application/dash+xml'}
+
+
+def content_type(path):
+    return CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+
+
+def storage_name(path):
+    """Object name for a local output path: its path below ``MOVIES_DIR``."""
+    return os.path.relpath(path, Config.MOVIES_DIR).replace(os.sep, '/')
+
+
+def output_filename(path):
+    """Name a client is given for an output: its path below ``MOVIES_DIR``, or its file name if rendered elsewhere."""
+    name = storage_name(path)
+    return os.path.basename(path) if name.startswith('..') else name
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_path(digest, extension):
+    """Local path an output with this content hash is stored under."""
+    return os.path.join(Config.MOVIES_DIR, 'objects', digest[:2], digest + extension)
+
+
+class LocalStorage:
+    """Outputs stay where they were rendered and the web container serves them."""
+    streams = False
+
+    def url(self, path, request_host):
+        # BASE_URL = f"{Config.SCHEME}://my-image-server.com"
+        base_url = f"{Config.SCHEME}://{request_host}:{Config.PUBLIC_PORT}"
+        return f"{base_url}/{path}"
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def save(self, path, request_host):
+        return path, self.url(path, request_host)
+
+    def save_tree(self, directory):
+        pass
+
+    def rename(self, source, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+
+    def delete(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class MultipartUpload:
+    """S3 multipart upload fed from a pipe, uploading parts on a thread pool while reading continues."""
+
+    def __init__(self, client, bucket, key, path, part_size, concurrency):
+        self.client = client
+        # Local path the output stands for, from which its URL is built
+        self.path = path
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.concurrency = max(1, concurrency)
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type(key))['UploadId']
+        self.pending = []
+        self.parts = []
+        self.tail = b''
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def _upload_part(self, number, body):
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=body)
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def consume(self, stream):
+        """Read ``stream`` to EOF; every full part is uploaded while reading continues."""
+        buffer = bytearray()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for chunk in iter(lambda: stream.read(READ_SIZE), b''):
+                self.digest.update(chunk)
+                self.size += len(chunk)
+                buffer += chunk
+                while len(buffer) >= self.part_size:
+                    # Bound memory: at most two parts per upload thread in flight
+                    if len(self.pending) >= 2 * self.concurrency:
+                        self.parts.append(self.pending.pop(0).result())
+                    number = len(self.parts) + len(self.pending) + 1
+                    self.pending.append(executor.submit(self._upload_part, number, bytes(buffer[:self.part_size])))
+                    del buffer[:self.part_size]
+            self.parts += [future.result() for future in self.pending]
+            self.pending = []
+        # The last part may be short, so it is only sent once the output is known to be complete
+        self.tail = bytes(buffer)
+
+    def complete(self):
+        if self.tail or not self.parts:
+            self.parts.append(self._upload_part(len(self.parts) + 1, self.tail))
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+class S3Storage:
+    """Outputs are uploaded to an S3-compatible bucket and removed from the render node."""
+
+    def __init__(self, bucket, endpoint_url=None, public_url=None, prefix='', client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError('STORAGE_BACKEND=s3 requires boto3')
+            client = boto3.client('s3', endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.public_url = (public_url or f'{endpoint_url or "https://s3.amazonaws.com"}/{bucket}').rstrip('/')
+        self.streams = Config.STORAGE_STREAM_UPLOAD
+
+    def key(self, path):
+        name = storage_name(path)
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def url(self, path, request_host):
+        return f'{self.public_url}/{self.key(path)}'
+
+    def exists(self, path):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def save(self, path, request_host):
+        self.client.upload_file(path, self.bucket, self.key(path), ExtraArgs={'ContentType': content_type(path)})
+        os.remove(path)
+        return path, self.url(path, request_host)
+
+    def save_tree(self, directory):
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                self.client.upload_file(path, self.bucket, self.key(path), ExtraArgs={'ContentType': content_type(path)})
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def rename(self, source, target):
+        self.client.copy_object(Bucket=self.bucket, Key=self.key(target),
+                                CopySource={'Bucket': self.bucket, 'Key': self.key(source)})
+        self.delete(source)
+
+    def delete(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(path))
+
+    def stream_upload(self, path):
+        """Multipart upload of the output rendered for ``path``, to be fed from ffmpeg's stdout."""
+        return MultipartUpload(self.client, self.bucket, self.key(path), path, Config.S3_PART_SIZE,
+                               Config.S3_UPLOAD_CONCURRENCY)
+
+
+class ContentAddressedStorage:
+    """Stores each MP4 under its SHA-256 so identical outputs are kept once."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.streams = backend.streams
+
+    def url(self, path, request_host):
+        return self.backend.url(path, request_host)
+
+    def save(self, path, request_host):
+        target = content_path(file_sha256(path), os.path.splitext(path)[1])
+        if self.backend.exists(target):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+            self.backend.save(target, request_host)
+        return target, self.backend.url(target, request_host)
+
+    def save_tree(self, directory):
+        # Playlists reference their segments by name, so they keep their layout
+        self.backend.save_tree(directory)
+
+    def stream_upload(self, path):
+        return ContentAddressedUpload(self.backend, path)
+
+
+class ContentAddressedUpload:
+    """Streams to a temporary object, then moves it to its content address once the hash is known."""
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.staging = os.path.join(Config.MOVIES_DIR, 'uploads', uuid.uuid4().hex + os.path.splitext(path)[1])
+        self.upload = backend.stream_upload(self.staging)
+        self.path = None
+
+    @property
+    def size(self):
+        return self.upload.size
+
+    def consume(self, stream):
+        self.upload.consume(stream)
+
+    def complete(self):
+        self.upload.complete()
+        self.path = content_path(self.upload.digest.hexdigest(), os.path.splitext(self.staging)[1])
+        if self.backend.exists(self.path):
+            self.backend.delete(self.staging)
+        else:
+            self.backend.rename(self.staging, self.path)
+
+    def abort(self):
+        self.upload.abort()
+
+
+_storage = None
+
+
+def get_storage():
+    """The configured backend, built once per process."""
+    global _storage
+    if _storage is None:
+        if Config.STORAGE_BACKEND == 's3':
+            backend = S3Storage(Config.S3_BUCKET, endpoint_url=Config.S3_ENDPOINT_URL,
+                                public_url=Config.S3_PUBLIC_URL, prefix=Config.S3_PREFIX)
+        else:
+            backend = LocalStorage()
+        _storage = ContentAddressedStorage(backend) if Config.STORAGE_CONTENT_ADDRESSED else backend
+    return _storage
@@ -0,0 +1,54 @@
+# app/streaming.py
+"""Segmented (HLS or DASH) output written while the encode runs.
+
+The encoder's output goes through the ``tee`` muxer to both a fragmented
+playlist, which players can open as soon as the first segment exists, and a
+``+faststart`` MP4 for progressive playback. Keyframes are forced on segment
+boundaries so every segment starts on one.
+"""
+import os
+
+from .config import Config
+
+# Output mode -> playlist file written into the stream directory
+STREAM_MODES = {'hls': 'index.m3u8', 'dash': 'manifest.mpd'}
+
+
+def is_streaming(data):
+    return data.get('output_mode') in STREAM_MODES
+
+
+def stream_dir(output_file):
+    """Directory holding the playlist and segments, named after the MP4."""
+    return os.path.splitext(output_file)[0]
+
+
+def playlist_path(output_file, mode):
+    return os.path.join(stream_dir(output_file), STREAM_MODES[mode])
+
+
+def _muxer_options(mode):
+    seconds = Config.STREAM_SEGMENT_SECONDS
+    if mode == 'hls':
+        return (f'f=hls:hls_time={seconds:g}:hls_segment_type=fmp4'
+                ':hls_playlist_type=event:hls_flags=independent_segments')
+    return f'f=dash:seg_duration={seconds:g}:streaming=1'
+
+
+def stream_command(command, mode, copy=False):
+    """Rewrite an ffmpeg command whose last argument is the MP4 to also write the playlist.
+
+    ``copy`` marks stream-copy commands, whose keyframes are already fixed.
+    """
+    output_file = command[-1]
+    args = command[:-1]
+    # tee only carries explicitly mapped streams
+    if '-map' not in args:
+        args += ['-map', '0:v']
+    # tee has no default codecs to fall back on
+    if not copy and '-c:v' not in args:
+        args += ['-c:v', 'libx264']
+    if not copy:
+        args += ['-force_key_frames', f'expr:gte(t,n_forced*{Config.STREAM_SEGMENT_SECONDS:g})']
+    tee = f'[{_muxer_options(mode)}]{playlist_path(output_file, mode)}|[f=mp4:movflags=+faststart]{output_file}'
+    return args + ['-flags', '+global_header', '-f', 'tee', tee]
@@ -1,127 +1,727 @@
 # app/tasks.py
+import copy
+import json
+import time
+import uuid
 import subprocess
+from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import redis
 import requests
+from celery import chain, chord, group
+from . import webhooks, scheduling, cost_model
 from .config import Config
-from .utils import generate_random_filename
-from werkzeug.utils import secure_filename
+from .cache import input_cache, InputError
+from .render_cache import render_cache, render_key, timeline_key
+from .metrics import time_stage, label_fields, CACHE_REQUESTS
+from .status import set_status
+from .ffmpeg import run_ffmpeg, still_image_command, looped_still_commands, motion_command, encoder_args, pipe_output
+from .filters import framed_chain, motion_chain
+from .kenburns import motion_for, zoompan_filter
+from .timeline import timeline_command, timeline_duration, audio_filter
+from .renditions import RENDITION_FIELDS, rendition_outputs, rendition_commands
+from .streaming import is_streaming, stream_dir, stream_command
+from .storage import get_storage, output_filename
+from .prescale import prescale_cache
+from .segments import should_segment, segment_ranges, part_path, parts_list_path, write_concat_list, concat_command
 import os
-from app.celery_app import celery_app
+from app.celery_app import celery_app, get_flask_app
 import logging
-from celery import Celery
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Celery('tasks', broker='pyamqp://guest@localhost//')
+def output_url(request_host, output_file):
+    return get_storage().url(output_file, request_host)
+
+def start_upload(data, command):
+    """Point the command's MP4 at stdout and open an upload when the storage backend takes streamed uploads."""
+    storage = get_storage()
+    if not storage.streams or is_streaming(data):
+        return command, None
+    return pipe_output(command), storage.stream_upload(command[-1])
+
+@contextmanager
+def aborting(upload):
+    """Abort a streamed upload if the render fails."""
+    try:
+        yield
+    except BaseException:
+        if upload:
+            upload.abort()
+        raise
+
+def publish(data, output=None, upload=None):
+    """Hand a finished output to the storage backend and return its public URL.
+
+    ``output`` is ``data`` itself or one of its renditions. Its ``output_file``
+    is updated to where the storage keeps the file (content addressed storage
+    moves it) and its ``output_url`` is set.
+    """
+    output = data if output is None else output
+    storage = get_storage()
+    if upload:
+        upload.complete()
+        path, url = upload.path, storage.url(upload.path, data['request_host'])
+    else:
+        if is_streaming(data):
+            storage.save_tree(stream_dir(output['output_file']))
+        path, url = storage.save(output['output_file'], data['request_host'])
+    output['output_file'] = path
+    output['output_url'] = url
+    return url
+
+def finish_job(data, state, **fields):
+    """Publish a terminal state and hand the job's cost back to its tenant's backlog."""
+    if state == 'completed':
+        fields['filename'] = output_filename(data['output_file'])
+    set_status(data, state, **fields)
+    scheduling.release(data)
+
+def record_render(data, seconds, output_files, upload=None):
+    """Feed a measured single-process render to the cost model."""
+    if upload:
+        size = upload.size
+    else:
+        size = sum(os.path.getsize(path) for path in output_files if os.path.exists(path))
+    cost_model.observe(data, seconds, size)
+
+def tenant_slot(task_function):
+    """Run a bound render task only within its tenant's concurrent render quota, retrying later otherwise."""
+    @wraps(task_function)
+    def run(self, data, *args, **kwargs):
+        # Retries keep the task id, so a retried task asks for the same slot
+        slot_id = self.request.id or uuid.uuid4().hex
+        if not scheduling.acquire_slot(data, slot_id):
+            raise self.retry(countdown=Config.TENANT_SLOT_RETRY_SECONDS, max_retries=None,
+                             **scheduling.render_options(data))
+        try:
+            return task_function(self, data, *args, **kwargs)
+        finally:
+            scheduling.release_slot(data, slot_id)
+    return run
+
+def create_video_pipeline(data):
+    """Build the fetch -> probe -> render -> webhook chain for a validated request."""
+    return chain(
+        fetch_input_task.s(data),
+        probe_input_task.s(),
+        create_video_task.s().set(**scheduling.render_options(data)),
+        send_webhook_task.s()
+    )
+
+def create_timeline_pipeline(data):
+    """Build the fetch -> probe -> render -> webhook chain for a timeline request."""
+    return chain(
+        fetch_timeline_task.s(data),
+        probe_timeline_task.s(),
+        create_timeline_task.s().set(**scheduling.render_options(data)),
+        send_webhook_task.s()
+    )
+
+def create_batch_pipeline(jobs, batch):
+    """Fetch and probe each distinct input URL once, then fan the renders out from there."""
+    inputs = {}
+    for data in jobs:
+        input_data = inputs.setdefault(data['input_url'], {
+            'record_id': data['record_id'],
+            'input_url': data['input_url'],
+            'cache': True,
+            'api_key': batch['api_key']
+        })
+        # One job asking to bypass the cache is enough to refetch the shared input
+        input_data['cache'] = input_data['cache'] and data.get('cache', True)
+    return chord(group(batch_input_task.s(data) for data in inputs.values()), dispatch_batch_task.s(jobs, batch))
+
+@celery_app.task
+def batch_input_task(data):
+    """Fetch and probe one shared batch input, recording failures instead of raising."""
+    try:
+        return probe_input_task(fetch_input_task(data))
+    except Exception as e:
+        logger.error(f"Batch input {data['input_url']} failed: {e}")
+        data['error'] = failure_message(e)
+        return data
+
+@celery_app.task
+def dispatch_batch_task(inputs, jobs, batch):
+    """Start a render for every job whose input was fetched, followed by the aggregate webhook."""
+    inputs = {data['input_url']: data for data in inputs}
+    renders = []
+    failed = []
+    for data in jobs:
+        input_data = inputs[data['input_url']]
+        if 'error' in input_data:
+            data['error'] = input_data['error']
+            finish_job(data, 'failed', error=data['error'])
+            failed.append({'record_id': data['record_id'], 'error': data['error']})
+            if data.get('webhook_url'):
+                send_webhook_task.delay(data)
+            continue
+        for field in ('cached_input_file', 'input_sha256', 'input_width', 'input_height'):
+            data[field] = input_data[field]
+        renders.append(create_video_task.s(data).set(link=send_webhook_task.s(), link_error=report_failure_task.s(),
+                                                     **scheduling.render_options(data)))
+
+    batch = dict(batch, failed=failed)
+    if not batch.get('webhook_url'):
+        group(renders).apply_async()
+    elif renders:
+        chord(group(renders), send_batch_webhook_task.s(batch).on_error(report_batch_failure_task.s(batch))).apply_async()
+    else:
+        send_batch_webhook_task.delay([], batch)
+    return len(renders)
+
+@celery_app.task
+def fetch_input_task(data):
+    set_status(data, 'fetching')
+    with time_stage('fetch', data):
+        entry = input_cache.fetch(data['input_url'], use_cache=data.get('cache', True))
+    CACHE_REQUESTS.labels(cache='input', result=entry.source).inc()
+    data['cached_input_file'] = entry.path
+    data['input_sha256'] = entry.sha256
+    if entry.width is not None:
+        data['input_width'] = entry.width
+        data['input_height'] = entry.height
+    return data
 
 @celery_app.task
-def create_video_task(data, flask_app=None):
+def probe_input_task(data):
+    if 'input_width' not in data or 'input_height' not in data:
+        set_status(data, 'probing')
+        with time_stage('probe', data):
+            data['input_width'], data['input_height'] = input_cache.probe(data['input_sha256'])
+    return data
+
+def timeline_sources(data):
+    timeline = data['timeline']
+    return timeline['clips'] + ([timeline['audio']] if timeline.get('audio') else [])
+
+@celery_app.task
+def fetch_timeline_task(data):
+    """Fetch every clip and the audio track of a timeline concurrently."""
+    set_status(data, 'fetching')
+    sources = timeline_sources(data)
+    use_cache = data.get('cache', True)
+    with time_stage('fetch', data), ThreadPoolExecutor(max_workers=min(len(sources), Config.HTTP_MAX_PER_HOST)) as pool:
+        entries = list(pool.map(lambda source: input_cache.fetch(source['url'], use_cache=use_cache), sources))
+    for source, entry in zip(sources, entries):
+        CACHE_REQUESTS.labels(cache='input', result=entry.source).inc()
+        source['cached_input_file'] = entry.path
+        source['input_sha256'] = entry.sha256
+        if entry.width is not None:
+            source['input_width'] = entry.width
+            source['input_height'] = entry.height
+    return data
+
+def restore_input(source, url_field, use_cache=True):
+    """Fetch an input again if its blob was evicted while the job was queued; returns True if its content changed."""
+    if input_cache.touch(source['cached_input_file']):
+        return False
+    url = source[url_field]
+    logger.warning(f'Cached input for {url} was evicted, fetching it again')
+    entry = input_cache.fetch(url, use_cache=use_cache)
+    CACHE_REQUESTS.labels(cache='input', result=entry.source).inc()
+    source['cached_input_file'] = entry.path
+    if entry.sha256 == source.get('input_sha256'):
+        return False
+    source['input_sha256'] = entry.sha256
+    # Audio tracks are never probed
+    if 'input_width' in source:
+        if entry.width is not None:
+            source['input_width'], source['input_height'] = entry.width, entry.height
+        else:
+            source['input_width'], source['input_height'] = input_cache.probe(entry.sha256)
+    return True
+
+def restore_inputs(data, sources=None):
+    """Make sure every cached input of a job is still on disk before it is rendered.
+
+    Returns True if any input came back with different content. ``sources``
+    limits a timeline to some of its clips and its audio track.
+    """
+    use_cache = data.get('cache', True)
+    if 'timeline' not in data:
+        return restore_input(data, 'input_url', use_cache)
+    changed = False
+    for source in timeline_sources(data) if sources is None else sources:
+        changed = restore_input(source, 'url', use_cache) or changed
+    return changed
+
+@celery_app.task
+def probe_timeline_task(data):
+    clips = [clip for clip in data['timeline']['clips'] if 'input_width' not in clip or 'input_height' not in clip]
+    if clips:
+        set_status(data, 'probing')
+        with time_stage('probe', data):
+            for clip in clips:
+                clip['input_width'], clip['input_height'] = input_cache.probe(clip['input_sha256'])
+    return data
+
+@celery_app.task(bind=True)
+@tenant_slot
+def create_timeline_task(self, data, flask_app=None):
+    """Render every clip of a timeline, with transitions and audio, in a single ffmpeg run."""
+    logger.info(f"Received timeline: {data}")
+    # Results go on a copy, so a job passed in directly is left as it was received
+    data = copy.deepcopy(data)
+
+    if flask_app is None:
+        flask_app = get_flask_app()
+
+    output_file = data['output_file']
+    restore_inputs(data)
+
+    # Streamed outputs are not cached: the cache holds only the MP4, not the playlist
+    streaming = is_streaming(data)
+    cache_key = None if streaming else timeline_key(data)
+    if cache_key and data.get('cache', True) and render_cache.lookup(cache_key, output_file):
+        CACHE_REQUESTS.labels(cache='render', result='hit').inc()
+        logger.info(f'Render cache hit, linked {output_file}')
+        publish(data)
+        finish_job(data, 'completed', output_url=data['output_url'], cached=True)
+        return data
+    if cache_key:
+        CACHE_REQUESTS.labels(cache='render', result='miss').inc()
+
+    total_frames = max(1, int(round(timeline_duration(data['timeline']['clips']) * data['framerate'])))
+    # Segments are only joined at the end, which would hold back a streamed playlist
+    if not streaming and should_segment(total_frames, data['framerate'], data['output_width'], data['output_height']):
+        return dispatch_segments(self, data, total_frames, cache_key)
+
+    encoder = encoder_args(data.get('profile'), still=False)
+    ffmpeg_command, duration = timeline_command(
+        data['timeline'], data['framerate'], data['output_width'], data['output_height'], output_file, encoder=encoder)
+    if streaming:
+        os.makedirs(stream_dir(output_file), exist_ok=True)
+        ffmpeg_command = stream_command(ffmpeg_command, data['output_mode'])
+    ffmpeg_command, upload = start_upload(data, ffmpeg_command)
+
+    set_status(data, 'rendering', step=1, steps=1)
+    render_started = time.perf_counter()
+    with flask_app.app_context(), time_stage('render', data), aborting(upload):
+        flask_app.logger.info(f'Running FFmpeg command: {" ".join(ffmpeg_command)}')
+
+        def publish_progress(progress):
+            set_status(data, 'rendering', step=1, steps=1, **progress)
+
+        try:
+            run_ffmpeg(ffmpeg_command, on_progress=publish_progress, stall_timeout=Config.FFMPEG_STALL_TIMEOUT,
+                       stdout_sink=upload and upload.consume)
+        except subprocess.CalledProcessError as e:
+            flask_app.logger.error(f'ffmpeg error: {e.output.decode("utf-8")}')
+            raise
+
+    flask_app.logger.info(f'Timeline of {duration:g}s created at {output_file}')
+    record_render(data, time.perf_counter() - render_started, [output_file], upload)
+    # A streamed upload leaves no local file to cache
+    if cache_key and not upload:
+        render_cache.store(cache_key, output_file)
+    publish(data, upload=upload)
+    finish_job(data, 'completed', output_url=data['output_url'])
+    return data
+
+def motion_video_filter(data, motion, total_frames, first_frame=0, frames=None):
+    """Prescale once to the largest zoom, then let zoompan emit every frame from that picture."""
+    output_width = data['output_width']
+    output_height = data['output_height']
+    zoompan = zoompan_filter(motion, total_frames, data['framerate'], output_width, output_height,
+                             first_frame=first_frame, duration_frames=frames)
+    return str(motion_chain(data['input_width'], data['input_height'], output_width, output_height, data['crop'],
+                            motion, zoompan))
+
+def dispatch_segments(task, data, total_frames, cache_key):
+    """Replace ``task`` with a chord encoding frame ranges in parallel, joined by merge_segments_task.
+
+    The rest of the replaced task's chain (the webhook) runs after the merge.
+    ``task`` gives its tenant slot back once replaced; each segment takes one of
+    its own, so a segmented job runs no more encodes at once than its quota.
+    """
+    ranges = segment_ranges(total_frames, data['framerate'])
+    logger.info(f"Rendering {data['record_id']} as {len(ranges)} segments")
+    set_status(data, 'rendering', segments=len(ranges))
+    header = group(
+        render_segment_task.s(data, index, first_frame, frames, total_frames).set(**scheduling.render_options(data))
+        for index, (first_frame, frames) in enumerate(ranges)
+    )
+    return task.replace(chord(header, merge_segments_task.s(data, cache_key)))
+
+@celery_app.task(bind=True)
+@tenant_slot
+def render_segment_task(self, data, index, first_frame, frames, total_frames):
+    """Encode one frame range of a motion clip or timeline; returns the segment file."""
+    # Every segment and the merge must see the content the render was keyed on
+    if restore_inputs(data):
+        raise InputError('Input changed while the video was rendering')
+    segment_file = part_path(data['output_file'], index)
+    encoder = encoder_args(data.get('profile'), still=False)
+    if 'timeline' in data:
+        command, _ = timeline_command(data['timeline'], data['framerate'], data['output_width'], data['output_height'],
+                                      segment_file, encoder=encoder, frame_range=(first_frame, frames))
+    else:
+        video_filter = motion_video_filter(data, motion_for(data), total_frames, first_frame, frames)
+        command = motion_command(data['cached_input_file'], video_filter, frames, data['framerate'], segment_file,
+                                 encoder=encoder)
+    # A retried segment overwrites its own partial output
+    command.insert(1, '-y')
+    with time_stage('render_segment', data):
+        run_ffmpeg(command, stall_timeout=Config.FFMPEG_STALL_TIMEOUT)
+    return segment_file
+
+@celery_app.task
+def merge_segments_task(segment_files, data, cache_key):
+    """Join encoded segments with the concat demuxer, without re-encoding the video."""
+    output_file = data['output_file']
+    list_file = parts_list_path(output_file)
+    set_status(data, 'merging', segments=len(segment_files))
+    audio = data.get('timeline', {}).get('audio')
+    if audio and restore_inputs(data, [audio]):
+        raise InputError('Input changed while the video was rendering')
+    try:
+        write_concat_list(segment_files, list_file)
+        if audio:
+            length = timeline_duration(data['timeline']['clips'])
+            command = concat_command(list_file, output_file, audio['cached_input_file'], audio_filter(audio, length))
+        else:
+            command = concat_command(list_file, output_file)
+        command, upload = start_upload(data, command)
+        with time_stage('merge', data), aborting(upload):
+            run_ffmpeg(command, stdout_sink=upload and upload.consume)
+    finally:
+        for path in segment_files + [list_file]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    logger.info(f'Video created at {output_file} from {len(segment_files)} segments')
+    if cache_key and not upload:
+        render_cache.store(cache_key, output_file)
+    publish(data, upload=upload)
+    finish_job(data, 'completed', output_url=data['output_url'])
+    return data
+
+def video_commands(data):
+    """The ffmpeg commands for rendering ``data`` in a single run.
+
+    Returns the commands, the looped still segment they leave behind (or
+    None) and the seconds spent preparing a prescaled still, which count
+    towards the render.
+    """
+    framerate = data['framerate']
+    duration = data['duration']
+    output_width = data['output_width']
+    output_height = data['output_height']
+    cached_input_file = data['cached_input_file']
+    output_file = data['output_file']
+    motion = motion_for(data)
+    encoder = encoder_args(data.get('profile'), still=motion is None)
+    if motion:
+        frames = max(1, int(round(duration * framerate)))
+        video_filter = motion_video_filter(data, motion, frames)
+        return [motion_command(cached_input_file, video_filter, frames, framerate, output_file, encoder=encoder)], None, 0.0
+
+    still_input = cached_input_file
+    video_filter = str(framed_chain(data['input_width'], data['input_height'], output_width, output_height,
+                                    data['crop']))
+    raw_size = None
+    prescale_seconds = 0.0
+    if Config.PRESCALE_STILLS:
+        # Orient, frame and convert the still once; the render only loops the prepared frame
+        prescale_started = time.perf_counter()
+        with time_stage('prescale', data):
+            still_input = prescale_cache.prepare(data)
+        prescale_seconds = time.perf_counter() - prescale_started
+        video_filter = None
+        raw_size = (output_width, output_height)
+    if duration > Config.STILL_SEGMENT_SECONDS:
+        # Static clip: encode one GOP and stream-copy it to the full duration
+        ffmpeg_commands, segment_file = looped_still_commands(
+            still_input, video_filter, duration, framerate, output_file, Config.STILL_SEGMENT_SECONDS,
+            encoder=encoder, raw_size=raw_size)
+        return ffmpeg_commands, segment_file, prescale_seconds
+    return [still_image_command(still_input, video_filter, duration, framerate, output_file,
+                                encoder=encoder, raw_size=raw_size)], None, prescale_seconds
+
+@celery_app.task(bind=True)
+@tenant_slot
+def create_video_task(self, data, flask_app=None):
     logger.info(f"Received data: {data}")
+    # Results go on a copy, renditions included, so a job passed in directly is left as it was received
+    data = copy.deepcopy(data)
 
     if flask_app is None:
-        from app import create_app
-        flask_app = create_app()
+        flask_app = get_flask_app()
+    restore_inputs(data)
 
-    record_id = data['record_id']
     framerate = data['framerate']
     duration = data['duration']
-    zoom = data['zoom']
-    crop = data['crop']
     input_width = data['input_width']
     input_height = data['input_height']
     output_width = data['output_width']
     output_height = data['output_height']
-    webhook_url = data.get('webhook_url')
     cached_input_file = data['cached_input_file']
     output_file = data['output_file']
-    request_host = data['request_host']
 
     # Validate input dimensions
     if input_width <= 0 or input_height <= 0 or output_width <= 0 or output_height <= 0:
         raise ValueError("Input and output dimensions must be positive integers")
 
+    if data.get('renditions'):
+        return render_renditions(data, flask_app)
+
+    # Identical input content and render parameters always produce the same file
+    # (streamed outputs are not cached: the cache holds only the MP4, not the playlist)
+    streaming = is_streaming(data)
+    cache_key = None
+    if data.get('input_sha256') and not streaming:
+        cache_key = render_key(data['input_sha256'], data)
+        if data.get('cache', True) and render_cache.lookup(cache_key, output_file):
+            CACHE_REQUESTS.labels(cache='render', result='hit').inc()
+            logger.info(f'Render cache hit, linked {output_file}')
+            publish(data)
+            finish_job(data, 'completed', output_url=data['output_url'], cached=True)
+            return data
+        CACHE_REQUESTS.labels(cache='render', result='miss').inc()
+
     try:
         flask_app.logger.info(f'Duration param: {duration}')
         total_frames = duration * framerate  # Total number of frames
 
-        crop_filter = ""
-        if crop and (input_width != output_width or input_height != output_height):
-            crop_width = min(input_width, output_width)
-            crop_height = min(input_height, output_height)
-            crop_x = (input_width - crop_width) // 2
-            crop_y = (input_height - crop_height) // 2
-            crop_filter = f",crop={crop_width}:{crop_height}:{crop_x}:{crop_y}"
-
-        pad_filter = ""
-        if not crop and (input_width != output_width or input_height != output_height):
-            pad_filter = f",scale=w=min({output_width}/iw\\,{output_height}/ih)*iw:h=-2,scale={output_width}:{output_height}:force_original_aspect_ratio=decrease,pad={output_width}:{output_height}:(ow-iw)/2:(oh-ih)/2"
-
-        zoom_filter = ""
-        if zoom != 0:
-            max_zoom_rate = 0.1
-            normalized_zoom = (zoom / 100) * max_zoom_rate
-            if zoom > 0:
-                zoom_filter = f",zoompan=z='min(zoom+{normalized_zoom},2)':d=1"
-            else:
-                zoom_filter = f",zoompan=z='max(zoom-{abs(normalized_zoom)},1)':d=1"
-
-        ffmpeg_command = [
-            'ffmpeg',
-            '-loop', '1',
-            '-i', cached_input_file,
-            '-vf', (
-                f"format=yuv420p"
-                + crop_filter
-                + pad_filter
-                # + zoom_filter
-                + f",scale={output_width}:{output_height}"
-            ),
-            '-t', str(duration),
-            '-pix_fmt', 'yuv420p',
-            '-r', str(framerate),
-            output_file
-        ]
-
-        flask_app.logger.info(f'Running FFmpeg command: {" ".join(ffmpeg_command)}')
+        if motion_for(data):
+            frames = max(1, int(round(total_frames)))
+            if not streaming and should_segment(frames, framerate, output_width, output_height):
+                return dispatch_segments(self, data, frames, cache_key)
+        ffmpeg_commands, segment_file, prescale_seconds = video_commands(data)
+        if streaming:
+            os.makedirs(stream_dir(output_file), exist_ok=True)
+            # A looped still only stream-copies in its last command
+            ffmpeg_commands[-1] = stream_command(ffmpeg_commands[-1], data['output_mode'], copy=segment_file is not None)
+        # Only the last command writes the output file
+        ffmpeg_commands[-1], upload = start_upload(data, ffmpeg_commands[-1])
 
-        with flask_app.app_context():
+        set_status(data, 'rendering', step=1, steps=len(ffmpeg_commands))
+        render_started = time.perf_counter()
+        with flask_app.app_context(), time_stage('render', data), aborting(upload):
             try:
-                process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                for step, ffmpeg_command in enumerate(ffmpeg_commands, start=1):
+                    flask_app.logger.info(f'Running FFmpeg command: {" ".join(ffmpeg_command)}')
 
-                stdout, stderr = process.communicate()
+                    def publish_progress(progress, step=step):
+                        set_status(data, 'rendering', step=step, steps=len(ffmpeg_commands), **progress)
 
-                flask_app.logger.info(f'ffmpeg output: {stdout.decode("utf-8")}')
-                if process.returncode != 0:
-                    flask_app.logger.error(f'ffmpeg error: {stderr.decode("utf-8")}')
-                    raise subprocess.CalledProcessError(returncode=process.returncode, cmd=ffmpeg_command, output=stderr)
+                    sink = upload.consume if upload and step == len(ffmpeg_commands) else None
+                    stdout, stderr = run_ffmpeg(ffmpeg_command, on_progress=publish_progress,
+                                                stall_timeout=Config.FFMPEG_STALL_TIMEOUT, stdout_sink=sink)
+                    flask_app.logger.info(f'ffmpeg output: {stdout.decode("utf-8")}')
 
                 flask_app.logger.info(f'Processing video: {cached_input_file} to {output_file} completed successfully.')
-            except Exception as e:
+            except subprocess.CalledProcessError as e:
+                flask_app.logger.error(f'ffmpeg error: {e.output.decode("utf-8")}')
                 flask_app.logger.error(f'Error processing video')
                 raise e
+            finally:
+                if segment_file and os.path.exists(segment_file):
+                    os.remove(segment_file)
 
         flask_app.logger.info(f'Video created at {output_file}')
+        # The cost model predicts the whole render, so the prescale it needed counts towards it
+        record_render(data, time.perf_counter() - render_started + prescale_seconds, [output_file], upload)
 
-        # BASE_URL = f"{Config.SCHEME}://my-image-server.com"
-        BASE_URL = f"{Config.SCHEME}://{request_host}:{Config.PUBLIC_PORT}"
-        full_url = f"{BASE_URL}/{output_file}"
+        # A streamed upload leaves no local file to cache
+        if cache_key and not upload:
+            render_cache.store(cache_key, output_file)
+
+        publish(data, upload=upload)
+        finish_job(data, 'completed', output_url=data['output_url'])
+        return data
+    except subprocess.CalledProcessError as e:
+        flask_app.logger.error('FFmpeg command failed.')
+        raise e
 
+def render_renditions(data, flask_app):
+    """Render the primary output and every rendition from a single decode of the input.
+
+    Outputs already in the render cache are linked; the rest share one
+    ffmpeg run. Renditions are never split into segments.
+    """
+    outputs = rendition_outputs(data)
+    pending = outputs
+    cache_keys = {}
+    if data.get('input_sha256'):
+        pending = []
+        for output in outputs:
+            params = {field: output[field] for field in RENDITION_FIELDS}
+            cache_key = render_key(data['input_sha256'], dict(data, **params))
+            if data.get('cache', True) and render_cache.lookup(cache_key, output['output_file']):
+                CACHE_REQUESTS.labels(cache='render', result='hit').inc()
+                continue
+            CACHE_REQUESTS.labels(cache='render', result='miss').inc()
+            cache_keys[output['output_file']] = cache_key
+            pending.append(output)
+
+    if pending:
+        ffmpeg_commands, intermediate_files = rendition_commands(data, pending, motion_for(data))
+        set_status(data, 'rendering', step=1, steps=len(ffmpeg_commands))
+        render_started = time.perf_counter()
+        with flask_app.app_context(), time_stage('render', data):
+            try:
+                for step, ffmpeg_command in enumerate(ffmpeg_commands, start=1):
+                    flask_app.logger.info(f'Running FFmpeg command: {" ".join(ffmpeg_command)}')
+
+                    def publish_progress(progress, step=step):
+                        set_status(data, 'rendering', step=step, steps=len(ffmpeg_commands), **progress)
+
+                    run_ffmpeg(ffmpeg_command, on_progress=publish_progress, stall_timeout=Config.FFMPEG_STALL_TIMEOUT)
+            except subprocess.CalledProcessError as e:
+                flask_app.logger.error(f'ffmpeg error: {e.output.decode("utf-8")}')
+                raise e
+            finally:
+                for path in intermediate_files:
+                    if os.path.exists(path):
+                        os.remove(path)
+        if len(pending) == len(outputs):
+            # Partly cached renders are not comparable with the model's features
+            record_render(data, time.perf_counter() - render_started, [output['output_file'] for output in outputs])
+        for output in pending:
+            if output['output_file'] in cache_keys:
+                render_cache.store(cache_keys[output['output_file']], output['output_file'])
+
+    # Several outputs come from one process, so they are uploaded once it has finished
+    publish(data)
+    for rendition in data['renditions']:
+        publish(data, rendition)
+    finish_job(data, 'completed', output_url=data['output_url'],
+               renditions=[rendition['output_url'] for rendition in data['renditions']], cached=not pending)
+    return data
+
+def queue_webhook(url, payload, data):
+    """Hand a callback to the webhooks queue, batched with others for the same host.
+
+    The metric labels of ``data`` travel with it, so delivery is timed under the job's tenant.
+    """
+    labels = label_fields(data)
+    try:
+        if webhooks.enqueue(url, payload, labels):
+            flush_webhooks_task.apply_async(args=[webhooks.origin(url)], countdown=Config.WEBHOOK_BATCH_WINDOW)
+    except redis.RedisError as e:
+        logger.warning(f'Webhook batching unavailable, delivering directly: {e}')
+        deliver_webhook_task.delay(url, payload, labels)
+
+@celery_app.task
+def send_webhook_task(data):
+    webhook_url = data.get('webhook_url')
+    if not webhook_url:
+        return 'No webhook configured'
+
+    if 'error' in data:
+        webhook_payload = {
+            'record_id': data['record_id'],
+            'error': data['error']
+        }
+    else:
         webhook_payload = {
-            'record_id': record_id,
-            'filename': full_url
+            'record_id': data['record_id'],
+            'filename': data['output_url']
         }
+        if data.get('playlist_url'):
+            webhook_payload['playlist'] = data['playlist_url']
+        if data.get('renditions'):
+            webhook_payload['renditions'] = [
+                {'filename': rendition['output_url'], 'output_width': rendition['output_width'],
+                 'output_height': rendition['output_height']}
+                for rendition in data['renditions']
+            ]
+
+    queue_webhook(webhook_url, webhook_payload, data)
+    return 'Webhook queued'
+
+@celery_app.task
+def flush_webhooks_task(webhook_origin):
+    """Send pending callbacks for one host back to back over its pooled connection.
 
-        # Call the webhook
+    Each callback stays in the origin's processing list until it is delivered
+    or handed to a retry, so a worker dying mid-batch loses none of them.
+    """
+    entries, more = webhooks.take_batch(webhook_origin)
+    if more:
+        flush_webhooks_task.delay(webhook_origin)
+    delivered = 0
+    for entry in entries:
+        item = json.loads(entry)
+        labels = item.get('labels', {})
         try:
-            response = requests.post(webhook_url, json=webhook_payload)
-            response.raise_for_status()
-            flask_app.logger.info(f'Webhook called successfully with payload')
+            with time_stage('webhook', labels):
+                webhooks.deliver(item['url'], item['payload'])
+            delivered += 1
         except requests.RequestException as e:
-            flask_app.logger.error(f'Webhook call failed')
+            logger.warning(f"Webhook to {item['url']} failed, retrying: {e}")
+            deliver_webhook_task.apply_async(args=[item['url'], item['payload'], labels],
+                                             countdown=webhooks.backoff(0))
+        webhooks.acknowledge(webhook_origin, entry)
+    if webhooks.finish_batch(webhook_origin):
+        flush_webhooks_task.delay(webhook_origin)
+    logger.info(f'Delivered {delivered}/{len(entries)} webhooks to {webhook_origin}')
+    return delivered
+
+@celery_app.task
+def sweep_webhooks_task():
+    """Periodically recover callbacks stranded by a lost flush or a worker that died mid-batch."""
+    stranded = webhooks.sweep()
+    for webhook_origin in stranded:
+        logger.warning(f'Recovering stranded webhooks for {webhook_origin}')
+        flush_webhooks_task.delay(webhook_origin)
+    return len(stranded)
+
+@celery_app.task(bind=True)
+def deliver_webhook_task(self, url, payload, labels=None):
+    """Deliver a single callback, retrying with exponential backoff before dead-lettering it."""
+    try:
+        with time_stage('webhook', labels or {}):
+            webhooks.deliver(url, payload)
+    except requests.RequestException as e:
+        if not webhooks.is_retryable(e) or self.request.retries >= Config.WEBHOOK_MAX_RETRIES:
+            webhooks.dead_letter(url, payload, e)
             return 'Webhook call failed'
+        raise self.retry(exc=e, countdown=webhooks.backoff(self.request.retries + 1),
+                         max_retries=Config.WEBHOOK_MAX_RETRIES)
+    logger.info(f'Webhook called successfully with payload')
+    return 'Webhook called successfully'
 
-        return 'Video created successfully'
-    except subprocess.CalledProcessError as e:
-        flask_app.logger.error('FFmpeg command failed.')
+@celery_app.task
+def send_batch_webhook_task(results, batch):
+    """Aggregate webhook for a batch, sent once every render has finished."""
+    webhook_payload = {
+        'batch_id': batch['batch_id'],
+        'results': [{'record_id': data['record_id'], 'filename': data['output_url']} for data in results]
+            + batch.get('failed', [])
+    }
+    queue_webhook(batch['webhook_url'], webhook_payload, batch)
+    return 'Webhook queued'
+
+@celery_app.task
+def report_batch_failure_task(request, exc, traceback, batch):
+    """Error callback for the batch chord: at least one render failed."""
+    logger.error(f"Batch {batch['batch_id']} failed: {exc}")
+    queue_webhook(batch['webhook_url'], {
+        'batch_id': batch['batch_id'],
+        'error': 'One or more videos failed'
+    }, batch)
+
+def failure_message(exc):
+    if isinstance(exc, InputError):
+        return str(exc)
+    if isinstance(exc, requests.RequestException):
+        return 'Failed to download input file'
+    if isinstance(exc, subprocess.CalledProcessError):
         return 'FFmpeg command failed'
+    return 'Video processing failed'
+
+@celery_app.task
+def report_failure_task(request, exc, traceback):
+    """Error callback for the pipeline: tell the client which stage failed."""
+    data = dict(request.args[0])
+    data['error'] = failure_message(exc)
+    logger.error(f"Pipeline failed for {data['record_id']}: {exc}")
+    finish_job(data, 'failed', error=data['error'])
+    send_webhook_task.delay(data)
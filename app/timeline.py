@@ -0,0 +1,178 @@
+# app/timeline.py
+"""Render a multi-clip timeline as a single ffmpeg filter graph.
+
+Every clip is framed for the output size, normalized to the output frame
+rate and time base, and joined to the previous one with an ``xfade``
+transition or a plain ``concat`` cut. An optional audio track is trimmed to
+the timeline and faded out. The whole timeline is encoded once, or as
+segments that each only decode the clips shown in their frame range.
+"""
+import math
+
+from .filters import framed_chain, motion_chain
+from .kenburns import motion_for, zoompan_filter
+
+# xfade transitions accepted in a clip's ``transition.type``
+TRANSITIONS = (
+    'fade', 'fadeblack', 'fadewhite', 'dissolve', 'wipeleft', 'wiperight', 'wipeup', 'wipedown',
+    'slideleft', 'slideright', 'slideup', 'slidedown', 'circleopen', 'circleclose', 'smoothleft', 'smoothright'
+)
+DEFAULT_TRANSITION_SECONDS = 1.0
+# Tolerance, in frames, for clip boundaries that fall on a frame
+FRAME_EPSILON = 1e-6
+
+
+def transition_seconds(previous_length, clip):
+    """Length of the transition into ``clip``; 0 for a hard cut.
+
+    It can never be longer than either side of the join.
+    """
+    transition = clip.get('transition')
+    if not transition:
+        return 0.0
+    seconds = float(transition.get('duration', DEFAULT_TRANSITION_SECONDS))
+    return max(0.0, min(seconds, previous_length, float(clip['duration'])))
+
+
+def clip_layout(clips):
+    """``(start, transition, end)`` of every clip, in seconds on the timeline.
+
+    A clip starts ``transition`` seconds before the timeline so far ends, so
+    the transition into it runs from ``start`` to the previous clip's ``end``.
+    """
+    layout = []
+    length = 0.0
+    for index, clip in enumerate(clips):
+        seconds = transition_seconds(length, clip) if index else 0.0
+        start = length - seconds
+        length = start + float(clip['duration'])
+        layout.append((start, seconds, length))
+    return layout
+
+
+def timeline_duration(clips):
+    """Total length in seconds once transitions overlap neighbouring clips."""
+    return clip_layout(clips)[-1][2]
+
+
+def segment_start(layout, first_frame, framerate):
+    """Latest frame at or before ``first_frame`` where no transition is under way.
+
+    A segment's graph starts there: xfade always runs a whole transition, so
+    one cannot be joined half way through.
+    """
+    frame = first_frame
+    while True:
+        under_way = [
+            start * framerate for (start, _, _), (_, _, previous_end) in zip(layout[1:], layout)
+            if start * framerate + FRAME_EPSILON < frame < previous_end * framerate - FRAME_EPSILON
+        ]
+        if not under_way:
+            return frame
+        frame = int(math.floor(min(under_way) + FRAME_EPSILON))
+
+
+def _clip_input(clip, framerate, output_width, output_height, skip=0.0):
+    """Input arguments and the ``FilterChain`` that turns one clip into output-sized frames.
+
+    ``skip`` leaves out the first seconds of the clip, seeking past them rather than decoding them.
+    """
+    duration = float(clip['duration']) - skip
+    crop = clip.get('crop', False)
+    if clip.get('type', 'image') == 'video':
+        start = f'{float(clip.get("start", 0)) + skip:g}' if skip else str(clip.get('start', 0))
+        args = ['-ss', start, '-t', str(duration), '-i', clip['cached_input_file']]
+        chain = framed_chain(clip['input_width'], clip['input_height'], output_width, output_height, crop)
+        # Hold the last frame if the source is shorter than the clip
+        chain.filter(f'tpad=stop_mode=clone:stop_duration={duration}').filter(f'trim=duration={duration}')
+        return args, chain
+
+    motion = motion_for(clip)
+    if motion:
+        # The motion is keyframed over the whole clip, so skipped frames only move where it starts
+        frames = max(1, int(round(float(clip['duration']) * framerate)))
+        skipped = min(frames - 1, int(round(skip * framerate)))
+        zoompan = zoompan_filter(motion, frames, framerate, output_width, output_height,
+                                 first_frame=skipped, duration_frames=frames - skipped)
+        chain = motion_chain(clip['input_width'], clip['input_height'], output_width, output_height, crop, motion,
+                             zoompan)
+        return ['-i', clip['cached_input_file']], chain
+
+    args = ['-loop', '1', '-framerate', str(framerate), '-t', str(duration), '-i', clip['cached_input_file']]
+    return args, framed_chain(clip['input_width'], clip['input_height'], output_width, output_height, crop)
+
+
+def audio_filter(audio, length):
+    """Audio chain trimming the track to ``length`` seconds, with its volume and fade-out."""
+    chain = f'atrim=0:{length:g},asetpts=PTS-STARTPTS,volume={audio.get("volume", 1):g}'
+    fade_out = min(float(audio.get('fade_out', 0)), length)
+    if fade_out:
+        chain += f',afade=t=out:st={length - fade_out:g}:d={fade_out:g}'
+    return chain
+
+
+def timeline_command(timeline, framerate, output_width, output_height, output_file, encoder=None, frame_range=None):
+    """ffmpeg command rendering the whole timeline in one pass; returns (command, duration).
+
+    With ``frame_range`` (first frame, frame count) only those frames are
+    encoded and the audio track is left out, so that segments rendered on
+    different workers can be joined and the audio muxed once afterwards.
+    The graph then only has the clips shown in the range, and starts them at
+    ``segment_start``, so a segment's work does not grow with its position.
+    """
+    clips = timeline['clips']
+    layout = clip_layout(clips)
+    length = layout[-1][2]
+    origin_frame = 0
+    shown = range(len(clips))
+    if frame_range:
+        first_frame, frames = frame_range
+        origin_frame = segment_start(layout, first_frame, framerate)
+        shown = [
+            index for index, (start, _, end) in enumerate(layout)
+            if end * framerate > origin_frame + FRAME_EPSILON
+            and start * framerate < first_frame + frames - FRAME_EPSILON
+        ]
+    origin = origin_frame / framerate
+
+    inputs = []
+    graph = []
+    for position, index in enumerate(shown):
+        skip = max(0.0, origin - layout[index][0]) if position == 0 else 0.0
+        args, chain = _clip_input(clips[index], framerate, output_width, output_height, skip)
+        inputs += args
+        chain.filter(f'fps={framerate}').filter('setsar=1').format('yuv420p').filter('settb=AVTB')
+        graph.append(f'[{position}:v]{chain}[v{position}]')
+
+    label = 'v0'
+    for position, index in enumerate(shown[1:], start=1):
+        start, seconds, _ = layout[index]
+        if seconds:
+            graph.append(f"[{label}][v{position}]xfade=transition={clips[index]['transition']['type']}"
+                         f":duration={seconds:g}:offset={start - origin:g}[x{position}]")
+        else:
+            graph.append(f'[{label}][v{position}]concat=n=2:v=1:a=0[x{position}]')
+        label = f'x{position}'
+
+    command = ['ffmpeg'] + inputs
+    if frame_range:
+        skipped = first_frame - origin_frame
+        graph.append(f'[{label}]trim=start_frame={skipped}:end_frame={skipped + frames},'
+                     f'setpts=PTS-STARTPTS[segment]')
+        command += ['-filter_complex', ';'.join(graph), '-map', '[segment]', '-frames:v', str(frames)]
+    else:
+        outputs = ['-map', f'[{label}]']
+        audio = timeline.get('audio')
+        if audio:
+            command += ['-i', audio['cached_input_file']]
+            graph.append(f'[{len(clips)}:a]{audio_filter(audio, length)}[aout]')
+            outputs += ['-map', '[aout]', '-c:a', 'aac']
+        command += ['-filter_complex', ';'.join(graph)] + outputs + ['-t', f'{length:g}']
+
+    command += [
+        '-pix_fmt', 'yuv420p',
+        '-r', str(framerate)
+    ]
+    if encoder:
+        command += encoder
+    return command + [output_file], length
@@ -1,6 +1,33 @@
+import json
 import string
 import random
+import subprocess
 
 def generate_random_filename(length=16):
     characters = string.ascii_letters + string.digits
     return ''.join(random.choice(characters) for i in range(length)) + '.mp4'
+
+def as_bool(value):
+    """A JSON boolean, or the string "true"/"false" in any case, as a bool."""
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+def probe_dimensions(path):
+    """Return the (width, height) of the first video stream in ``path``."""
+    ffprobe_command = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height',
+        '-of', 'json',
+        path
+    ]
+    process = subprocess.Popen(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+
+    if process.returncode != 0:
+        raise Exception(f'ffprobe failed with error: {stderr.decode("utf-8")}')
+
+    dimensions = json.loads(stdout.decode('utf-8'))
+    return dimensions['streams'][0]['width'], dimensions['streams'][0]['height']
@@ -7,6 +7,56 @@ from flask import request, jsonify
 from jsonschema import validate, ValidationError
 
 from .config import Config
+from .kenburns import EASINGS, MIN_ZOOM, MAX_ZOOM
+from .timeline import TRANSITIONS
+from .streaming import STREAM_MODES
+from .scheduling import PRIORITIES
+from .utils import as_bool
+
+unit_interval = {"type": "number", "minimum": 0, "maximum": 1}
+
+output_mode_schema = {"type": "string", "enum": ["mp4"] + list(STREAM_MODES)}
+priority_schema = {"type": "string", "enum": list(PRIORITIES)}
+
+motion_schema = {
+    "type": "object",
+    "properties": {
+        "keyframes": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "at": unit_interval,
+                    "zoom": {"type": "number", "minimum": MIN_ZOOM, "maximum": MAX_ZOOM},
+                    "x": unit_interval,
+                    "y": unit_interval
+                },
+                "required": ["zoom"]
+            }
+        },
+        "easing": {"type": "string", "enum": list(EASINGS)},
+        "focus": {
+            "type": "object",
+            "properties": {
+                "x": unit_interval,
+                "y": unit_interval
+            }
+        }
+    },
+    "required": ["keyframes"]
+}
+
+rendition_schema = {
+    "type": "object",
+    "properties": {
+        "output_width": {"type": "integer"},
+        "output_height": {"type": "integer"},
+        "crop": {"type": "boolean"},
+        "profile": {"type": "string", "enum": list(Config.ENCODER_PROFILES)}
+    },
+    "required": ["output_width", "output_height"]
+}
 
 input_schema = {
     "type": "object",
@@ -19,19 +69,161 @@ input_schema = {
         "cache": {"type": "boolean"},
         "zoom": {"type": "number"},
         "output_width": {"type": "integer"},
-        "output_height": {"type": "integer"}
+        "output_height": {"type": "integer"},
+        "profile": {"type": "string", "enum": list(Config.ENCODER_PROFILES)},
+        "motion": motion_schema,
+        "output_mode": output_mode_schema,
+        "priority": priority_schema,
+        "deadline": {"type": "number", "exclusiveMinimum": 0},
+        "renditions": {"type": "array", "maxItems": Config.MAX_RENDITIONS, "items": rendition_schema}
     },
     "required": ["record_id", "input_url", "webhook_url", "framerate", "duration", "cache", "output_width", "output_height"]
 }
 
-def validate_json(data):
+clip_schema = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": ["image", "video"]},
+        "url": {"type": "string"},
+        "duration": {"type": "number", "exclusiveMinimum": 0},
+        "start": {"type": "number", "minimum": 0},
+        "crop": {"type": "boolean"},
+        "zoom": {"type": "number"},
+        "motion": motion_schema,
+        "transition": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "string", "enum": list(TRANSITIONS)},
+                "duration": {"type": "number", "exclusiveMinimum": 0}
+            },
+            "required": ["type"]
+        }
+    },
+    "required": ["url", "duration"]
+}
+
+timeline_schema = {
+    "type": "object",
+    "properties": {
+        "record_id": {"type": "string"},
+        "webhook_url": {"type": "string"},
+        "framerate": {"type": "number"},
+        "cache": {"type": "boolean"},
+        "output_width": {"type": "integer"},
+        "output_height": {"type": "integer"},
+        "profile": {"type": "string", "enum": list(Config.ENCODER_PROFILES)},
+        "output_mode": output_mode_schema,
+        "priority": priority_schema,
+        "deadline": {"type": "number", "exclusiveMinimum": 0},
+        "timeline": {
+            "type": "object",
+            "properties": {
+                "clips": {"type": "array", "minItems": 1, "maxItems": Config.MAX_TIMELINE_CLIPS, "items": clip_schema},
+                "audio": {
+                    "type": "object",
+                    "properties": {
+                        "url": {"type": "string"},
+                        "volume": {"type": "number", "minimum": 0},
+                        "fade_out": {"type": "number", "minimum": 0}
+                    },
+                    "required": ["url"]
+                }
+            },
+            "required": ["clips"]
+        }
+    },
+    "required": ["record_id", "webhook_url", "framerate", "cache", "output_width", "output_height", "timeline"]
+}
+
+# Jobs inside a batch may rely on the batch-level aggregate webhook instead
+batch_job_schema = dict(input_schema, required=[field for field in input_schema["required"] if field != "webhook_url"])
+
+batch_schema = {
+    "type": "object",
+    "properties": {
+        "jobs": {"type": "array", "minItems": 1, "items": {"type": "object"}},
+        "webhook_url": {"type": "string"}
+    },
+    "required": ["jobs"]
+}
+
+def validate_json(data, schema=input_schema):
     """Validate JSON data against the schema."""
     try:
-        validate(instance=data, schema=input_schema)
+        validate(instance=data, schema=schema)
         return True, None
     except ValidationError as e:
         return False, str(e)
 
+def video_request_error(data):
+    """Return the error message for the first invalid field of a video request, or None.
+
+    A valid ``crop`` is normalized to a bool in ``data``, so the string
+    "false" never reaches the filter graphs as a truthy value.
+    """
+    webhook_url = data.get('webhook_url')
+    profile = data.get('profile')
+
+    if not is_valid_record_id(data['record_id']):
+        return 'Invalid record ID'
+    if not is_valid_url(data['input_url']):
+        return 'Invalid input URL'
+    if webhook_url and not is_valid_url(webhook_url):
+        return 'Invalid webhook URL'
+    if not is_valid_framerate(data['framerate']):
+        return 'Invalid framerate'
+    if not is_valid_duration(data['duration']):
+        return 'Invalid duration level'
+    if not is_valid_cache(data['cache']):
+        return 'Invalid cache value'
+    if 'zoom' not in data or not is_valid_zoom_level(data['zoom']):
+        return 'Invalid zoom level'
+    if 'crop' not in data or not is_valid_crop(data['crop']):
+        return 'Invalid crop value'
+    data['crop'] = as_bool(data['crop'])
+    if not is_valid_dimension(data['output_width']):
+        return 'Invalid output width'
+    if not is_valid_dimension(data['output_height']):
+        return 'Invalid output height'
+    if profile is not None and not is_valid_encoder_profile(profile):
+        return 'Invalid encoder profile'
+    for rendition in data.get('renditions', []):
+        if not is_valid_dimension(rendition['output_width']) or not is_valid_dimension(rendition['output_height']):
+            return 'Invalid rendition dimensions'
+    if data.get('renditions') and data.get('output_mode', 'mp4') != 'mp4':
+        return 'Renditions are only available with mp4 output'
+    return None
+
+def timeline_request_error(data):
+    """Return the error message for the first invalid field of a timeline request, or None."""
+    profile = data.get('profile')
+    timeline = data['timeline']
+
+    if not is_valid_record_id(data['record_id']):
+        return 'Invalid record ID'
+    if not is_valid_url(data['webhook_url']):
+        return 'Invalid webhook URL'
+    if not is_valid_framerate(data['framerate']):
+        return 'Invalid framerate'
+    if not is_valid_cache(data['cache']):
+        return 'Invalid cache value'
+    if not is_valid_dimension(data['output_width']):
+        return 'Invalid output width'
+    if not is_valid_dimension(data['output_height']):
+        return 'Invalid output height'
+    if profile is not None and not is_valid_encoder_profile(profile):
+        return 'Invalid encoder profile'
+    for clip in timeline['clips']:
+        if not is_valid_url(clip['url']):
+            return 'Invalid input URL'
+        if not is_valid_duration(clip['duration']):
+            return 'Invalid duration level'
+        if 'zoom' in clip and not is_valid_zoom_level(clip['zoom']):
+            return 'Invalid zoom level'
+    if 'audio' in timeline and not is_valid_url(timeline['audio']['url']):
+        return 'Invalid audio URL'
+    return None
+
 def directory_exists(api_key):
     """Check if a directory exists for the given API key."""
     fullpath = os.path.normpath(os.path.join(Config.MOVIES_DIR, api_key))
@@ -134,6 +326,9 @@ def is_valid_duration(value):
     except ValueError:
         return False
 
+def is_valid_encoder_profile(profile):
+    return profile in Config.ENCODER_PROFILES
+
 def is_valid_cache(cache):
     if isinstance(cache, str):
         if cache.lower() == 'true':
@@ -0,0 +1,146 @@
+# app/webhooks.py
+import json
+import time
+import random
+import logging
+from urllib.parse import urlparse
+
+from . import http_client
+from .config import Config
+from .status import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_KEY = 'webhooks:dead'
+ORIGINS_KEY = 'webhooks:origins'
+
+# Put callbacks left in an origin's processing list back at the head of its
+# pending list once no flush holds the origin, i.e. the worker delivering them
+# died or the scheduled flush was lost. Returns 1 when a flush must be scheduled.
+SWEEP_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+while redis.call('LMOVE', KEYS[2], KEYS[1], 'RIGHT', 'LEFT') do end
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[4], ARGV[1])
+    return 0
+end
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[2])
+return 1
+"""
+
+
+def origin(url):
+    parsed = urlparse(url)
+    return f'{parsed.scheme}://{parsed.netloc}'
+
+
+def _pending_key(webhook_origin):
+    return f'webhooks:pending:{webhook_origin}'
+
+
+def _processing_key(webhook_origin):
+    return f'webhooks:processing:{webhook_origin}'
+
+
+def _flush_key(webhook_origin):
+    return f'webhooks:flush:{webhook_origin}'
+
+
+def deliver(url, payload):
+    """POST one callback over the pooled session with strict connect/read timeouts."""
+    response = http_client.post(url, json=payload, timeout=(Config.WEBHOOK_CONNECT_TIMEOUT, Config.WEBHOOK_READ_TIMEOUT))
+    response.raise_for_status()
+    return response
+
+
+def is_retryable(exc):
+    """Network errors, timeouts, 408/429 and 5xx are worth retrying; other 4xx are not."""
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return True
+    return response.status_code in (408, 429) or response.status_code >= 500
+
+
+def backoff(retries):
+    """Exponential backoff capped at ``WEBHOOK_BACKOFF_MAX``, jittered so retries do not arrive in lockstep."""
+    delay = min(Config.WEBHOOK_BACKOFF_MAX, Config.WEBHOOK_BACKOFF_BASE * (2 ** retries))
+    return random.uniform(delay / 2, delay)
+
+
+def enqueue(url, payload, labels=None):
+    """Add a callback to its origin's pending list, with the metric ``labels`` of the job it reports on.
+
+    Returns True when the caller should schedule a flush for that origin,
+    i.e. no flush is already pending.
+    """
+    client = get_redis()
+    webhook_origin = origin(url)
+    client.rpush(_pending_key(webhook_origin), json.dumps({'url': url, 'payload': payload, 'labels': labels or {}}))
+    client.sadd(ORIGINS_KEY, webhook_origin)
+    # The flag expires on its own in case the scheduled flush is lost
+    return bool(client.set(_flush_key(webhook_origin), 1, nx=True, ex=Config.WEBHOOK_FLUSH_TTL))
+
+
+def take_batch(webhook_origin):
+    """Move up to ``WEBHOOK_BATCH_SIZE`` pending callbacks for an origin to its processing list.
+
+    Returns the raw entries, each to be passed to ``acknowledge`` once it has
+    been delivered or handed to a retry, and whether another flush must be
+    scheduled because more are still pending.
+    """
+    client = get_redis()
+    pending, processing = _pending_key(webhook_origin), _processing_key(webhook_origin)
+    pipeline = client.pipeline()
+    for _ in range(Config.WEBHOOK_BATCH_SIZE):
+        pipeline.lmove(pending, processing, 'LEFT', 'RIGHT')
+    pipeline.llen(pending)
+    *entries, remaining = pipeline.execute()
+    return [entry for entry in entries if entry], bool(remaining)
+
+
+def acknowledge(webhook_origin, entry):
+    """Drop a callback from the processing list once it no longer needs the sweep to recover it."""
+    pipeline = get_redis().pipeline()
+    pipeline.lrem(_processing_key(webhook_origin), 1, entry)
+    # Keep the flush flag alive while a slow batch is still being delivered
+    pipeline.expire(_flush_key(webhook_origin), Config.WEBHOOK_FLUSH_TTL)
+    pipeline.execute()
+
+
+def finish_batch(webhook_origin):
+    """Release the origin's flush flag after a batch; returns True if a flush must be scheduled."""
+    client = get_redis()
+    key = _pending_key(webhook_origin)
+    # Entries still processing belong to another flush, or to a dead worker the sweep will recover
+    if client.llen(_processing_key(webhook_origin)):
+        return False
+    client.delete(_flush_key(webhook_origin))
+    # A callback may have been queued before the delete
+    return bool(client.llen(key)) and bool(
+        client.set(_flush_key(webhook_origin), 1, nx=True, ex=Config.WEBHOOK_FLUSH_TTL))
+
+
+def sweep():
+    """Origins whose callbacks were stranded by a lost flush or a dead worker, requeued and flagged for a flush."""
+    client = get_redis()
+    script = client.register_script(SWEEP_SCRIPT)
+    stranded = []
+    for webhook_origin in client.smembers(ORIGINS_KEY):
+        if isinstance(webhook_origin, bytes):
+            webhook_origin = webhook_origin.decode('utf-8')
+        keys = [_pending_key(webhook_origin), _processing_key(webhook_origin), _flush_key(webhook_origin), ORIGINS_KEY]
+        if script(keys=keys, args=[webhook_origin, Config.WEBHOOK_FLUSH_TTL]):
+            stranded.append(webhook_origin)
+    return stranded
+
+
+def dead_letter(url, payload, error):
+    """Keep a callback that exhausted its retries so it can be inspected."""
+    entry = json.dumps({'url': url, 'payload': payload, 'error': str(error), 'failed_at': time.time()})
+    client = get_redis()
+    client.lpush(DEAD_LETTER_KEY, entry)
+    client.ltrim(DEAD_LETTER_KEY, 0, Config.WEBHOOK_DEAD_LETTER_MAX - 1)
+    logger.error(f'Webhook to {url} moved to the dead-letter list: {error}')
+
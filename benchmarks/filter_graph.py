@@ -0,0 +1,79 @@
+# benchmarks/filter_graph.py
+"""Compare the hand-built still filter graphs with the canonical ``FilterChain`` graphs.
+
+The hand-built graph converts to yuv420p at full input resolution, scales
+twice to pad and always ends with a scale to the output size. The canonical
+graph drops the redundant steps and converts after cropping or downscaling.
+Both run on a looped still and go to the null muxer, so the frames per
+second isolate the filter graph.
+
+Usage:
+    python -m benchmarks.filter_graph [--input IMAGE] [--size 1280x720] [--frames 300]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.ffmpeg import run_ffmpeg  # noqa: E402
+from app.filters import framed_chain  # noqa: E402
+from app.probe import read_header  # noqa: E402
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'image_8000x8000.jpg')
+
+def hand_built_filter(input_width, input_height, output_width, output_height, crop):
+    """The graph create_video_task built before ``FilterChain``."""
+    chain = ['format=yuv420p']
+    if (input_width, input_height) != (output_width, output_height):
+        if crop:
+            crop_width = min(input_width, output_width)
+            crop_height = min(input_height, output_height)
+            chain.append(f'crop={crop_width}:{crop_height}:{(input_width - crop_width) // 2}:'
+                         f'{(input_height - crop_height) // 2}')
+        else:
+            chain += [
+                f'scale=w=min({output_width}/iw\\,{output_height}/ih)*iw:h=-2',
+                f'scale={output_width}:{output_height}:force_original_aspect_ratio=decrease',
+                f'pad={output_width}:{output_height}:(ow-iw)/2:(oh-ih)/2'
+            ]
+    return ','.join(chain + [f'scale={output_width}:{output_height}'])
+
+def measure(command):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    run_ffmpeg(command)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--input', default=DEFAULT_INPUT)
+    parser.add_argument('--size', default='1280x720', help='Output size, WIDTHxHEIGHT')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    output_width, output_height = (int(value) for value in args.size.split('x'))
+    input_width, input_height = read_header(args.input).dimensions
+
+    print(f'{args.frames} frames of {os.path.basename(args.input)} ({input_width}x{input_height}) at {args.size}')
+    print(f'{"path":<6} {"graph":<12} {"wall s":>8} {"cpu s":>8} {"fps":>8}')
+    for path, crop in (('crop', True), ('pad', False)):
+        results = []
+        for name, video_filter in (
+            ('hand-built', hand_built_filter(input_width, input_height, output_width, output_height, crop)),
+            ('canonical', str(framed_chain(input_width, input_height, output_width, output_height, crop)))
+        ):
+            command = ['ffmpeg', '-loop', '1', '-i', args.input, '-vf', video_filter, '-frames:v', str(args.frames),
+                       '-f', 'null', '-']
+            wall, cpu = measure(command)
+            results.append(wall)
+            print(f'{path:<6} {name:<12} {wall:>8.2f} {cpu:>8.2f} {args.frames / wall:>8.1f}')
+        print(f'{path:<6} {"speedup":<12} {results[0] / results[1]:>8.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/image_probe.py
+"""Compare the pure-Python header probe with an ffprobe subprocess per image.
+
+Runs both over the JPEGs in tests/test_data plus PNG, GIF, WebP and AVIF
+copies made with ffmpeg, checks they agree on the dimensions and reports the
+median wall time and the CPU time of each, children included.
+
+Usage:
+    python -m benchmarks.image_probe [--iterations 50]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.ffmpeg import run_ffmpeg  # noqa: E402
+from app.probe import read_header  # noqa: E402
+from app.utils import probe_dimensions  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data')
+# Extra formats made from this image, with the encoder arguments for each
+SOURCE = os.path.join(TEST_DATA, 'image_1920x1080.jpg')
+CONVERSIONS = {
+    'png': [],
+    'gif': [],
+    'webp': ['-c:v', 'libwebp'],
+    'avif': ['-c:v', 'libaom-av1', '-still-picture', '1', '-cpu-used', '8']
+}
+
+def cpu_time():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def timed(fn, iterations):
+    samples = []
+    cpu = cpu_time()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, (cpu_time() - cpu) / iterations * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images = sorted(os.path.join(TEST_DATA, name) for name in os.listdir(TEST_DATA) if name.endswith('.jpg'))
+        for extension, encoder in CONVERSIONS.items():
+            path = os.path.join(tmp, f'image_1920x1080.{extension}')
+            run_ffmpeg(['ffmpeg', '-y', '-i', SOURCE, '-frames:v', '1'] + encoder + [path])
+            images.append(path)
+
+        print(f'{"image":<24} {"parser (ms)":>12} {"cpu":>8} {"ffprobe (ms)":>13} {"cpu":>8} {"speedup":>8}')
+        for path in images:
+            header = read_header(path)
+            if header.dimensions != probe_dimensions(path):
+                raise SystemExit(f'{path}: parser read {header.dimensions}, ffprobe {probe_dimensions(path)}')
+            parsed, parsed_cpu = timed(lambda: read_header(path), args.iterations)
+            probed, probed_cpu = timed(lambda: probe_dimensions(path), args.iterations)
+            print(f'{os.path.basename(path):<24} {parsed:>12.3f} {parsed_cpu:>8.3f} {probed:>13.2f} {probed_cpu:>8.2f} '
+                  f'{probed / parsed:>7.0f}x')
+
+if __name__ == '__main__':
+    main()
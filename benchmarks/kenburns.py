@@ -0,0 +1,75 @@
+# benchmarks/kenburns.py
+"""Compare the prescaled single-frame zoompan against the naive per-frame zoompan.
+
+The naive graph loops the full resolution source and runs zoompan on every
+decoded frame (``d=1``). The prescaled graph decodes the source once, scales
+it to the output size times the largest zoom and lets zoompan emit every
+frame from that picture. Output goes to the null muxer unless ``--encode``
+is given, so the numbers isolate the filter graph.
+
+Usage:
+    python -m benchmarks.kenburns [--input IMAGE] [--duration 10] [--framerate 30] [--encode]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.ffmpeg import run_ffmpeg, encoder_args  # noqa: E402
+from app.kenburns import motion_for, base_size, zoompan_filter  # noqa: E402
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'image_8000x8000.jpg')
+
+def measure(command):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    run_ffmpeg(command)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--input', default=DEFAULT_INPUT)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--framerate', type=int, default=30)
+    parser.add_argument('--zoom', type=int, default=50, help='Legacy zoom level, -100..100')
+    parser.add_argument('--encode', action='store_true', help='Encode with libx264 instead of discarding frames')
+    args = parser.parse_args()
+
+    motion = motion_for({'zoom': args.zoom})
+    frames = int(round(args.duration * args.framerate))
+    base_width, base_height = base_size(args.width, args.height, motion)
+
+    encoder = encoder_args('fast', still=False) if args.encode else []
+    naive_filter = 'format=yuv420p,' + zoompan_filter(
+        motion, frames, args.framerate, args.width, args.height, frame_var='in', duration_frames=1)
+    prescaled_filter = f'format=yuv420p,scale={base_width}:{base_height},' + zoompan_filter(
+        motion, frames, args.framerate, args.width, args.height)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, input_args, video_filter in (
+            ('naive', ['-loop', '1', '-i', args.input], naive_filter),
+            ('prescaled', ['-i', args.input], prescaled_filter)
+        ):
+            output = [os.path.join(tmp, f'{name}.mp4')] if args.encode else ['-f', 'null', '-']
+            command = ['ffmpeg'] + input_args + ['-vf', video_filter, '-frames:v', str(frames)] + encoder + output
+            results.append((name, measure(command)))
+
+    print(f'{frames} frames at {args.width}x{args.height}, zoom {args.zoom}, source {os.path.basename(args.input)}')
+    print(f'{"mode":<10} {"wall s":>8} {"cpu s":>8} {"fps":>8}')
+    for name, (wall, cpu) in results:
+        print(f'{name:<10} {wall:>8.2f} {cpu:>8.2f} {frames / wall:>8.1f}')
+    (_, (naive_wall, naive_cpu)), (_, (fast_wall, fast_cpu)) = results
+    print(f'speedup    {naive_wall / fast_wall:>8.1f}x wall, {naive_cpu / fast_cpu:.1f}x cpu')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# benchmarks/render_matrix.py
+"""Benchmark video renders across a matrix of render parameters.
+
+Each case times what ``create_video_task`` does to render an unsegmented
+video: building its ffmpeg commands (preparing a prescaled still included)
+and running them. The task's Redis-backed bookkeeping (status, tenant
+slots, cost model) is left out, so no Redis is needed and none of it lands
+in the timings. Every case runs in a fresh process so that the CPU time and peak RSS reported
+for the ffmpeg children belong to that case alone. Results are written as
+JSON and can be compared against a run from another commit.
+
+Usage:
+    python -m benchmarks.render_matrix --output results.json
+    python -m benchmarks.render_matrix --output new.json --compare old.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import itertools
+import subprocess
+import tempfile
+import multiprocessing
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+TEST_DATA = os.path.join(ROOT, 'tests', 'test_data')
+
+DEFAULT_INPUTS = ['image_800x450.jpg', 'image_1920x1080.jpg', 'image_8000x8000.jpg']
+DEFAULT_OUTPUTS = ['1280x720', '720x1280', '1080x1080']
+DEFAULT_MODES = ['crop', 'pad']
+DEFAULT_FRAMERATES = [30]
+DEFAULT_DURATIONS = [5, 30]
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def input_dimensions(path):
+    match = re.search(r'(\d+)x(\d+)', os.path.basename(path))
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    from app.utils import probe_dimensions
+    return probe_dimensions(path)
+
+
+def case_id(case):
+    return '{input}|{output}|{mode}|{framerate}fps|{duration}s|zoom{zoom}|{profile}'.format(**case)
+
+
+def run_case(case, queue):
+    """Child process entry point: render one case and report its measurements."""
+    from app.tasks import video_commands
+    from app.ffmpeg import run_ffmpeg
+    from app.prescale import prescale_cache
+
+    input_file = os.path.join(TEST_DATA, case['input'])
+    input_width, input_height = input_dimensions(input_file)
+    output_width, output_height = parse_size(case['output'])
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = os.path.join(tmp, 'output.mp4')
+        # Every case prepares its own prescaled frame, as a first render would
+        prescale_cache.root = os.path.join(tmp, 'prescaled')
+        data = {
+            'record_id': 'benchmark',
+            'framerate': case['framerate'],
+            'duration': case['duration'],
+            'zoom': case['zoom'],
+            'crop': case['mode'] == 'crop',
+            'profile': case['profile'],
+            'input_width': input_width,
+            'input_height': input_height,
+            'output_width': output_width,
+            'output_height': output_height,
+            'cached_input_file': input_file,
+            'output_file': output_file
+        }
+        start = time.perf_counter()
+        commands, _, _ = video_commands(data)
+        for command in commands:
+            run_ffmpeg(command)
+        wall = time.perf_counter() - start
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        queue.put({
+            'wall_s': round(wall, 3),
+            'cpu_s': round(usage.ru_utime + usage.ru_stime, 3),
+            # ru_maxrss is in kilobytes on Linux
+            'max_rss_kb': usage.ru_maxrss,
+            'output_bytes': os.path.getsize(output_file)
+        })
+
+
+def measure(case):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=run_case, args=(case, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {'error': f'exit code {process.exitcode}'}
+    return queue.get()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r['id']: r for r in json.load(f)['results']}
+    print(f'\n{"case":<60} {"wall":>8} {"cpu":>8} {"rss":>8} {"bytes":>8}')
+    for result in results:
+        base = baseline.get(result['id'])
+        if base is None or 'error' in base or 'error' in result:
+            continue
+        ratios = [
+            result[key] / base[key] if base[key] else float('nan')
+            for key in ('wall_s', 'cpu_s', 'max_rss_kb', 'output_bytes')
+        ]
+        print(f'{result["id"]:<60} ' + ' '.join(f'{ratio:>7.2f}x' for ratio in ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark video renders across a parameter matrix.')
+    parser.add_argument('--inputs', default=','.join(DEFAULT_INPUTS), help='Comma-separated files in tests/test_data')
+    parser.add_argument('--outputs', default=','.join(DEFAULT_OUTPUTS), help='Comma-separated WxH sizes')
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES), help='crop and/or pad')
+    parser.add_argument('--framerates', default=','.join(map(str, DEFAULT_FRAMERATES)))
+    parser.add_argument('--durations', default=','.join(map(str, DEFAULT_DURATIONS)))
+    parser.add_argument('--zooms', default='0')
+    parser.add_argument('--profiles', default='balanced')
+    parser.add_argument('--output', default='render_matrix.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    axes = itertools.product(
+        args.inputs.split(','),
+        args.outputs.split(','),
+        args.modes.split(','),
+        [int(v) for v in args.framerates.split(',')],
+        [float(v) for v in args.durations.split(',')],
+        [int(v) for v in args.zooms.split(',')],
+        args.profiles.split(',')
+    )
+
+    results = []
+    for input_name, output, mode, framerate, duration, zoom, profile in axes:
+        case = {
+            'input': input_name,
+            'output': output,
+            'mode': mode,
+            'framerate': framerate,
+            'duration': duration,
+            'zoom': zoom,
+            'profile': profile
+        }
+        case['id'] = case_id(case)
+        case.update(measure(case))
+        results.append(case)
+        if 'error' in case:
+            print(f'{case["id"]:<60} {case["error"]}')
+        else:
+            print(f'{case["id"]:<60} {case["wall_s"]:>7.2f}s {case["cpu_s"]:>7.2f}s '
+                  f'{case["max_rss_kb"] / 1024:>7.1f}MB {case["output_bytes"]:>10}B')
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'host': platform.node(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.split('\n')[0],
+            'results': results
+        }, f, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
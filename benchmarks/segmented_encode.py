@@ -0,0 +1,84 @@
+# benchmarks/segmented_encode.py
+"""Compare a single-process motion encode with segments encoded in parallel and joined by stream copy.
+
+Worker processes stand in for render nodes, so the parallel wall time shows
+how tail latency scales with the number of nodes on this machine's cores.
+
+Usage:
+    python -m benchmarks.segmented_encode [--duration 60] [--size 3840x2160] [--workers 4]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.ffmpeg import run_ffmpeg, motion_command, encoder_args  # noqa: E402
+from app.kenburns import motion_for  # noqa: E402
+from app.segments import segment_ranges  # noqa: E402
+from app.tasks import render_segment_task, merge_segments_task, motion_video_filter  # noqa: E402
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'image_1920x1080.jpg')
+
+def render_segment(args):
+    return render_segment_task(*args)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--input', default=DEFAULT_INPUT)
+    parser.add_argument('--size', default='3840x2160')
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--framerate', type=int, default=30)
+    parser.add_argument('--segment', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--profile', default='fast')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    frames = int(round(args.duration * args.framerate))
+    ranges = segment_ranges(frames, args.framerate, args.segment)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = {
+            'record_id': 'benchmark',
+            'framerate': args.framerate,
+            'duration': args.duration,
+            'zoom': 50,
+            'crop': False,
+            'profile': args.profile,
+            'input_width': 1920,
+            'input_height': 1080,
+            'output_width': width,
+            'output_height': height,
+            'cached_input_file': args.input,
+            'output_file': os.path.join(tmp, 'segmented.mp4'),
+            'request_host': 'localhost'
+        }
+
+        start = time.perf_counter()
+        command = motion_command(args.input, motion_video_filter(data, motion_for(data), frames), frames,
+                                 args.framerate, os.path.join(tmp, 'single.mp4'),
+                                 encoder=encoder_args(args.profile, still=False))
+        run_ffmpeg(command)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            segment_files = list(pool.map(render_segment, [
+                (data, index, first_frame, count, frames) for index, (first_frame, count) in enumerate(ranges)
+            ]))
+        encoded = time.perf_counter() - start
+        merge_segments_task(segment_files, data, None)
+        segmented = time.perf_counter() - start
+
+    print(f'{frames} frames at {width}x{height}, {len(ranges)} segments, {args.workers} workers')
+    print(f'{"mode":<10} {"wall s":>8}')
+    print(f'{"single":<10} {single:>8.2f}')
+    print(f'{"segmented":<10} {segmented:>8.2f}  (merge {segmented - encoded:.2f})')
+    print(f'speedup    {single / segmented:>8.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/still_encode.py
+"""Compare the full still-image encode against the looped-segment encode.
+
+The ``prescaled`` row loops a segment encoded from a raw frame prepared at
+the output size, including the one-off run that prepares it.
+
+Usage:
+    python -m benchmarks.still_encode [--input IMAGE] [--duration 60] [--framerate 60]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.ffmpeg import run_ffmpeg, still_image_command, looped_still_commands  # noqa: E402
+from app.prescale import prescale_command, prescale_filter  # noqa: E402
+from app.probe import read_header  # noqa: E402
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'image_1920x1080.jpg')
+
+def measure(commands):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    for command in commands:
+        run_ffmpeg(command)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--input', default=DEFAULT_INPUT)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--framerate', type=int, default=60)
+    parser.add_argument('--segment', type=float, default=2)
+    args = parser.parse_args()
+
+    video_filter = f'format=yuv420p,scale={args.width}:{args.height}'
+    with tempfile.TemporaryDirectory() as tmp:
+        full_output = os.path.join(tmp, 'full.mp4')
+        looped_output = os.path.join(tmp, 'looped.mp4')
+
+        full = measure([still_image_command(args.input, video_filter, args.duration, args.framerate, full_output)])
+        commands, segment_file = looped_still_commands(
+            args.input, video_filter, args.duration, args.framerate, looped_output, args.segment)
+        looped = measure(commands)
+
+        header = read_header(args.input)
+        frame_file = os.path.join(tmp, 'frame.yuv')
+        prescale = prescale_command(args.input, prescale_filter(*header.dimensions, header.orientation, args.width,
+                                                                args.height, False), frame_file)
+        prescaled_output = os.path.join(tmp, 'prescaled.mp4')
+        commands, segment_file = looped_still_commands(
+            frame_file, None, args.duration, args.framerate, prescaled_output, args.segment,
+            raw_size=(args.width, args.height))
+        prescaled = measure([prescale] + commands)
+
+        print(f'{"mode":<10} {"wall s":>8} {"cpu s":>8} {"bytes":>10}')
+        for name, (wall, cpu), path in (('full', full, full_output), ('looped', looped, looped_output),
+                                        ('prescaled', prescaled, prescaled_output)):
+            print(f'{name:<10} {wall:>8.2f} {cpu:>8.2f} {os.path.getsize(path):>10}')
+        print(f'speedup    {full[0] / looped[0]:>8.1f}x wall, {full[1] / looped[1]:.1f}x cpu (looped)')
+        print(f'speedup    {full[0] / prescaled[0]:>8.1f}x wall, {full[1] / prescaled[1]:.1f}x cpu (prescaled)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/task_startup.py
+"""Per-task startup cost: a Flask app built for every task vs. one per worker process.
+
+Times the app setup alone, then a short clip through create_video_task both
+ways, so the fixed overhead can be read against real render time.
+
+Usage:
+    python -m benchmarks.task_startup [--iterations 50] [--clips 5] [--duration 1]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app  # noqa: E402
+from app.celery_app import get_flask_app  # noqa: E402
+from app.tasks import create_video_task  # noqa: E402
+from app.prescale import prescale_cache  # noqa: E402
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'image_800x450.jpg')
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--input', default=DEFAULT_INPUT)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--clips', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=1)
+    args = parser.parse_args()
+
+    per_task = timed(create_app, args.iterations)
+    get_flask_app()
+    per_process = timed(get_flask_app, args.iterations)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = {
+            'record_id': 'benchmark',
+            'framerate': 30,
+            'duration': args.duration,
+            'zoom': 0,
+            'crop': True,
+            'input_width': 800,
+            'input_height': 450,
+            'output_width': 640,
+            'output_height': 360,
+            'cached_input_file': args.input,
+            'request_host': 'localhost'
+        }
+        outputs = iter(range(2 * args.clips))
+
+        def job():
+            clip = next(outputs)
+            # A fresh prescale cache per clip, so neither variant reuses a frame prepared by the other
+            prescale_cache.root = os.path.join(tmp, f'prescaled{clip}')
+            return dict(data, output_file=os.path.join(tmp, f'output{clip}.mp4'))
+
+        clip_per_task = timed(lambda: create_video_task(job(), flask_app=create_app()), args.clips)
+        clip_per_process = timed(lambda: create_video_task(job()), args.clips)
+
+    print(f'{"":<22} {"per task":>10} {"per process":>12}')
+    print(f'{"app setup (ms)":<22} {per_task:>10.2f} {per_process:>12.4f}')
+    print(f'{f"{args.duration:g}s clip (ms)":<22} {clip_per_task:>10.1f} {clip_per_process:>12.1f}')
+    print(f'saving per task: {clip_per_task - clip_per_process:.1f} ms '
+          f'({(clip_per_task - clip_per_process) / clip_per_task:.1%} of a short clip)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# tests/test_cache.py
+import io
+import os
+import time
+import pytest
+
+from app.config import Config
+from app.cache import InputCache, InputError
+
+INPUT_URL = 'http://example.com/image.jpg'
+
+@pytest.fixture
+def mock_probe(mocker):
+    return mocker.patch('app.probe.probe_dimensions', return_value=(1024, 768))
+
+@pytest.fixture
+def input_cache(tmp_path):
+    return InputCache(root=str(tmp_path), max_bytes=1024 * 1024, min_age=0)
+
+def test_fetch_downloads_and_probes(input_cache, mock_probe, requests_mock):
+    requests_mock.get(INPUT_URL, content=b'image-bytes', headers={'ETag': '"v1"'})
+
+    entry = input_cache.fetch(INPUT_URL)
+
+    assert entry.width is None
+    with open(entry.path, 'rb') as f:
+        assert f.read() == b'image-bytes'
+    assert input_cache.probe(entry.sha256) == (1024, 768)
+    assert input_cache.probe(entry.sha256) == (1024, 768)
+    mock_probe.assert_called_once()
+
+def test_fetch_revalidates_with_etag(input_cache, mock_probe, requests_mock):
+    requests_mock.get(INPUT_URL, content=b'image-bytes', headers={'ETag': '"v1"'})
+    first = input_cache.fetch(INPUT_URL)
+    input_cache.probe(first.sha256)
+
+    requests_mock.get(INPUT_URL, status_code=304)
+    second = input_cache.fetch(INPUT_URL)
+
+    assert requests_mock.last_request.headers['If-None-Match'] == '"v1"'
+    assert second.path == first.path
+    assert second.width == 1024
+    mock_probe.assert_called_once()
+
+def test_fetch_without_cache_skips_validators(input_cache, mock_probe, requests_mock):
+    requests_mock.get(INPUT_URL, content=b'image-bytes', headers={'ETag': '"v1"'})
+    first = input_cache.fetch(INPUT_URL)
+    input_cache.probe(first.sha256)
+    second = input_cache.fetch(INPUT_URL, use_cache=False)
+
+    assert 'If-None-Match' not in requests_mock.last_request.headers
+    # Identical content resolves to the same blob without another probe
+    assert second.path == first.path
+    assert second.width == 1024
+    mock_probe.assert_called_once()
+
+def test_fetch_rejects_large_file(input_cache, mock_probe, requests_mock):
+    requests_mock.get(INPUT_URL, content=b'x', headers={'content-length': str(11 * 1024 * 1024)})
+
+    with pytest.raises(InputError):
+        input_cache.fetch(INPUT_URL)
+
+def test_fetch_aborts_body_over_limit_without_content_length(input_cache, mock_probe, requests_mock):
+    requests_mock.get(INPUT_URL, body=io.BytesIO(b'x' * 11 * 1024 * 1024))
+
+    with pytest.raises(InputError, match='too large'):
+        input_cache.fetch(INPUT_URL)
+
+    assert os.listdir(os.path.join(input_cache.root, 'tmp')) == []
+
+def test_fetch_reads_dimensions_from_image_header(input_cache, mock_probe, requests_mock):
+    with open(os.path.join(os.path.dirname(__file__), 'test_data', 'image_800x450.jpg'), 'rb') as f:
+        requests_mock.get(INPUT_URL, content=f.read())
+
+    entry = input_cache.fetch(INPUT_URL)
+
+    assert (entry.width, entry.height) == (800, 450)
+    assert input_cache.probe(entry.sha256) == (800, 450)
+    mock_probe.assert_not_called()
+
+def test_fetch_header_probe_can_be_disabled(input_cache, mock_probe, requests_mock, monkeypatch):
+    monkeypatch.setattr(Config, 'INPUT_HEADER_PROBE', False)
+    with open(os.path.join(os.path.dirname(__file__), 'test_data', 'image_800x450.jpg'), 'rb') as f:
+        requests_mock.get(INPUT_URL, content=f.read())
+
+    entry = input_cache.fetch(INPUT_URL)
+
+    assert entry.width is None
+
+def test_evict_removes_least_recently_used(tmp_path, mock_probe, requests_mock):
+    input_cache = InputCache(root=str(tmp_path), max_bytes=10, min_age=0)
+    requests_mock.get('http://example.com/a.jpg', content=b'a' * 8)
+    requests_mock.get('http://example.com/b.jpg', content=b'b' * 8)
+
+    old = input_cache.fetch('http://example.com/a.jpg')
+    os.utime(old.path, (time.time() - 60, time.time() - 60))
+    new = input_cache.fetch('http://example.com/b.jpg')
+
+    assert not os.path.exists(old.path)
+    assert os.path.exists(new.path)
@@ -0,0 +1,100 @@
+# tests/test_cost_model.py
+import pytest
+from unittest.mock import MagicMock
+
+from app.config import Config
+from app import cost_model
+
+
+class FakeModelStore:
+    """The Redis hash operations the cost model uses, kept in a dict."""
+
+    def __init__(self):
+        self.hash = {}
+
+    def hgetall(self, key):
+        return {field.encode(): str(value).encode() for field, value in self.hash.items()}
+
+    def pipeline(self):
+        pipe = MagicMock()
+        pipe.hincrbyfloat.side_effect = lambda key, field, value: self.hash.__setitem__(
+            field, self.hash.get(field, 0.0) + value)
+        return pipe
+
+
+@pytest.fixture
+def store(mocker):
+    store = FakeModelStore()
+    mocker.patch('app.cost_model.get_redis', return_value=store)
+    return store
+
+
+def request(duration=10, width=1280, height=720, crop=False, zoom=0):
+    return {
+        'duration': duration,
+        'framerate': 30,
+        'output_width': width,
+        'output_height': height,
+        'input_width': 1920,
+        'input_height': 1080,
+        'crop': crop,
+        'zoom': zoom
+    }
+
+
+def test_solve():
+    assert cost_model._solve([[2.0, 1.0], [1.0, 3.0]], [3.0, 5.0]) == pytest.approx([0.8, 1.4])
+
+
+def test_predict_uses_prior_until_enough_samples(store, monkeypatch):
+    monkeypatch.setattr(Config, 'RENDER_PIXEL_RATE', 1e6)
+    monkeypatch.setattr(Config, 'COST_MODEL_MIN_SAMPLES', 5)
+
+    prediction = cost_model.predict(request(duration=1, width=1000, height=1000))
+
+    assert prediction['seconds'] == pytest.approx(31)
+
+
+def test_observed_renders_fit_the_model(store, monkeypatch):
+    monkeypatch.setattr(Config, 'COST_MODEL_MIN_SAMPLES', 5)
+    monkeypatch.setattr(Config, 'COST_MODEL_RIDGE', 1e-9)
+
+    def frame_mp(data):
+        return data['duration'] * 30 * data['output_width'] * data['output_height'] / 1e6
+
+    def seconds(data):
+        return 0.5 + 0.01 * frame_mp(data) + (0.03 * frame_mp(data) if data['zoom'] else 0)
+
+    samples = [request(duration, width, height, crop, zoom)
+               for duration in (2, 10, 30) for width, height in ((640, 360), (1920, 1080))
+               for crop in (False, True) for zoom in (0, 50)]
+    for data in samples:
+        cost_model.observe(data, seconds(data), 2000 + 50 * frame_mp(data))
+
+    target = request(duration=20, width=1280, height=720, zoom=50)
+    prediction = cost_model.predict(target)
+
+    assert prediction['seconds'] == pytest.approx(seconds(target), rel=1e-3)
+    assert prediction['bytes'] == pytest.approx(2000 + 50 * frame_mp(target), rel=1e-3)
+
+
+def test_render_queue_sends_long_renders_to_large_pool(monkeypatch):
+    monkeypatch.setattr(Config, 'LARGE_RENDER_SECONDS', 60)
+
+    assert cost_model.render_queue({'seconds': 59}) == 'render'
+    assert cost_model.render_queue({'seconds': 60}) == 'render_large'
+
+
+def test_estimate_adds_queue_wait(store, mocker, monkeypatch):
+    monkeypatch.setattr(Config, 'RENDER_CONCURRENCY', 2)
+    store.hash.update({'n': 4.0, 'xy:seconds:0': 40.0})
+    broker = MagicMock()
+    broker.pipeline.return_value.execute.return_value = [3] + [1] * 9
+    mocker.patch('app.cost_model.redis.Redis.from_url', return_value=broker)
+    data = request(duration=1, width=640, height=360)
+
+    estimate = cost_model.estimate(data)
+
+    # 12 waiting renders averaging 10 s over 2 workers
+    assert estimate['eta_seconds'] == pytest.approx(60 + estimate['estimated_seconds'], abs=0.1)
+    assert data['render_queue'] == 'render'
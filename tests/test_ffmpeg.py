@@ -0,0 +1,69 @@
+# tests/test_ffmpeg.py
+import os
+
+from app.config import Config
+from app.ffmpeg import encoder_args, looped_still_commands, still_image_command, motion_command, _read_progress
+
+def test_encoder_args_profiles():
+    args = encoder_args('fast')
+    assert args[args.index('-preset') + 1] == 'veryfast'
+    assert args[args.index('-crf') + 1] == '26'
+    assert args[args.index('-tune') + 1] == 'stillimage'
+
+    archive = encoder_args('archive')
+    assert archive[archive.index('-preset') + 1] == 'slow'
+
+def test_encoder_args_worker_defaults(monkeypatch):
+    monkeypatch.setattr(Config, 'DEFAULT_ENCODER_PROFILE', 'fast')
+    monkeypatch.setattr(Config, 'ENCODER_THREADS', 2)
+    args = encoder_args()
+    assert args[args.index('-preset') + 1] == 'veryfast'
+    assert args[args.index('-threads') + 1] == '2'
+
+def test_encoder_args_skips_stillimage_tune_for_motion():
+    assert '-tune' not in encoder_args('balanced', still=False)
+
+def test_looped_still_commands():
+    commands, segment_file = looped_still_commands(
+        'input.jpg', 'format=yuv420p', 60, 30, 'movies/output.mp4', 2, encoder=encoder_args('fast'))
+
+    encode, loop = commands
+    assert segment_file == 'movies/.output.mp4.segment.mp4'
+    assert encode[-1] == segment_file
+    assert encode[encode.index('-g') + 1] == '60'
+    assert encode[encode.index('-t') + 1] == '2'
+    assert loop == ['ffmpeg', '-stream_loop', '-1', '-i', segment_file, '-c', 'copy', '-t', '60', 'movies/output.mp4']
+
+def test_still_image_command_loops_prescaled_raw_frame():
+    command = still_image_command('frame.yuv', None, 2, 30, 'output.mp4', raw_size=(640, 360))
+
+    assert command[:command.index('-i') + 2] == [
+        'ffmpeg', '-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-s', '640x360', '-framerate', '30', '-stream_loop', '-1',
+        '-i', 'frame.yuv'
+    ]
+    assert '-vf' not in command
+    assert '-loop' not in command
+
+def test_read_progress_publishes_each_block():
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, (
+        b'frame=30\nfps=29.9\nbitrate=N/A\nout_time_us=1000000\nout_time=00:00:01.000000\nspeed=1.2x\nprogress=continue\n'
+        b'frame=60\nfps=30.0\nout_time_us=2000000\nout_time=00:00:02.000000\nspeed=1.3x\nprogress=end\n'
+    ))
+    os.close(write_fd)
+    updates = []
+
+    _read_progress(read_fd, updates.append, {'last_update': 0})
+
+    assert [u['frame'] for u in updates] == ['30', '60']
+    assert updates[-1] == {
+        'frame': '60', 'fps': '30.0', 'out_time_us': '2000000', 'out_time': '00:00:02.000000',
+        'speed': '1.3x', 'progress': 'end'
+    }
+
+def test_motion_command_decodes_input_once():
+    command = motion_command('input.jpg', 'zoompan=d=300', 300, 30, 'output.mp4', encoder=encoder_args('fast', still=False))
+
+    assert '-loop' not in command
+    assert command[command.index('-frames:v') + 1] == '300'
+    assert command[-1] == 'output.mp4'
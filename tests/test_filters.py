@@ -0,0 +1,51 @@
+# tests/test_filters.py
+from app.filters import FilterChain, framed_chain, motion_chain
+from app.kenburns import motion_for
+
+
+def test_framed_chain_crops_then_converts_without_final_scale():
+    assert str(framed_chain(4000, 3000, 1280, 720, True)) == 'crop=1280:720:1360:1140,format=yuv420p'
+
+
+def test_framed_chain_scales_once_before_padding():
+    # Converted at the fitted size, before the pad makes the frame larger again
+    assert str(framed_chain(4000, 3000, 1280, 720, False)) == 'scale=960:720,format=yuv420p,pad=1280:720:160:0'
+
+
+def test_framed_chain_converts_before_upscaling():
+    assert str(framed_chain(800, 450, 1280, 720, True)) == 'format=yuv420p,scale=1280:720'
+    assert str(framed_chain(800, 450, 1280, 720, False)) == 'format=yuv420p,scale=1280:720'
+
+
+def test_framed_chain_for_matching_sizes_only_converts():
+    assert str(framed_chain(1280, 720, 1280, 720, True)) == 'format=yuv420p'
+    assert str(framed_chain(1280, 720, 1280, 720, False)) == 'format=yuv420p'
+
+
+def test_fit_keeps_padded_picture_even():
+    assert str(framed_chain(1003, 1000, 1280, 720, False)) == 'scale=722:720,format=yuv420p,pad=1280:720:279:0'
+
+
+def test_canonical_merges_consecutive_scales_and_formats():
+    chain = FilterChain(1920, 1080).format('yuv420p').format('yuv420p').scale(960, 540).scale(640, 360)
+
+    assert str(chain) == 'scale=640:360,format=yuv420p'
+
+
+def test_canonical_drops_conversion_already_applied():
+    chain = FilterChain(1920, 1080).format('yuv420p').filter('fps=30').filter('setsar=1').format('yuv420p')
+
+    assert str(chain) == 'format=yuv420p,fps=30,setsar=1'
+
+
+def test_format_is_not_moved_past_other_filters():
+    chain = FilterChain(1920, 1080).format('yuv420p').filter('tpad=stop_mode=clone:stop_duration=2').scale(640, 360)
+
+    assert str(chain) == 'format=yuv420p,tpad=stop_mode=clone:stop_duration=2,scale=640:360'
+
+
+def test_motion_chain_converts_before_scaling_to_largest_zoom():
+    chain = motion_chain(4000, 3000, 1280, 720, True, motion_for({'zoom': 50}), 'zoompan=d=300:s=1280x720')
+
+    assert str(chain) == 'crop=1280:720:1360:1140,format=yuv420p,scale=1920:1080,zoompan=d=300:s=1280x720'
+    assert (chain.width, chain.height) == (1280, 720)
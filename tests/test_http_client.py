@@ -0,0 +1,73 @@
+# tests/test_http_client.py
+import threading
+import pytest
+import requests
+from unittest.mock import MagicMock
+
+from app import http_client
+
+def streamed_response(chunks, headers=None, status_code=200, fail_after=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response.request.url = 'http://example.com/image.jpg'
+    response.request.headers = {'User-Agent': 'test'}
+
+    def iter_content(chunk_size):
+        for index, chunk in enumerate(chunks):
+            if fail_after is not None and index == fail_after:
+                raise requests.exceptions.ChunkedEncodingError('connection reset')
+            yield chunk
+    response.iter_content.side_effect = iter_content
+    return response
+
+def test_iter_content_resumes_with_range(mocker):
+    first = streamed_response([b'abc', b'def', b'ghi'], fail_after=2,
+                              headers={'Accept-Ranges': 'bytes', 'ETag': '"v1"'})
+    rest = streamed_response([b'ghi'], status_code=206)
+    mock_get = mocker.patch.object(http_client.get_session(), 'get', return_value=rest)
+
+    assert b''.join(http_client.iter_content(first)) == b'abcdefghi'
+    headers = mock_get.call_args.kwargs['headers']
+    assert headers['Range'] == 'bytes=6-'
+    assert headers['If-Range'] == '"v1"'
+
+def test_iter_content_does_not_resume_without_validator(mocker):
+    first = streamed_response([b'abc', b'def'], fail_after=1, headers={'Accept-Ranges': 'bytes'})
+    mock_get = mocker.patch.object(http_client.get_session(), 'get')
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        b''.join(http_client.iter_content(first))
+    mock_get.assert_not_called()
+
+def test_iter_content_gives_up_when_range_is_ignored(mocker):
+    first = streamed_response([b'abc', b'def'], fail_after=1, headers={'Accept-Ranges': 'bytes', 'ETag': '"v1"'})
+    mocker.patch.object(http_client.get_session(), 'get', return_value=streamed_response([b'abcdef']))
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        b''.join(http_client.iter_content(first))
+
+def test_session_is_shared():
+    assert http_client.get_session() is http_client.get_session()
+
+def test_origin_slot_limits_concurrency(monkeypatch):
+    monkeypatch.setattr(http_client.Config, 'HTTP_MAX_PER_HOST', 1)
+    http_client._origin_slots.clear()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with http_client.origin_slot('http://example.com/a.jpg'):
+            entered.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait(5)
+    slot = http_client._origin_slots['http://example.com']
+    assert not slot.acquire(blocking=False)
+    release.set()
+    holder.join()
+    assert slot.acquire(blocking=False)
+    slot.release()
+    http_client._origin_slots.clear()
@@ -0,0 +1,64 @@
+# tests/test_kenburns.py
+from app.kenburns import motion_for, base_size, zoompan_filter, MAX_ZOOM, MAX_BASE_PIXELS
+from app.validations import validate_json
+
+def test_motion_for_still_clip():
+    assert motion_for({'zoom': 0}) is None
+
+def test_motion_for_maps_legacy_zoom():
+    zoom_in = motion_for({'zoom': 50})
+    assert [k['zoom'] for k in zoom_in['keyframes']] == [1.0, 1.5]
+    assert [k['at'] for k in zoom_in['keyframes']] == [0.0, 1.0]
+
+    zoom_out = motion_for({'zoom': -100})
+    assert [k['zoom'] for k in zoom_out['keyframes']] == [2.0, 1.0]
+
+def test_motion_for_fills_keyframe_defaults():
+    motion = motion_for({'zoom': 0, 'motion': {
+        'keyframes': [{'zoom': 2, 'at': 0.5}, {'zoom': 1, 'at': 0.2}],
+        'focus': {'x': 0.25},
+        'easing': 'ease-in-out'
+    }})
+
+    keyframes = motion['keyframes']
+    assert [k['at'] for k in keyframes] == [0.0, 0.2, 0.5, 1.0]
+    assert [k['zoom'] for k in keyframes] == [1.0, 1.0, 2.0, 2.0]
+    assert all(k['x'] == 0.25 and k['y'] == 0.5 for k in keyframes)
+    assert motion['easing'] == 'ease-in-out'
+
+def test_base_size_covers_largest_zoom():
+    motion = motion_for({'zoom': 0, 'motion': {'keyframes': [{'zoom': 1}, {'zoom': 1.5}]}})
+    assert base_size(1280, 720, motion) == (1920, 1080)
+    assert base_size(641, 361, motion) == (962, 542)
+
+def test_base_size_is_capped_at_max_zoom():
+    motion = motion_for({'zoom': 0, 'motion': {'keyframes': [{'zoom': 1}, {'zoom': MAX_ZOOM}]}})
+
+    width, height = base_size(1920, 1080, motion)
+
+    assert (width, height) == (7680, 4320)
+    assert width * height <= MAX_BASE_PIXELS
+    # Outputs already past the budget are never shrunk below their own size
+    assert base_size(8192, 8192, motion) == (8192, 8192)
+
+def test_zoompan_filter_renders_whole_clip_from_one_frame():
+    video_filter = zoompan_filter(motion_for({'zoom': 50}), 300, 30, 1280, 720)
+
+    assert video_filter.startswith("zoompan=z='if(lt(on,299),1+(0.5)*(on-0)/299,1.5)'")
+    assert ':d=300:s=1280x720:fps=30' in video_filter
+    assert "x='clip((0.5)*iw-iw/zoom/2,0,iw-iw/zoom)'" in video_filter
+
+def test_motion_schema():
+    data = {
+        'record_id': 'abc',
+        'input_url': 'http://example.com/image.jpg',
+        'webhook_url': 'http://example.com/webhook',
+        'framerate': 30,
+        'duration': 10,
+        'cache': True,
+        'output_width': 1024,
+        'output_height': 1024
+    }
+    assert validate_json(dict(data, motion={'keyframes': [{'zoom': 1}, {'zoom': 2, 'x': 0.3}]}))[0] == True
+    assert validate_json(dict(data, motion={'keyframes': [{'zoom': 0.5}]}))[0] == False
+    assert validate_json(dict(data, motion={'keyframes': [{'zoom': 1}], 'easing': 'bounce'}))[0] == False
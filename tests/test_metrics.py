@@ -0,0 +1,60 @@
+# tests/test_metrics.py
+import pytest
+
+from prometheus_client import REGISTRY
+
+from app import create_app
+from app.config import Config
+from app.metrics import time_stage, tenant_label, QueueDepthCollector
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / 'movies' / 'tenant1').mkdir(parents=True)
+    monkeypatch.setattr(Config, 'MOVIES_DIR', str(tmp_path / 'movies'))
+    app = create_app()
+    app.config['TESTING'] = True
+    return app.test_client()
+
+def test_time_stage_observes_labels():
+    data = {'api_key': 'tenant1', 'output_width': 1280, 'output_height': 720}
+    labels = {'stage': 'fetch', 'tenant': tenant_label('tenant1'), 'resolution': '1280x720'}
+    before = REGISTRY.get_sample_value('json2video_stage_seconds_count', labels) or 0
+
+    with time_stage('fetch', data):
+        pass
+
+    assert REGISTRY.get_sample_value('json2video_stage_seconds_count', labels) == before + 1
+
+def mock_broker(mocker, lengths):
+    pipe = mocker.patch('app.metrics.redis.Redis.from_url').return_value.pipeline.return_value
+    names = []
+    pipe.llen.side_effect = names.append
+    pipe.execute.side_effect = lambda: [lengths.get(name, 0) for name in names]
+
+def test_queue_depth_collector_counts_priority_lists(mocker):
+    mock_broker(mocker, {'fetch': 3, 'render': 7, 'render:3': 2, 'render:6': 4})
+
+    samples = list(QueueDepthCollector(['fetch', 'render']).collect())[0].samples
+
+    assert [(s.labels['queue'], s.value) for s in samples] == [('fetch', 3), ('render', 13)]
+
+def test_tenant_label_hides_api_key():
+    assert tenant_label('tenant1') == tenant_label('tenant1')
+    assert 'tenant1' not in tenant_label('tenant1')
+    assert tenant_label(None) == 'unknown'
+
+def test_metrics_endpoint(client, mocker):
+    mock_broker(mocker, {})
+    with time_stage('fetch', {'api_key': 'tenant1', 'output_width': 1280, 'output_height': 720}):
+        pass
+
+    response = client.get('/metrics', headers={'x-api-key': 'tenant1'})
+
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'json2video_stage_seconds' in body
+    assert 'json2video_queue_depth{queue="render"} 0.0' in body
+    assert 'tenant1' not in body
+
+def test_metrics_endpoint_requires_api_key(client):
+    assert client.get('/metrics').status_code == 400
@@ -0,0 +1,100 @@
+# tests/test_prescale.py
+import os
+import time
+import struct
+import pytest
+
+from app import prescale
+from app.prescale import PrescaleCache, prescale_filter, oriented_size
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+@pytest.fixture
+def prescale_cache(tmp_path):
+    return PrescaleCache(root=str(tmp_path), max_bytes=1024 * 1024 * 1024, min_age=0)
+
+
+def still(input_file, width, height, output_width, output_height, crop=True, **fields):
+    return dict({
+        'crop': crop,
+        'input_width': width,
+        'input_height': height,
+        'output_width': output_width,
+        'output_height': output_height,
+        'cached_input_file': input_file
+    }, **fields)
+
+
+def with_orientation(source, target, orientation):
+    """Copy a JPEG with an EXIF APP1 segment carrying ``orientation``."""
+    tiff = b'MM' + struct.pack('>HIH', 42, 8, 1) + struct.pack('>HHIHH', 0x0112, 3, 1, orientation, 0) + b'\0' * 4
+    payload = b'Exif\0\0' + tiff
+    with open(source, 'rb') as f:
+        data = f.read()
+    with open(target, 'wb') as f:
+        f.write(data[:2] + b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload + data[2:])
+    return str(target)
+
+
+def test_oriented_size_turns_sideways_orientations():
+    assert oriented_size(4000, 3000, 1) == (4000, 3000)
+    assert oriented_size(4000, 3000, 3) == (4000, 3000)
+    assert oriented_size(4000, 3000, 6) == (3000, 4000)
+    assert oriented_size(4000, 3000, 8) == (3000, 4000)
+
+
+def test_prescale_filter_frames_the_upright_picture_then_converts_at_output_size():
+    video_filter = prescale_filter(4000, 3000, 6, 1080, 1920, True)
+
+    # The crop is centred on the rotated 3000x4000 picture and already has the output size
+    assert video_filter == 'transpose=clock,crop=1080:1920:960:1040,format=yuv420p'
+
+
+def test_prescale_filter_skips_framing_for_matching_sizes():
+    assert prescale_filter(1280, 720, 1, 1280, 720, False) == 'format=yuv420p'
+
+
+def test_prepare_writes_raw_output_frame_once(prescale_cache, mocker):
+    spy = mocker.spy(prescale, 'run_ffmpeg')
+    data = still(os.path.join(TEST_DATA, 'image_1920x1080.jpg'), 1920, 1080, 640, 360, input_sha256='a' * 64)
+
+    first = prescale_cache.prepare(data)
+    second = prescale_cache.prepare(dict(data, cached_input_file='moved.jpg'))
+
+    assert first == second
+    assert os.path.getsize(first) == 640 * 360 * 3 // 2
+    assert spy.call_count == 1
+
+
+def test_prepare_keys_frames_by_framing(prescale_cache):
+    input_file = os.path.join(TEST_DATA, 'image_800x450.jpg')
+
+    cropped = prescale_cache.prepare(still(input_file, 800, 450, 450, 450, crop=True))
+    padded = prescale_cache.prepare(still(input_file, 800, 450, 450, 450, crop=False))
+
+    assert cropped != padded
+
+
+def test_prepare_applies_exif_orientation(prescale_cache, tmp_path, mocker):
+    spy = mocker.spy(prescale, 'run_ffmpeg')
+    input_file = with_orientation(os.path.join(TEST_DATA, 'image_800x450.jpg'), tmp_path / 'portrait.jpg', 6)
+
+    frame = prescale_cache.prepare(still(input_file, 800, 450, 450, 800, crop=False))
+
+    command = spy.call_args[0][0]
+    assert '-noautorotate' in command
+    assert command[command.index('-vf') + 1].startswith('transpose=clock,')
+    assert os.path.getsize(frame) == 450 * 800 * 3 // 2
+
+
+def test_evict_removes_least_recently_used_frames(tmp_path):
+    prescale_cache = PrescaleCache(root=str(tmp_path), max_bytes=640 * 360 * 3 // 2, min_age=0)
+    input_file = os.path.join(TEST_DATA, 'image_1920x1080.jpg')
+
+    old = prescale_cache.prepare(still(input_file, 1920, 1080, 640, 360, input_sha256='a' * 64))
+    os.utime(old, (time.time() - 60, time.time() - 60))
+    new = prescale_cache.prepare(still(input_file, 1920, 1080, 640, 360, input_sha256='b' * 64))
+
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
@@ -0,0 +1,277 @@
+# tests/test_probe.py
+import os
+import random
+import struct
+import pytest
+
+from app.probe import HeaderParser, read_header, probe_image
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+def parse(data, chunk_size=7):
+    parser = HeaderParser()
+    for i in range(0, len(data), chunk_size):
+        parser.feed(data[i:i + chunk_size])
+        if parser.done:
+            break
+    parser.close()
+    return parser
+
+
+def exif(orientation, order='MM'):
+    pack = '>' if order == 'MM' else '<'
+    # TIFF header, then IFD0 with an unrelated tag before the orientation
+    return (order.encode() + struct.pack(pack + 'HI', 42, 8) + struct.pack(pack + 'H', 2)
+            + struct.pack(pack + 'HHIHH', 0x010F, 2, 1, 0, 0) + struct.pack(pack + 'HHIHH', 0x0112, 3, 1, orientation, 0)
+            + struct.pack(pack + 'I', 0))
+
+
+def jpeg(width, height, orientation=None, icc_size=0, components=3, adobe_transform=None):
+    segments = b'\xff\xd8'
+    if orientation is not None:
+        payload = b'Exif\0\0' + exif(orientation)
+        segments += b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+    if icc_size:
+        segments += b'\xff\xe2' + struct.pack('>H', icc_size + 2) + b'\0' * icc_size
+    if adobe_transform is not None:
+        payload = b'Adobe' + struct.pack('>HHHB', 100, 0, 0, adobe_transform)
+        segments += b'\xff\xee' + struct.pack('>H', len(payload) + 2) + payload
+    # Fill bytes may precede a marker
+    frame = struct.pack('>BHHB', 8, height, width, components) + b'\x01\x22\x00' * components
+    segments += b'\xff\xff\xc0' + struct.pack('>H', len(frame) + 2) + frame
+    return segments + b'\xff\xda' + b'\0' * 100
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + b'\0\0\0\0'
+
+
+def png(width, height, color_type=2, frames=None, orientation=None):
+    data = b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+    data += png_chunk(b'tEXt', b'Comment\0' + b'x' * 100)
+    if frames is not None:
+        data += png_chunk(b'acTL', struct.pack('>II', frames, 0))
+    if orientation is not None:
+        data += png_chunk(b'eXIf', exif(orientation, 'II'))
+    return data + png_chunk(b'IDAT', b'\0' * 50) + png_chunk(b'IEND', b'')
+
+
+def gif(width, height, frames=1, loop=False):
+    data = b'GIF89a' + struct.pack('<HHBBB', width, height, 0x81, 0, 0) + b'\0' * 12
+    if loop:
+        data += b'\x21\xff\x0bNETSCAPE2.0\x03\x01\0\0\0'
+    for _ in range(frames):
+        data += b'\x21\xf9\x04\0\x0a\0\0\0'
+        data += b'\x2c' + struct.pack('<HHHHB', 0, 0, width, height, 0) + b'\x02' + b'\x05' + b'\0' * 5 + b'\0'
+    return data + b'\x3b'
+
+
+def riff_chunk(kind, data):
+    return kind + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1)
+
+
+def webp(*chunks):
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+VP8 = riff_chunk(b'VP8 ', b'\0\0\0\x9d\x01\x2a' + struct.pack('<HH', 333, 217) + b'\0' * 20)
+VP8L = riff_chunk(b'VP8L', b'\x2f' + struct.pack('<I', 332 | 216 << 14) + b'\0' * 20)
+
+
+def vp8x(flags, width=333, height=217):
+    return riff_chunk(b'VP8X', bytes([flags, 0, 0, 0]) + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little'))
+
+
+def box(kind, body, full=False):
+    if full:
+        body = b'\0\0\0\0' + body
+    return struct.pack('>I', len(body) + 8) + kind + body
+
+
+def avif(width, height, brand=b'avif', rotation=None, matrix=1):
+    ftyp = box(b'ftyp', brand + b'\0\0\0\0' + b'mif1' + b'miaf')
+    # A thumbnail ispe listed first belongs to item 2, so only the ipma mapping finds the primary's
+    properties = [box(b'ispe', struct.pack('>II', 64, 64), full=True),
+                  box(b'ispe', struct.pack('>II', width, height), full=True),
+                  box(b'colr', b'nclx' + struct.pack('>HHHB', 1, 13, matrix, 0x80))]
+    associations = [(1, [2, 3]), (2, [1])]
+    if rotation is not None:
+        properties.append(box(b'irot', bytes([rotation])))
+        associations[0][1].append(len(properties))
+    ipma = struct.pack('>I', len(associations)) + b''.join(
+        struct.pack('>HB', item, len(indexes)) + bytes(0x80 | index for index in indexes) for item, indexes in associations)
+    meta = box(b'meta', box(b'hdlr', b'\0' * 4 + b'pict' + b'\0' * 13, full=True)
+               + box(b'pitm', struct.pack('>H', 1), full=True)
+               + box(b'iprp', box(b'ipco', b''.join(properties)) + box(b'ipma', ipma, full=True)), full=True)
+    return ftyp + meta + box(b'mdat', b'\0' * 100)
+
+
+def sample_jpegs():
+    return {name: (int(name[6:-4].split('x')[0]), int(name[6:-4].split('x')[1]))
+            for name in os.listdir(TEST_DATA) if name.endswith('.jpg')}
+
+
+@pytest.mark.parametrize('name, size', sorted(sample_jpegs().items()))
+def test_reads_jpeg_header_from_the_first_bytes(name, size):
+    with open(os.path.join(TEST_DATA, name), 'rb') as f:
+        data = f.read()
+
+    parser = parse(data)
+
+    assert parser.dimensions == size
+    assert (parser.format, parser.colorspace, parser.orientation, parser.animated) == ('jpeg', 'yuv', 1, False)
+    assert parser.position < 1024
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_reads_jpeg_exif_orientation(orientation):
+    parser = parse(jpeg(640, 480, orientation=orientation))
+
+    assert parser.dimensions == (640, 480)
+    assert parser.orientation == orientation
+
+
+@pytest.mark.parametrize('components, transform, colorspace', [(1, None, 'gray'), (3, 0, 'rgb'), (4, None, 'cmyk'),
+                                                               (4, 2, 'ycck')])
+def test_reads_jpeg_colorspace(components, transform, colorspace):
+    assert parse(jpeg(64, 48, components=components, adobe_transform=transform)).colorspace == colorspace
+
+
+def test_skips_large_jpeg_segments_without_buffering_them():
+    parser = HeaderParser()
+    data = jpeg(640, 480, icc_size=60000)
+    for i in range(0, len(data), 4096):
+        parser.feed(data[i:i + 4096])
+        assert len(parser.buffer) <= 4096
+
+    assert parser.dimensions == (640, 480)
+
+
+def test_jpeg_without_frame_header_is_left_to_ffprobe():
+    parser = parse(b'\xff\xd8\xff\xda' + b'\0' * 100)
+
+    assert parser.done
+    assert parser.dimensions is None
+
+
+@pytest.mark.parametrize('data, info', [
+    (png(333, 217), {'colorspace': 'rgb', 'animated': False, 'orientation': 1}),
+    (png(333, 217, color_type=0), {'colorspace': 'gray', 'animated': False, 'orientation': 1}),
+    (png(333, 217, color_type=3, orientation=6), {'colorspace': 'palette', 'animated': False, 'orientation': 6}),
+    (png(333, 217, frames=4), {'colorspace': 'rgb', 'animated': True, 'orientation': 1}),
+    (png(333, 217, frames=1), {'colorspace': 'rgb', 'animated': False, 'orientation': 1})
+])
+def test_reads_png_header(data, info):
+    assert parse(data, chunk_size=1).info() == dict(info, format='png', width=333, height=217)
+
+
+@pytest.mark.parametrize('data, animated', [
+    (gif(333, 217), False),
+    # Encoders add the looping extension to single frames too
+    (gif(333, 217, loop=True), False),
+    (gif(333, 217, frames=3, loop=True), True),
+    (gif(333, 217, frames=2), True)
+])
+def test_reads_gif_header(data, animated):
+    parser = parse(data, chunk_size=3)
+
+    assert parser.info() == {'format': 'gif', 'width': 333, 'height': 217, 'orientation': 1, 'colorspace': 'palette',
+                             'animated': animated}
+
+
+@pytest.mark.parametrize('data, colorspace, animated, orientation', [
+    (webp(VP8), 'yuv', False, 1),
+    (webp(VP8L), 'rgb', False, 1),
+    (webp(vp8x(0x08), riff_chunk(b'EXIF', exif(8)), VP8), 'yuv', False, 8),
+    (webp(vp8x(0x10), riff_chunk(b'ALPH', b'\0' * 9), VP8), 'yuv', False, 1),
+    (webp(vp8x(0x02), riff_chunk(b'ANIM', b'\0' * 6), riff_chunk(b'ANMF', b'\0' * 40)), None, True, 1)
+])
+def test_reads_webp_header(data, colorspace, animated, orientation):
+    parser = parse(data, chunk_size=3)
+
+    assert parser.dimensions == (333, 217)
+    assert (parser.colorspace, parser.animated, parser.orientation) == (colorspace, animated, orientation)
+
+
+@pytest.mark.parametrize('rotation, orientation', [(None, 1), (1, 8), (2, 3), (3, 6)])
+def test_reads_avif_primary_item(rotation, orientation):
+    parser = parse(avif(1920, 1080, rotation=rotation))
+
+    assert parser.info() == {'format': 'avif', 'width': 1920, 'height': 1080, 'orientation': orientation,
+                             'colorspace': 'yuv', 'animated': False}
+
+
+def test_reads_avif_sequence_and_identity_matrix():
+    parser = parse(avif(640, 360, brand=b'avis', matrix=0))
+
+    assert (parser.dimensions, parser.animated, parser.colorspace) == ((640, 360), True, 'rgb')
+
+
+def test_other_isobmff_files_are_left_to_ffprobe():
+    with open(os.path.join(TEST_DATA, 'video_1024x1024.mp4'), 'rb') as f:
+        parser = parse(f.read())
+
+    assert parser.done
+    assert parser.info()['width'] is None
+
+
+def test_probe_image_falls_back_to_ffprobe(tmp_path, mocker):
+    mock_ffprobe = mocker.patch('app.probe.probe_dimensions', return_value=(1024, 1024))
+    image = tmp_path / 'image.png'
+    image.write_bytes(png(333, 217))
+
+    assert probe_image(str(image))['width'] == 333
+    assert probe_image(os.path.join(TEST_DATA, 'video_1024x1024.mp4'))['width'] == 1024
+    mock_ffprobe.assert_called_once()
+
+
+def test_read_header_stops_early_on_large_files():
+    parser = read_header(os.path.join(TEST_DATA, 'image_8000x8000.jpg'))
+
+    assert parser.dimensions == (8000, 8000)
+    assert parser.position < 1024
+
+
+def corpus():
+    with open(os.path.join(TEST_DATA, 'image_800x450.jpg'), 'rb') as f:
+        photo = f.read(4096)
+    return [photo, jpeg(640, 480, orientation=6, adobe_transform=1), png(333, 217, frames=2, orientation=3),
+            gif(333, 217, frames=2, loop=True), webp(vp8x(0x0a), riff_chunk(b'EXIF', exif(5)), VP8), webp(VP8L),
+            avif(1920, 1080, rotation=1)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_fuzzed_headers_never_raise(seed):
+    rng = random.Random(seed)
+    for sample in corpus():
+        for _ in range(50):
+            data = bytearray(sample)
+            mutation = rng.choice(('flip', 'truncate', 'insert', 'delete'))
+            position = rng.randrange(len(data))
+            if mutation == 'flip':
+                for _ in range(rng.randint(1, 4)):
+                    data[rng.randrange(len(data))] = rng.randrange(256)
+            elif mutation == 'truncate':
+                del data[position:]
+            elif mutation == 'insert':
+                data[position:position] = bytes(rng.randrange(256) for _ in range(rng.randint(1, 16)))
+            else:
+                del data[position:position + rng.randint(1, 16)]
+
+            parser = parse(bytes(data), chunk_size=rng.randint(1, 64))
+
+            info = parser.info()
+            assert parser.done
+            assert (info['width'] is None) == (info['height'] is None)
+            assert info['width'] is None or (info['width'] > 0 and info['height'] > 0)
+            assert 1 <= info['orientation'] <= 8
+
+
+@pytest.mark.parametrize('index', range(len(corpus())))
+def test_truncated_headers_never_report_wrong_dimensions(index):
+    sample = corpus()[index]
+    expected = parse(sample).dimensions
+    for end in range(len(sample)):
+        assert parse(sample[:end], chunk_size=5).dimensions in (None, expected)
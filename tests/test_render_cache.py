@@ -0,0 +1,68 @@
+# tests/test_render_cache.py
+import os
+import time
+
+from app.render_cache import RenderCache, render_key
+
+PARAMS = {
+    'framerate': 30,
+    'duration': 10,
+    'zoom': 0,
+    'crop': True,
+    'input_width': 1024,
+    'input_height': 1024,
+    'output_width': 720,
+    'output_height': 1024
+}
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+def test_render_key_is_canonical():
+    assert render_key('abc', PARAMS) == render_key('abc', dict(PARAMS, framerate=30.0, crop='true'))
+    assert render_key('abc', PARAMS) != render_key('abc', dict(PARAMS, duration=5))
+    assert render_key('abc', PARAMS) != render_key('def', PARAMS)
+
+def test_render_key_ignores_crop_when_sizes_match():
+    same_size = dict(PARAMS, output_width=1024)
+    assert render_key('abc', same_size) == render_key('abc', dict(same_size, crop=False))
+
+def test_render_key_follows_framing_graph():
+    # A crop as large as the input leaves nothing to crop, like a pad of the same aspect ratio
+    larger = dict(PARAMS, input_width=640, input_height=360, output_width=1280, output_height=720)
+    assert render_key('abc', larger) == render_key('abc', dict(larger, crop=False))
+    assert render_key('abc', PARAMS) != render_key('abc', dict(PARAMS, crop=False))
+
+def test_lookup_links_cached_render(tmp_path):
+    render_cache = RenderCache(root=str(tmp_path / 'cache'), max_bytes=1024)
+    key = render_key('abc', PARAMS)
+    first = write_file(tmp_path / 'first.mp4', b'video')
+
+    assert not render_cache.lookup(key, str(tmp_path / 'second.mp4'))
+    render_cache.store(key, first)
+    assert render_cache.lookup(key, str(tmp_path / 'second.mp4'))
+
+    with open(tmp_path / 'second.mp4', 'rb') as f:
+        assert f.read() == b'video'
+    assert render_cache.references(key) == 2
+
+def test_evict_keeps_referenced_entries(tmp_path):
+    render_cache = RenderCache(root=str(tmp_path / 'cache'), max_bytes=4)
+    referenced = write_file(tmp_path / 'referenced.mp4', b'aaaa')
+    render_cache.store('a' * 64, referenced)
+
+    unreferenced = write_file(tmp_path / 'unreferenced.mp4', b'bbbb')
+    render_cache.store('b' * 64, unreferenced)
+    os.remove(unreferenced)
+    old = time.time() - 60
+    os.utime(render_cache._entry_path('b' * 64), (old, old))
+
+    render_cache.store('c' * 64, write_file(tmp_path / 'new.mp4', b'cccc'))
+    os.remove(tmp_path / 'new.mp4')
+    render_cache.evict()
+
+    assert render_cache.references('a' * 64) == 1
+    assert not os.path.exists(render_cache._entry_path('b' * 64))
+    assert os.path.exists(render_cache._entry_path('c' * 64))
@@ -0,0 +1,146 @@
+# tests/test_renditions.py
+import pytest
+from app.config import Config
+from app.ffmpeg import split_command
+from app.renditions import rendition_outputs, rendition_commands
+from app.tasks import create_video_task, send_webhook_task
+
+
+@pytest.fixture(autouse=True)
+def cached_inputs(mocker):
+    # The jobs below name inputs that were never downloaded; treat them as still cached
+    return mocker.patch('app.tasks.input_cache.touch', return_value=True)
+
+
+def rendition_job(**overrides):
+    data = {
+        'record_id': '123',
+        'framerate': 30,
+        'duration': 1,
+        'zoom': 0,
+        'crop': False,
+        'input_width': 1920,
+        'input_height': 1080,
+        'output_width': 1280,
+        'output_height': 720,
+        'cached_input_file': '/path/to/input.jpg',
+        'output_file': 'movies/primary.mp4',
+        'request_host': 'localhost',
+        'renditions': [
+            {'output_width': 640, 'output_height': 360, 'output_file': 'movies/small.mp4'},
+            {'output_width': 1080, 'output_height': 1080, 'crop': True, 'profile': 'fast', 'output_file': 'movies/square.mp4'}
+        ]
+    }
+    data.update(overrides)
+    return data
+
+
+def test_split_command_maps_each_branch_to_its_output():
+    command = split_command(['-i', 'in.jpg'], 'format=yuv420p', [
+        ('scale=640:360', ['a.mp4']),
+        ('scale=320:180', ['b.mp4'])
+    ])
+
+    graph = command[command.index('-filter_complex') + 1]
+    assert graph == '[0:v]format=yuv420p,split=2[s0][s1];[s0]scale=640:360[o0];[s1]scale=320:180[o1]'
+    assert command[-6:] == ['-map', '[o0]', 'a.mp4', '-map', '[o1]', 'b.mp4']
+
+
+def test_rendition_outputs_inherit_crop_and_profile():
+    outputs = rendition_outputs(rendition_job(profile='quality'))
+
+    assert [o['output_file'] for o in outputs] == ['movies/primary.mp4', 'movies/small.mp4', 'movies/square.mp4']
+    assert [o['crop'] for o in outputs] == [False, False, True]
+    assert [o['profile'] for o in outputs] == ['quality', 'quality', 'fast']
+
+
+def test_rendition_commands_decode_still_once():
+    data = rendition_job()
+
+    commands, intermediate = rendition_commands(data, rendition_outputs(data))
+
+    assert len(commands) == 1 and intermediate == []
+    command = commands[0]
+    assert command.count('-i') == 1
+    graph = command[command.index('-filter_complex') + 1]
+    assert 'split=3' in graph
+    # The 1080x1080 centre crop already has the output size, so no scale follows it
+    assert '[s2]crop=1080:1080:420:0,format=yuv420p[o2]' in graph
+    assert command[-1] == 'movies/square.mp4'
+
+
+def test_rendition_commands_loop_long_stills(monkeypatch):
+    monkeypatch.setattr(Config, 'STILL_SEGMENT_SECONDS', 2)
+    data = rendition_job(duration=10)
+
+    commands, intermediate = rendition_commands(data, rendition_outputs(data))
+
+    assert len(commands) == 4 and len(intermediate) == 3
+    assert commands[0][1] == '-y'
+    assert [command[-1] for command in commands[1:]] == ['movies/primary.mp4', 'movies/small.mp4', 'movies/square.mp4']
+
+
+def test_rendition_commands_share_motion_decode():
+    data = rendition_job(zoom=50)
+
+    commands, _ = rendition_commands(data, rendition_outputs(data), {'keyframes': [
+        {'at': 0.0, 'zoom': 1.0, 'x': 0.5, 'y': 0.5}, {'at': 1.0, 'zoom': 1.5, 'x': 0.5, 'y': 0.5}
+    ], 'easing': 'linear'})
+
+    command = commands[0]
+    assert '-loop' not in command
+    graph = command[command.index('-filter_complex') + 1]
+    assert graph.count('zoompan=') == 3
+    assert 's=640x360' in graph and 's=1080x1080' in graph
+
+
+def test_create_video_task_renders_renditions_in_one_run(mocker):
+    mock_run = mocker.patch('app.tasks.run_ffmpeg', return_value=(b'', b''))
+
+    result = create_video_task(rendition_job())
+
+    mock_run.assert_called_once()
+    assert result['output_url'] == 'https://localhost:80/movies/primary.mp4'
+    assert [r['output_url'] for r in result['renditions']] == [
+        'https://localhost:80/movies/small.mp4', 'https://localhost:80/movies/square.mp4'
+    ]
+
+
+def test_create_video_task_leaves_the_job_passed_in_unchanged(mocker):
+    mocker.patch('app.tasks.run_ffmpeg', return_value=(b'', b''))
+    data = rendition_job()
+
+    result = create_video_task(data)
+
+    assert data == rendition_job()
+    assert all('output_url' in rendition for rendition in result['renditions'])
+
+
+def test_create_video_task_renders_only_uncached_renditions(mocker):
+    mock_run = mocker.patch('app.tasks.run_ffmpeg', return_value=(b'', b''))
+    mocker.patch('app.tasks.render_cache.lookup', side_effect=[True, False, True])
+    mock_store = mocker.patch('app.tasks.render_cache.store')
+
+    create_video_task(rendition_job(input_sha256='abc', cache=True))
+
+    command = mock_run.call_args.args[0]
+    assert '-filter_complex' in command and command[-1] == 'movies/small.mp4'
+    assert 'split=1' in command[command.index('-filter_complex') + 1]
+    assert mock_store.call_args.args[1] == 'movies/small.mp4'
+
+
+def test_send_webhook_task_reports_every_rendition(mocker):
+    mocker.patch('app.tasks.flush_webhooks_task.apply_async')
+    mock_enqueue = mocker.patch('app.tasks.webhooks.enqueue', return_value=True)
+    data = rendition_job(webhook_url='http://example.com/webhook', output_url='https://localhost:80/movies/primary.mp4')
+    for rendition in data['renditions']:
+        rendition['output_url'] = 'https://localhost:80/' + rendition['output_file']
+
+    send_webhook_task(data)
+
+    payload = mock_enqueue.call_args.args[1]
+    assert payload['filename'] == 'https://localhost:80/movies/primary.mp4'
+    assert payload['renditions'] == [
+        {'filename': 'https://localhost:80/movies/small.mp4', 'output_width': 640, 'output_height': 360},
+        {'filename': 'https://localhost:80/movies/square.mp4', 'output_width': 1080, 'output_height': 1080}
+    ]
@@ -0,0 +1,339 @@
+# tests/test_routes.py
+import json
+import pytest
+
+from app import create_app
+from app.config import Config
+
+API_KEY = 'tenant1'
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    movies_dir = str(tmp_path / 'movies')
+    (tmp_path / 'movies' / API_KEY).mkdir(parents=True)
+    monkeypatch.setattr(Config, 'MOVIES_DIR', movies_dir)
+    app = create_app()
+    app.config['TESTING'] = True
+    return app.test_client()
+
+@pytest.fixture
+def mock_redis(mocker):
+    client = mocker.MagicMock()
+    # No job registered yet for any record
+    client.register_script.return_value.return_value = None
+    mocker.patch('app.status.get_redis', return_value=client)
+    mocker.patch('app.jobs.get_redis', return_value=client)
+    # Every tenant is within its backlog budget
+    scheduler = mocker.MagicMock()
+    scheduler.register_script.return_value.return_value = [1, 0]
+    mocker.patch('app.scheduling.get_redis', return_value=scheduler)
+    # No renders measured yet, so the cost model uses its prior
+    mocker.patch('app.cost_model.get_redis', return_value=mocker.MagicMock(hgetall=mocker.MagicMock(return_value={})))
+    return client
+
+def test_status_returns_progress(client, mock_redis):
+    mock_redis.get.return_value = json.dumps({'record_id': 'abc', 'state': 'rendering', 'frame': '90'})
+
+    response = client.get('/status/abc', headers={'x-api-key': API_KEY})
+
+    assert response.status_code == 200
+    assert response.json['state'] == 'rendering'
+    mock_redis.get.assert_called_once_with('status:tenant1:abc')
+
+def test_status_unknown_record(client, mock_redis):
+    mock_redis.get.return_value = None
+
+    response = client.get('/status/abc', headers={'x-api-key': API_KEY})
+
+    assert response.status_code == 404
+
+def test_status_reports_redis_outage(client, mock_redis):
+    import redis
+    mock_redis.get.side_effect = redis.ConnectionError('refused')
+
+    response = client.get('/status/abc', headers={'x-api-key': API_KEY})
+
+    assert response.status_code == 503
+
+def test_status_requires_api_key(client, mock_redis):
+    response = client.get('/status/abc')
+
+    assert response.status_code == 400
+
+def video_job(record_id, input_url='http://example.com/image.jpg'):
+    return {
+        'record_id': record_id,
+        'input_url': input_url,
+        'framerate': 30,
+        'duration': 10,
+        'cache': True,
+        'zoom': 0,
+        'crop': True,
+        'output_width': 1280,
+        'output_height': 720
+    }
+
+def test_create_videos_reports_per_item_results(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_batch_pipeline')
+    jobs = [video_job('a'), video_job('b'), dict(video_job('c'), framerate='fast')]
+
+    response = client.post('/create-videos', headers={'x-api-key': API_KEY},
+                           json={'jobs': jobs, 'webhook_url': 'http://example.com/batch'})
+
+    assert response.status_code == 202
+    results = response.json['results']
+    assert [r['record_id'] for r in results] == ['a', 'b', 'c']
+    assert 'filename' in results[0] and 'filename' in results[1]
+    assert results[2]['error'] == 'Invalid input data'
+    accepted, batch = mock_pipeline.call_args.args
+    assert [data['record_id'] for data in accepted] == ['a', 'b']
+    assert batch['webhook_url'] == 'http://example.com/batch'
+    assert batch['batch_id'] == response.json['batch_id']
+
+def test_create_videos_rejects_batch_without_valid_jobs(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_batch_pipeline')
+
+    response = client.post('/create-videos', headers={'x-api-key': API_KEY},
+                           json={'jobs': [dict(video_job('a'), input_url='http://invalid.com/a.jpg')]})
+
+    assert response.status_code == 400
+    assert response.json['results'][0]['error'] == 'Invalid input URL'
+    mock_pipeline.assert_not_called()
+
+def test_create_video_attaches_duplicate_to_registered_job(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+    mock_redis.register_script.return_value.return_value = json.dumps(
+        {'record_id': 'a', 'params_hash': 'x', 'filename': 'existing.mp4', 'state': 'rendering', 'updated_at': 1})
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook'))
+
+    assert response.status_code == 202
+    assert response.json['filename'] == 'existing.mp4'
+    assert response.json['message'] == 'Video processing already in progress'
+    mock_pipeline.assert_not_called()
+
+def test_create_video_flags_filename_provisional_with_content_addressed_storage(client, mock_redis, mocker,
+                                                                                monkeypatch):
+    monkeypatch.setattr(Config, 'STORAGE_CONTENT_ADDRESSED', True)
+    mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook'))
+
+    assert response.json['filename_final'] is False
+
+    # A completed job has already been renamed to its content address
+    mock_redis.register_script.return_value.return_value = json.dumps(
+        {'record_id': 'a', 'params_hash': 'x', 'filename': 'objects/ab/abc.mp4', 'state': 'completed', 'updated_at': 1})
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook'))
+
+    assert response.json['filename'] == 'objects/ab/abc.mp4'
+    assert response.json['filename_final'] is True
+
+def test_create_video_registers_new_job(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook'))
+
+    assert response.status_code == 202
+    data = mock_pipeline.call_args.args[0]
+    assert data['job_key'].startswith('job:tenant1:a:')
+    keys = mock_redis.register_script.return_value.call_args.kwargs['keys']
+    assert keys == [data['job_key'], 'jobs:tenant1:a']
+
+def test_create_video_normalizes_crop_to_bool(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook', crop='false'))
+
+    assert response.status_code == 202
+    # "false" must not reach the filter graphs as a truthy string
+    assert mock_pipeline.call_args.args[0]['crop'] is False
+
+def test_create_video_accepts_timeline(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_timeline_pipeline')
+    payload = {
+        'record_id': 'a',
+        'webhook_url': 'http://example.com/webhook',
+        'framerate': 30,
+        'cache': True,
+        'output_width': 1280,
+        'output_height': 720,
+        'timeline': {
+            'clips': [
+                {'url': 'http://example.com/a.jpg', 'duration': 4},
+                {'url': 'http://example.com/b.mp4', 'type': 'video', 'duration': 4,
+                 'transition': {'type': 'fade', 'duration': 1}}
+            ],
+            'audio': {'url': 'http://example.com/music.m4a'}
+        }
+    }
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY}, json=payload)
+
+    assert response.status_code == 202
+    data = mock_pipeline.call_args.args[0]
+    assert data['duration'] == 7
+    mock_pipeline.return_value.apply_async.assert_called_once()
+
+def test_create_video_assigns_rendition_files(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+    renditions = [{'output_width': 640, 'output_height': 360}, {'output_width': 1080, 'output_height': 1080, 'crop': True}]
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook', renditions=renditions))
+
+    assert response.status_code == 202
+    summaries = response.json['renditions']
+    assert [(r['output_width'], r['output_height']) for r in summaries] == [(640, 360), (1080, 1080)]
+    data = mock_pipeline.call_args.args[0]
+    assert [r['output_file'].endswith(s['filename']) for r, s in zip(data['renditions'], summaries)] == [True, True]
+    assert len({response.json['filename']} | {s['filename'] for s in summaries}) == 3
+
+def test_create_video_rejects_invalid_rendition(client, mock_redis, mocker):
+    mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook',
+                                     renditions=[{'output_width': 0, 'output_height': 360}]))
+
+    assert response.status_code == 400
+    assert response.json['error'] == 'Invalid rendition dimensions'
+
+def test_create_video_returns_playlist_for_streaming_output(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook', output_mode='hls'))
+
+    assert response.status_code == 202
+    stem = response.json['filename'].rsplit('.', 1)[0]
+    assert response.json['playlist'].endswith(f'/{stem}/index.m3u8')
+    assert mock_pipeline.call_args.args[0]['playlist_url'] == response.json['playlist']
+
+def test_create_video_rejects_streamed_renditions(client, mock_redis, mocker):
+    mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook', output_mode='dash',
+                                     renditions=[{'output_width': 640, 'output_height': 360}]))
+
+    assert response.status_code == 400
+    assert response.json['error'] == 'Renditions are only available with mp4 output'
+
+def test_create_video_rejects_tenant_over_budget(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+    mocker.patch('app.routes.admit', return_value=(False, 42))
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook'))
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '42'
+    assert response.json['retry_after'] == 42
+    mock_pipeline.assert_not_called()
+    # The registered job is marked failed so a retry can claim it again
+    status = json.loads(mock_redis.set.call_args_list[-1].args[1])
+    assert status['state'] == 'failed'
+
+def test_create_video_sets_render_priority(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+
+    client.post('/create-video', headers={'x-api-key': API_KEY},
+                json=dict(video_job('a'), webhook_url='http://example.com/webhook', priority='high'))
+
+    data = mock_pipeline.call_args.args[0]
+    assert data['render_priority'] == 0
+    assert data['cost'] == 10 * 30 * 1280 * 720
+
+def test_create_video_returns_estimate_and_pool(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook'))
+
+    assert response.status_code == 202
+    assert response.json['eta_seconds'] >= response.json['estimated_seconds'] > 0
+    assert mock_pipeline.call_args.args[0]['render_queue'] == 'render'
+
+def test_create_video_rejects_unreachable_deadline(client, mock_redis, mocker):
+    mock_pipeline = mocker.patch('app.tasks.create_video_pipeline')
+    mocker.patch('app.routes.estimate_cost', return_value={
+        'estimated_seconds': 90, 'estimated_bytes': 10 ** 7, 'eta_seconds': 120, 'eta': 1700000000
+    })
+
+    response = client.post('/create-video', headers={'x-api-key': API_KEY},
+                           json=dict(video_job('a'), webhook_url='http://example.com/webhook', deadline=60))
+
+    assert response.status_code == 422
+    assert response.json['error'] == 'Deadline cannot be met'
+    assert response.json['eta_seconds'] == 120
+    mock_pipeline.assert_not_called()
+    mock_redis.register_script.assert_not_called()
+
+def test_params_hash_ignores_equivalent_values():
+    from app.jobs import params_hash
+
+    assert params_hash(video_job('a')) == params_hash(dict(video_job('a'), framerate='30', webhook_url='http://x.com'))
+    assert params_hash(video_job('a')) != params_hash(dict(video_job('a'), duration=11))
+
+def test_register_reuses_jobs_only_when_cache_allowed(mock_redis):
+    from app.jobs import register
+
+    register(dict(video_job('a'), api_key=API_KEY), 'one.mp4')
+    claim = mock_redis.register_script.return_value
+    assert claim.call_args.kwargs['keys'][1] == 'jobs:tenant1:a'
+    assert claim.call_args.kwargs['args'][2] == 1
+
+    # The content behind the URL may have changed, so the job is rendered again
+    register(dict(video_job('a'), api_key=API_KEY, cache=False), 'two.mp4')
+    assert claim.call_args.kwargs['args'][2] == 0
+
+def test_jobs_lists_registered_jobs(client, mock_redis):
+    mock_redis.smembers.return_value = {'job:tenant1:a:x', 'job:tenant1:a:y'}
+    mock_redis.mget.return_value = [json.dumps({'record_id': 'a', 'state': 'completed', 'updated_at': 1}), None]
+
+    response = client.get('/jobs/a', headers={'x-api-key': API_KEY})
+
+    assert response.status_code == 200
+    assert response.json['jobs'][0]['state'] == 'completed'
+    mock_redis.smembers.assert_called_once_with('jobs:tenant1:a')
+    mock_redis.scan_iter.assert_not_called()
+    # Expired jobs drop out of the record's index
+    mock_redis.srem.assert_called_once_with('jobs:tenant1:a', 'job:tenant1:a:y')
+
+def test_create_batch_pipeline_fetches_each_url_once():
+    from app.tasks import create_batch_pipeline
+
+    jobs = [video_job('a'), video_job('b'), video_job('c', input_url='http://example.com/other.jpg')]
+    pipeline = create_batch_pipeline(jobs, {'batch_id': 'x', 'api_key': API_KEY, 'webhook_url': None})
+
+    assert sorted(sig.args[0]['input_url'] for sig in pipeline.tasks) == [
+        'http://example.com/image.jpg', 'http://example.com/other.jpg'
+    ]
+
+def test_dispatch_batch_task_skips_failed_inputs(mocker):
+    from app.tasks import dispatch_batch_task
+
+    mock_chord = mocker.patch('app.tasks.chord')
+    mock_webhook = mocker.patch('app.tasks.send_webhook_task.delay')
+    inputs = [
+        {'input_url': 'http://example.com/image.jpg', 'cached_input_file': 'cache/x', 'input_sha256': 'x',
+         'input_width': 1024, 'input_height': 1024},
+        {'input_url': 'http://example.com/other.jpg', 'error': 'File is too large'}
+    ]
+    jobs = [video_job('a'), dict(video_job('b', input_url='http://example.com/other.jpg'),
+                                 webhook_url='http://example.com/webhook')]
+    batch = {'batch_id': 'x', 'api_key': API_KEY, 'webhook_url': 'http://example.com/batch'}
+
+    assert dispatch_batch_task(inputs, jobs, batch) == 1
+
+    header, body = mock_chord.call_args.args
+    assert [sig.args[0]['record_id'] for sig in header.tasks] == ['a']
+    assert body.args[0]['failed'] == [{'record_id': 'b', 'error': 'File is too large'}]
+    mock_webhook.assert_called_once()
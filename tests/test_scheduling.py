@@ -0,0 +1,208 @@
+# tests/test_scheduling.py
+import pytest
+import redis
+from unittest.mock import MagicMock
+
+from app.config import Config
+from app import scheduling
+from app.tasks import create_video_task, render_segment_task
+
+
+@pytest.fixture(autouse=True)
+def cached_inputs(mocker):
+    # The jobs below name inputs that were never downloaded; treat them as still cached
+    return mocker.patch('app.tasks.input_cache.touch', return_value=True)
+
+
+@pytest.fixture
+def mock_redis(mocker):
+    client = MagicMock()
+    mocker.patch('app.scheduling.get_redis', return_value=client)
+    return client
+
+
+def job(**overrides):
+    data = {
+        'record_id': 'a',
+        'api_key': 'tenant1',
+        'duration': 10,
+        'framerate': 30,
+        'output_width': 1280,
+        'output_height': 720
+    }
+    data.update(overrides)
+    return data
+
+
+def test_job_cost_counts_renditions():
+    data = job(renditions=[{'output_width': 640, 'output_height': 360}])
+
+    assert scheduling.job_cost(data) == 10 * 30 * (1280 * 720 + 640 * 360)
+
+
+def test_render_priority_demotes_busy_tenants(monkeypatch):
+    monkeypatch.setattr(Config, 'TENANT_BACKLOG_BUDGET', 1000)
+
+    assert scheduling.render_priority(job(priority='high'), 0) == 0
+    assert scheduling.render_priority(job(), 500) == 4
+    assert scheduling.render_priority(job(priority='low'), 5000) == 9
+
+
+def test_admit_charges_the_backlog(mock_redis, monkeypatch):
+    monkeypatch.setattr(Config, 'TENANT_BACKLOG_BUDGET', 10 ** 12)
+    mock_redis.register_script.return_value.return_value = [1, 0]
+    data = job()
+
+    assert scheduling.admit(data) == (True, None)
+
+    assert data['cost'] == 10 * 30 * 1280 * 720
+    assert data['render_priority'] == scheduling.PRIORITIES['normal']
+    keys = mock_redis.register_script.return_value.call_args.kwargs['keys']
+    assert keys == ['backlog:tenant1']
+
+
+def test_admit_charge_lapses_after_job_ttl(mock_redis, mocker):
+    mocker.patch('app.scheduling.time').time.return_value = 1000.0
+    mock_redis.register_script.return_value.return_value = [1, 0]
+    data = job()
+
+    scheduling.admit(data)
+
+    # Charges past their deadline are dropped before the backlog is summed
+    args = mock_redis.register_script.return_value.call_args.kwargs['args']
+    assert args[2:] == [1000.0 + Config.JOB_TTL, 1000.0, f"{data['charge_id']}:{data['cost']}"]
+
+
+def test_admit_rejects_over_budget_with_retry_after(mock_redis, monkeypatch):
+    monkeypatch.setattr(Config, 'TENANT_BACKLOG_BUDGET', 1000)
+    monkeypatch.setattr(Config, 'TENANT_MAX_RENDERS', 2)
+    monkeypatch.setattr(Config, 'RENDER_PIXEL_RATE', 10)
+    mock_redis.register_script.return_value.return_value = [0, 900]
+
+    admitted, retry_after = scheduling.admit(job(duration=1, framerate=1, output_width=10, output_height=20))
+
+    assert not admitted
+    assert retry_after == 5  # (900 + 200 - 1000) / (10 * 2)
+
+
+def test_admit_without_redis_keeps_requested_priority(mock_redis):
+    mock_redis.register_script.side_effect = redis.ConnectionError('down')
+    data = job(priority='low')
+
+    assert scheduling.admit(data) == (True, None)
+    assert data['render_priority'] == scheduling.PRIORITIES['low']
+    assert 'charge_id' not in data
+
+
+class FakeSortedSets:
+    """In-memory stand-in for the sorted set commands the render slots and backlog charges use."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.sets.get(key, {})
+        for member in [member for member, score in members.items() if score <= high]:
+            del members[member]
+
+    def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update(mapping)
+
+    def zcard(self, key):
+        return len(self.sets.get(key, {}))
+
+    def zrem(self, key, member):
+        self.sets.get(key, {}).pop(member, None)
+
+    def expire(self, key, seconds):
+        return True
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
+
+
+@pytest.fixture
+def slots(mocker, monkeypatch):
+    monkeypatch.setattr(Config, 'TENANT_MAX_RENDERS', 1)
+    monkeypatch.setattr(Config, 'TENANT_SLOT_TTL', 60)
+    client = FakeSortedSets()
+    mocker.patch('app.scheduling.get_redis', return_value=client)
+    return client
+
+
+def test_slots_are_limited_and_released_per_task(slots):
+    assert scheduling.acquire_slot(job(), 'task-a')
+    assert not scheduling.acquire_slot(job(), 'task-b')
+    # A retried task asks for the slot it already holds
+    assert scheduling.acquire_slot(job(), 'task-a')
+
+    scheduling.release_slot(job(), 'task-a')
+
+    assert scheduling.acquire_slot(job(), 'task-b')
+    assert slots.zcard('renders:tenant1') == 1
+
+
+def test_leaked_slot_frees_up_after_ttl_despite_polling(slots, mocker):
+    clock = mocker.patch('app.scheduling.time')
+    clock.time.return_value = 1000.0
+    assert scheduling.acquire_slot(job(), 'crashed-task')
+
+    # The tenant keeps polling while the slot it leaked is still within its TTL
+    for now in range(1001, 1060, 5):
+        clock.time.return_value = float(now)
+        assert not scheduling.acquire_slot(job(), 'waiting-task')
+
+    clock.time.return_value = 1000.0 + Config.TENANT_SLOT_TTL
+    assert scheduling.acquire_slot(job(), 'waiting-task')
+
+
+def test_release_returns_the_charge_once(slots):
+    data = job(charge_id='abc', cost=500)
+    slots.zadd('backlog:tenant1', {'abc:500': 10 ** 12, 'other:200': 10 ** 12})
+
+    scheduling.release(data)
+    scheduling.release(data)
+
+    assert list(slots.sets['backlog:tenant1']) == ['other:200']
+
+
+def test_render_task_retries_when_tenant_slots_are_full(slots, mocker):
+    slots.zadd('renders:tenant1', {'other-task': 10 ** 12})
+    mock_retry = mocker.patch.object(create_video_task, 'retry', side_effect=RuntimeError('retry'))
+    mock_run = mocker.patch('app.tasks.run_ffmpeg')
+
+    with pytest.raises(RuntimeError):
+        create_video_task(job(render_priority=6, zoom=0, crop=False, input_width=1920, input_height=1080,
+                              cached_input_file='in.jpg', output_file='movies/out.mp4', request_host='localhost'))
+
+    assert mock_retry.call_args.kwargs['priority'] == 6
+    mock_run.assert_not_called()
+    assert list(slots.sets['renders:tenant1']) == ['other-task']
+
+
+def test_segments_each_take_a_tenant_slot(slots, mocker):
+    mock_retry = mocker.patch.object(render_segment_task, 'retry', side_effect=RuntimeError('retry'))
+    mock_run = mocker.patch('app.tasks.run_ffmpeg')
+    data = job(zoom=50, crop=False, input_width=1920, input_height=1080, cached_input_file='in.jpg',
+               output_file='movies/out.mp4')
+
+    assert render_segment_task(data, 0, 0, 300, 600) == 'movies/.out.mp4.part0000.mp4'
+    assert slots.zcard('renders:tenant1') == 0
+
+    slots.zadd('renders:tenant1', {'other-task': 10 ** 12})
+    with pytest.raises(RuntimeError):
+        render_segment_task(data, 1, 300, 300, 600)
+
+    mock_run.assert_called_once()
@@ -0,0 +1,57 @@
+# tests/test_segments.py
+import pytest
+from app.config import Config
+from app.segments import should_segment, segment_ranges, concat_command
+from app.tasks import create_video_task
+
+@pytest.fixture(autouse=True)
+def cached_inputs(mocker):
+    # The jobs below name inputs that were never downloaded; treat them as still cached
+    return mocker.patch('app.tasks.input_cache.touch', return_value=True)
+
+def test_segment_ranges_cover_every_frame():
+    ranges = segment_ranges(905, 30, segment_seconds=10)
+
+    assert ranges == [(0, 300), (300, 300), (600, 300), (900, 5)]
+
+def test_should_segment(monkeypatch):
+    monkeypatch.setattr(Config, 'SEGMENT_SECONDS', 10)
+    monkeypatch.setattr(Config, 'SEGMENT_MIN_PIXEL_SECONDS', 1920 * 1080 * 30)
+
+    assert should_segment(30 * 30, 30, 1920, 1080)
+    assert should_segment(20 * 30, 30, 3840, 2160)
+    assert not should_segment(15 * 30, 30, 3840, 2160)
+    assert not should_segment(60 * 30, 30, 640, 360)
+
+def test_concat_command_copies_video():
+    assert concat_command('parts.txt', 'out.mp4') == [
+        'ffmpeg', '-f', 'concat', '-safe', '0', '-i', 'parts.txt', '-c:v', 'copy', 'out.mp4'
+    ]
+    with_audio = concat_command('parts.txt', 'out.mp4', 'audio.m4a', 'atrim=0:30')
+    assert with_audio[with_audio.index('-filter_complex') + 1] == '[1:a]atrim=0:30[aout]'
+
+def test_create_video_task_dispatches_segments(mocker, monkeypatch):
+    monkeypatch.setattr(Config, 'SEGMENT_SECONDS', 10)
+    monkeypatch.setattr(Config, 'SEGMENT_MIN_PIXEL_SECONDS', 0)
+    mock_replace = mocker.patch.object(create_video_task, 'replace', return_value='replaced')
+    data = {
+        'record_id': '123',
+        'framerate': 30,
+        'duration': 25,
+        'zoom': 50,
+        'crop': False,
+        'input_width': 1920,
+        'input_height': 1080,
+        'output_width': 1280,
+        'output_height': 720,
+        'cached_input_file': '/path/to/input.jpg',
+        'output_file': 'movies/output.mp4',
+        'request_host': 'localhost'
+    }
+
+    assert create_video_task(data) == 'replaced'
+
+    replacement = mock_replace.call_args.args[0]
+    segments = [sig.args[1:4] for sig in replacement.tasks]
+    assert segments == [(0, 0, 300), (1, 300, 300), (2, 600, 150)]
+    assert replacement.body.name == 'app.tasks.merge_segments_task'
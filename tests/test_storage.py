@@ -0,0 +1,251 @@
+# tests/test_storage.py
+import os
+import json
+import hashlib
+import pytest
+
+from app.config import Config
+from app import storage
+from app.ffmpeg import run_ffmpeg, pipe_output
+from app.storage import LocalStorage, S3Storage, ContentAddressedStorage, storage_name
+
+
+class NotFound(Exception):
+    response = {'Error': {'Code': '404'}}
+
+
+class FakeS3:
+    """In-memory stand-in for the S3 API calls the storage backend makes."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        upload_id = f'upload-{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': hashlib.md5(Body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        assert numbers == sorted(parts)
+        self.objects[(Bucket, Key)] = b''.join(parts[number] for number in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, 'rb') as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise NotFound()
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[(Bucket, Key)] = self.objects[(CopySource['Bucket'], CopySource['Key'])]
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture(autouse=True)
+def cached_inputs(mocker):
+    # The jobs below name inputs that were never downloaded; treat them as still cached
+    return mocker.patch('app.tasks.input_cache.touch', return_value=True)
+
+
+@pytest.fixture
+def movies_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'MOVIES_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def s3(movies_dir):
+    return S3Storage('videos', public_url='https://cdn.example.com', prefix='out', client=FakeS3())
+
+
+def test_local_storage_url_matches_served_path():
+    assert LocalStorage().url('movies/abc.mp4', 'localhost') == 'https://localhost:80/movies/abc.mp4'
+
+
+def test_s3_save_uploads_and_removes_local_file(s3, movies_dir):
+    path = movies_dir / 'abc.mp4'
+    path.write_bytes(b'video')
+
+    saved, url = s3.save(str(path), 'localhost')
+
+    assert saved == str(path)
+    assert url == 'https://cdn.example.com/out/abc.mp4'
+    assert s3.client.objects[('videos', 'out/abc.mp4')] == b'video'
+    assert not path.exists()
+
+
+def test_s3_save_tree_keeps_playlist_layout(s3, movies_dir):
+    directory = movies_dir / 'abc'
+    directory.mkdir()
+    (directory / 'index.m3u8').write_text('#EXTM3U')
+    (directory / 'index0.m4s').write_bytes(b'segment')
+
+    s3.save_tree(str(directory))
+
+    assert set(s3.client.objects) == {('videos', 'out/abc/index.m3u8'), ('videos', 'out/abc/index0.m4s')}
+    assert not directory.exists()
+
+
+def test_multipart_upload_streams_parts(s3, movies_dir, monkeypatch):
+    monkeypatch.setattr(storage, 'MIN_PART_SIZE', 1)
+    monkeypatch.setattr(Config, 'S3_PART_SIZE', 100 * 1024)
+    payload = os.urandom(350 * 1024)
+    source = movies_dir / 'source.bin'
+    source.write_bytes(payload)
+
+    upload = s3.stream_upload(str(movies_dir / 'abc.mp4'))
+    with open(source, 'rb') as f:
+        upload.consume(f)
+    upload.complete()
+
+    assert len(upload.parts) == 4
+    assert s3.client.objects[('videos', 'out/abc.mp4')] == payload
+    assert upload.size == len(payload)
+
+
+def test_ffmpeg_output_is_uploaded_while_encoding(s3, movies_dir, monkeypatch):
+    monkeypatch.setattr(storage, 'MIN_PART_SIZE', 1)
+    monkeypatch.setattr(Config, 'S3_PART_SIZE', 4 * 1024)
+    output_file = str(movies_dir / 'abc.mp4')
+    command = pipe_output(['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=size=320x240:rate=30', '-t', '2',
+                           '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '15', output_file])
+    upload = s3.stream_upload(output_file)
+
+    run_ffmpeg(command, stdout_sink=upload.consume)
+    upload.complete()
+
+    video = s3.client.objects[('videos', 'out/abc.mp4')]
+    assert len(upload.parts) > 1
+    assert video[4:8] == b'ftyp' and b'moof' in video
+    assert not os.path.exists(output_file)
+
+
+def test_content_addressed_storage_keeps_identical_outputs_once(s3, movies_dir):
+    store = ContentAddressedStorage(s3)
+    digest = hashlib.sha256(b'video').hexdigest()
+    saved = []
+    for name in ('a.mp4', 'b.mp4'):
+        path = movies_dir / name
+        path.write_bytes(b'video')
+        saved.append(store.save(str(path), 'localhost'))
+
+    target = str(movies_dir / 'objects' / digest[:2] / f'{digest}.mp4')
+    assert saved[0] == saved[1] == (target, f'https://cdn.example.com/out/objects/{digest[:2]}/{digest}.mp4')
+    assert list(s3.client.objects) == [('videos', f'out/objects/{digest[:2]}/{digest}.mp4')]
+
+
+def test_content_addressed_stream_upload_moves_to_content_key(s3, movies_dir):
+    store = ContentAddressedStorage(s3)
+    source = movies_dir / 'source.bin'
+    source.write_bytes(b'video')
+
+    upload = store.stream_upload(str(movies_dir / 'abc.mp4'))
+    with open(source, 'rb') as f:
+        upload.consume(f)
+    upload.complete()
+
+    digest = hashlib.sha256(b'video').hexdigest()
+    assert storage_name(upload.path) == f'objects/{digest[:2]}/{digest}.mp4'
+    assert list(s3.client.objects) == [('videos', f'out/objects/{digest[:2]}/{digest}.mp4')]
+
+
+def test_published_output_points_at_its_content_address(movies_dir, mocker):
+    from app.tasks import publish, finish_job
+    client = mocker.MagicMock()
+    mocker.patch('app.status.get_redis', return_value=client)
+    mocker.patch('app.tasks.scheduling.release')
+    mocker.patch('app.tasks.get_storage', return_value=ContentAddressedStorage(LocalStorage()))
+    (movies_dir / 'abc.mp4').write_bytes(b'video')
+    (movies_dir / 'def.mp4').write_bytes(b'small video')
+    data = {
+        'record_id': '123',
+        'api_key': 'key',
+        'job_key': 'job:key:123:hash',
+        'request_host': 'localhost',
+        'output_file': str(movies_dir / 'abc.mp4'),
+        'renditions': [{'output_file': str(movies_dir / 'def.mp4')}]
+    }
+
+    publish(data)
+    publish(data, data['renditions'][0])
+    finish_job(data, 'completed', output_url=data['output_url'])
+
+    names = [storage_name(data['output_file']), storage_name(data['renditions'][0]['output_file'])]
+    for name, content in zip(names, (b'video', b'small video')):
+        digest = hashlib.sha256(content).hexdigest()
+        assert name == f'objects/{digest[:2]}/{digest}.mp4'
+        assert (movies_dir / name).read_bytes() == content
+    assert data['output_url'].endswith(names[0])
+    status, entry = (json.loads(call.args[1]) for call in client.set.call_args_list)
+    assert status['filename'] == entry['filename'] == names[0]
+    assert entry['renditions'] == names[1:]
+
+
+@pytest.fixture
+def minio(movies_dir):
+    """S3Storage against a real S3-compatible endpoint, the MinIO service in the test stack."""
+    pytest.importorskip('boto3')
+    if not Config.S3_ENDPOINT_URL:
+        pytest.skip('S3_ENDPOINT_URL is not set')
+    return S3Storage(Config.S3_BUCKET, endpoint_url=Config.S3_ENDPOINT_URL, prefix='tests')
+
+
+def test_ffmpeg_output_is_uploaded_to_s3_endpoint_while_encoding(minio, movies_dir, monkeypatch):
+    # Real S3 rejects parts under 5 MiB except the last, so the output needs a few of those
+    monkeypatch.setattr(Config, 'S3_PART_SIZE', storage.MIN_PART_SIZE)
+    output_file = str(movies_dir / 'abc.mp4')
+    command = pipe_output(['ffmpeg', '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30', '-t', '8',
+                           '-c:v', 'libx264', '-qp', '0', '-pix_fmt', 'yuv420p', '-g', '15', output_file])
+    store = ContentAddressedStorage(minio)
+    upload = store.stream_upload(output_file)
+
+    run_ffmpeg(command, stdout_sink=upload.consume)
+    upload.complete()
+
+    video = minio.client.get_object(Bucket=Config.S3_BUCKET, Key=minio.key(upload.path))['Body'].read()
+    assert len(upload.upload.parts) > 1
+    assert hashlib.sha256(video).hexdigest() == os.path.basename(os.path.splitext(upload.path)[0])
+    assert video[4:8] == b'ftyp' and b'moof' in video
+    assert not minio.exists(upload.staging)
+
+
+def test_failed_render_aborts_streamed_upload(s3, movies_dir, mocker):
+    from app.tasks import create_video_task
+    mocker.patch('app.tasks.get_storage', return_value=s3)
+    mocker.patch('app.tasks.prescale_cache.prepare', return_value=str(movies_dir / 'frame.yuv'))
+    mocker.patch('app.tasks.run_ffmpeg', side_effect=RuntimeError('ffmpeg died'))
+    data = {
+        'record_id': '123',
+        'framerate': 30,
+        'duration': 1,
+        'zoom': 0,
+        'crop': False,
+        'input_width': 640,
+        'input_height': 360,
+        'output_width': 640,
+        'output_height': 360,
+        'cached_input_file': 'in.jpg',
+        'output_file': str(movies_dir / 'abc.mp4'),
+        'request_host': 'localhost'
+    }
+
+    with pytest.raises(RuntimeError):
+        create_video_task(data)
+
+    assert s3.client.aborted == ['out/abc.mp4']
@@ -0,0 +1,81 @@
+# tests/test_streaming.py
+import pytest
+from app.config import Config
+from app.streaming import stream_command, playlist_path
+from app.tasks import create_video_task, send_webhook_task
+
+
+@pytest.fixture(autouse=True)
+def cached_inputs(mocker):
+    # The jobs below name inputs that were never downloaded; treat them as still cached
+    return mocker.patch('app.tasks.input_cache.touch', return_value=True)
+
+
+def test_playlist_path_sits_next_to_the_mp4():
+    assert playlist_path('movies/abc.mp4', 'hls') == 'movies/abc/index.m3u8'
+    assert playlist_path('movies/abc.mp4', 'dash') == 'movies/abc/manifest.mpd'
+
+
+def test_stream_command_tees_playlist_and_faststart_mp4(monkeypatch):
+    monkeypatch.setattr(Config, 'STREAM_SEGMENT_SECONDS', 2)
+
+    command = stream_command(['ffmpeg', '-i', 'in.jpg', '-vf', 'scale=640:360', '-c:v', 'libx264', 'movies/abc.mp4'], 'hls')
+
+    assert command[command.index('-map') + 1] == '0:v'
+    assert command[command.index('-force_key_frames') + 1] == 'expr:gte(t,n_forced*2)'
+    assert command[-3:-1] == ['-f', 'tee']
+    playlist, mp4 = command[-1].split('|')
+    assert 'hls_segment_type=fmp4' in playlist and playlist.endswith(']movies/abc/index.m3u8')
+    assert mp4 == '[f=mp4:movflags=+faststart]movies/abc.mp4'
+
+
+def test_stream_command_keeps_existing_maps_and_copy_keyframes():
+    command = stream_command(['ffmpeg', '-i', 'seg.mp4', '-map', '[v]', '-c', 'copy', 'movies/abc.mp4'], 'dash', copy=True)
+
+    assert command.count('-map') == 1
+    assert '-force_key_frames' not in command and '-c:v' not in command
+    assert command[-1].startswith('[f=dash:')
+
+
+def test_create_video_task_streams_without_cache_or_segments(mocker, monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'SEGMENT_MIN_PIXEL_SECONDS', 0)
+    mock_run = mocker.patch('app.tasks.run_ffmpeg', return_value=(b'', b''))
+    mock_lookup = mocker.patch('app.tasks.render_cache.lookup')
+    output_file = str(tmp_path / 'abc.mp4')
+    data = {
+        'record_id': '123',
+        'framerate': 30,
+        'duration': 25,
+        'zoom': 50,
+        'crop': False,
+        'input_width': 1920,
+        'input_height': 1080,
+        'output_width': 1280,
+        'output_height': 720,
+        'cached_input_file': '/path/to/input.jpg',
+        'output_file': output_file,
+        'request_host': 'localhost',
+        'input_sha256': 'abc',
+        'output_mode': 'hls'
+    }
+
+    create_video_task(data)
+
+    mock_lookup.assert_not_called()
+    command = mock_run.call_args.args[0]
+    assert command[-1].endswith(f'{tmp_path}/abc/index.m3u8|[f=mp4:movflags=+faststart]{output_file}')
+    assert (tmp_path / 'abc').is_dir()
+
+
+def test_send_webhook_task_includes_playlist(mocker):
+    mocker.patch('app.tasks.flush_webhooks_task.apply_async')
+    mock_enqueue = mocker.patch('app.tasks.webhooks.enqueue', return_value=True)
+
+    send_webhook_task({
+        'record_id': '123',
+        'webhook_url': 'http://example.com/webhook',
+        'output_url': 'https://localhost:80/movies/abc.mp4',
+        'playlist_url': 'https://localhost:80/movies/abc/index.m3u8'
+    })
+
+    assert mock_enqueue.call_args.args[1]['playlist'] == 'https://localhost:80/movies/abc/index.m3u8'
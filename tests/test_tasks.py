@@ -2,17 +2,37 @@
 import pytest
 import subprocess
 import json
+import time
 import logging
 
 from unittest.mock import patch, MagicMock
-from app.tasks import create_video_task
+from prometheus_client import REGISTRY
+from app.config import Config
+from app.metrics import tenant_label
+from app.prescale import prescale_cache
+from app import webhooks
+from app.tasks import (
+    create_video_task, send_webhook_task, fetch_input_task, probe_input_task, flush_webhooks_task, deliver_webhook_task,
+    sweep_webhooks_task
+)
 import os
 import requests
 
+@pytest.fixture(autouse=True)
+def cached_inputs(mocker):
+    # The jobs below name inputs that were never downloaded; treat them as still cached
+    return mocker.patch('app.tasks.input_cache.touch', return_value=True)
+
 @pytest.fixture(autouse=True)
 def set_env_vars():
     os.environ['PUBLIC_PORT'] = '80'
 
+@pytest.fixture(autouse=True)
+def prescale_cache_dir(tmp_path, monkeypatch):
+    # Renders of stills prepare their frames here instead of under the working directory
+    monkeypatch.setattr(Config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(prescale_cache, 'root', str(tmp_path / 'cache' / 'prescaled'))
+
 @pytest.fixture
 def mock_subprocess(mocker):
     mock_popen = mocker.patch('app.tasks.subprocess.Popen')
@@ -24,7 +44,7 @@ def mock_subprocess(mocker):
 
 @pytest.fixture
 def mock_requests(mocker):
-    return mocker.patch('app.tasks.requests.post')
+    return mocker.patch('app.webhooks.http_client.post')
 
 @pytest.fixture
 def mock_flask_app(mocker):
@@ -210,43 +230,196 @@ def test_create_video_task_success(mock_subprocess, mock_requests, mock_flask_ap
     result = create_video_task(data)
 
     # Assert
-    assert result == 'Video created successfully'
+    assert result['output_url'] == 'https://localhost:80/path/to/output.mp4'
     mock_subprocess.communicate.assert_called_once()
-    mock_requests.assert_called_once_with(
+    mock_requests.assert_not_called()
+
+@pytest.fixture
+def mock_enqueue(mocker):
+    mocker.patch('app.tasks.flush_webhooks_task.apply_async')
+    return mocker.patch('app.tasks.webhooks.enqueue', return_value=True)
+
+def test_send_webhook_task_success(mock_enqueue, mock_requests):
+    data = {
+        'record_id': '123',
+        'webhook_url': 'http://example.com/webhook',
+        'output_url': 'https://localhost:80/path/to/output.mp4'
+    }
+
+    result = send_webhook_task(data)
+
+    assert result == 'Webhook queued'
+    mock_enqueue.assert_called_once_with(
         'http://example.com/webhook',
-        json={'record_id': '123', 'filename': 'https://localhost:80/path/to/output.mp4'}
+        {'record_id': '123', 'filename': 'https://localhost:80/path/to/output.mp4'},
+        {}
     )
+    mock_requests.assert_not_called()
 
-def test_create_video_task_ffmpeg_failure(mock_subprocess, mock_flask_app):
-    # Arrange
-    mock_subprocess.returncode = 1
-    mock_subprocess.communicate.return_value = (b'', b'error')
+def test_send_webhook_task_error_payload(mock_enqueue):
+    data = {
+        'record_id': '123',
+        'webhook_url': 'http://example.com/webhook',
+        'error': 'File is too large'
+    }
+
+    send_webhook_task(data)
+
+    mock_enqueue.assert_called_once_with(
+        'http://example.com/webhook',
+        {'record_id': '123', 'error': 'File is too large'},
+        {}
+    )
 
+@pytest.fixture
+def mock_batch(mocker):
+    mocker.patch('app.tasks.webhooks.finish_batch', return_value=False)
+    mocker.patch('app.tasks.webhooks.acknowledge')
+    def take(*items):
+        entries = [json.dumps(item) for item in items]
+        mocker.patch('app.tasks.webhooks.take_batch', return_value=(entries, False))
+        return entries
+    return take
+
+def test_flush_webhooks_task_retries_failures(mocker, mock_requests, mock_batch):
+    entries = mock_batch({'url': 'http://example.com/a', 'payload': {'record_id': '1'}},
+                         {'url': 'http://example.com/b', 'payload': {'record_id': '2'}})
+    mock_retry = mocker.patch('app.tasks.deliver_webhook_task.apply_async')
+    mock_requests.side_effect = [MagicMock(), requests.ConnectionError('refused')]
+
+    assert flush_webhooks_task('http://example.com') == 1
+
+    assert mock_requests.call_count == 2
+    mock_retry.assert_called_once()
+    assert mock_retry.call_args.kwargs['args'] == ['http://example.com/b', {'record_id': '2'}, {}]
+    # Both are acknowledged, the failed one only once its retry is queued
+    assert [c.args for c in webhooks.acknowledge.call_args_list] == [('http://example.com', entry) for entry in entries]
+
+def test_flush_webhooks_task_keeps_unsent_callbacks_processing(mocker, mock_requests, mock_batch):
+    mock_batch({'url': 'http://example.com/a', 'payload': {'record_id': '1'}})
+    mock_requests.side_effect = RuntimeError('worker lost')
+
+    with pytest.raises(RuntimeError):
+        flush_webhooks_task('http://example.com')
+
+    # Left in the processing list for the sweep to recover
+    webhooks.acknowledge.assert_not_called()
+    webhooks.finish_batch.assert_not_called()
+
+def test_sweep_webhooks_task_flushes_stranded_origins(mocker):
+    mocker.patch('app.tasks.webhooks.sweep', return_value=['http://example.com'])
+    mock_flush = mocker.patch('app.tasks.flush_webhooks_task.delay')
+
+    assert sweep_webhooks_task() == 1
+
+    mock_flush.assert_called_once_with('http://example.com')
+
+def test_take_batch_moves_callbacks_to_processing(mocker, monkeypatch):
+    monkeypatch.setattr(Config, 'WEBHOOK_BATCH_SIZE', 3)
+    client = MagicMock()
+    client.pipeline.return_value.execute.return_value = [b'a', b'b', None, 0]
+    mocker.patch('app.webhooks.get_redis', return_value=client)
+
+    assert webhooks.take_batch('http://example.com') == ([b'a', b'b'], False)
+
+    client.pipeline.return_value.lmove.assert_called_with(
+        'webhooks:pending:http://example.com', 'webhooks:processing:http://example.com', 'LEFT', 'RIGHT')
+    assert client.pipeline.return_value.lmove.call_count == 3
+
+def test_webhook_tasks_time_the_webhook_stage(mocker, mock_requests, mock_batch):
+    labels = {'api_key': 'tenant1', 'output_width': 1280, 'output_height': 720}
+    sample = {'stage': 'webhook', 'tenant': tenant_label('tenant1'), 'resolution': '1280x720'}
+    before = REGISTRY.get_sample_value('json2video_stage_seconds_count', sample) or 0
+    mock_batch({'url': 'http://example.com/a', 'payload': {'record_id': '1'}, 'labels': labels})
+
+    flush_webhooks_task('http://example.com')
+    deliver_webhook_task('http://example.com/b', {'record_id': '2'}, labels)
+
+    assert REGISTRY.get_sample_value('json2video_stage_seconds_count', sample) == before + 2
+
+def test_deliver_webhook_task_success(mock_requests):
+    result = deliver_webhook_task('http://example.com/webhook', {'record_id': '123'})
+
+    assert result == 'Webhook called successfully'
+    mock_requests.assert_called_once_with('http://example.com/webhook', json={'record_id': '123'}, timeout=(3.0, 10.0))
+
+def test_create_video_task_refetches_evicted_input(mocker, cached_inputs):
+    # The blob was evicted while the job waited for a render worker
+    cached_inputs.return_value = False
+    entry = MagicMock(path='cache/inputs/objects/cd/cde', sha256='cde', width=640, height=480, source='downloaded')
+    mock_fetch = mocker.patch('app.tasks.input_cache.fetch', return_value=entry)
+    mock_render = mocker.patch('app.tasks.render_renditions', side_effect=lambda data, flask_app: data)
+    data = {'input_url': 'http://example.com/image.jpg', 'cache': True, 'cached_input_file': 'cache/inputs/objects/ab/abc',
+            'input_sha256': 'abc', 'input_width': 1280, 'input_height': 720, 'framerate': 30, 'duration': 1,
+            'zoom': 1, 'crop': True, 'output_width': 1280, 'output_height': 720, 'output_file': 'movies/out.mp4',
+            'request_host': 'localhost', 'renditions': [{'output_width': 640, 'output_height': 360}]}
+
+    create_video_task(data, flask_app=MagicMock())
+
+    mock_fetch.assert_called_once_with('http://example.com/image.jpg', use_cache=True)
+    rendered = mock_render.call_args.args[0]
+    assert (rendered['cached_input_file'], rendered['input_sha256']) == ('cache/inputs/objects/cd/cde', 'cde')
+    assert (rendered['input_width'], rendered['input_height']) == (640, 480)
+
+def test_render_segment_task_rejects_input_changed_mid_render(mocker, cached_inputs):
+    from app.tasks import render_segment_task
+    from app.cache import InputError
+    cached_inputs.return_value = False
+    mocker.patch('app.tasks.input_cache.fetch', return_value=MagicMock(path='p', sha256='new', width=1, height=1))
+    mock_run = mocker.patch('app.tasks.run_ffmpeg')
+    data = {'input_url': 'http://example.com/image.jpg', 'cached_input_file': 'p', 'input_sha256': 'old',
+            'input_width': 1280, 'input_height': 720, 'output_file': 'movies/out.mp4'}
+
+    # Its other segments were keyed on, and may already show, the old content
+    with pytest.raises(InputError):
+        render_segment_task.run.__wrapped__(render_segment_task, data, 0, 0, 30, 300)
+
+    mock_run.assert_not_called()
+
+def test_fetch_and_probe_tasks(mocker):
+    entry = MagicMock(path='cache/inputs/objects/ab/abc', sha256='abc', width=None, height=None)
+    mocker.patch('app.tasks.input_cache.fetch', return_value=entry)
+    mock_probe = mocker.patch('app.tasks.input_cache.probe', return_value=(1280, 720))
+    data = {'input_url': 'http://example.com/image.jpg', 'cache': True}
+
+    data = probe_input_task(fetch_input_task(data))
+
+    assert data['cached_input_file'] == 'cache/inputs/objects/ab/abc'
+    assert (data['input_width'], data['input_height']) == (1280, 720)
+    mock_probe.assert_called_once_with('abc')
+
+def test_create_video_task_counts_prescale_in_render_time(mocker, mock_flask_app):
+    def slow_prepare(data):
+        time.sleep(0.05)
+        return 'frame.yuv'
+
+    mocker.patch('app.tasks.prescale_cache.prepare', side_effect=slow_prepare)
+    mocker.patch('app.tasks.run_ffmpeg', return_value=(b'', b''))
+    mocker.patch('app.tasks.get_storage').return_value.save.return_value = ('path/to/output.mp4', 'https://localhost:80/out.mp4')
+    mock_record = mocker.patch('app.tasks.record_render')
     data = {
         'record_id': '123',
         'framerate': 30,
-        'duration': 10,
-        'zoom': 0.01,
+        'duration': 1,
+        'zoom': 0,
         'crop': True,
         'input_width': 1280,
         'input_height': 720,
         'output_width': 640,
         'output_height': 360,
-        'webhook_url': 'http://example.com/webhook',
-        'cached_input_file': '/path/to/input.mp4',
-        'output_file': 'path/to/output.mp4',  # Ensure no leading slash
+        'cached_input_file': '/path/to/input.jpg',
+        'output_file': 'path/to/output.mp4',
         'request_host': 'localhost'
     }
 
-    # Act
-    result = create_video_task(data)
+    create_video_task(data)
 
-    # Assert
-    assert result == 'FFmpeg command failed'
+    assert mock_record.call_args.args[1] >= 0.05
 
-def test_create_video_task_webhook_failure(mock_subprocess, mock_requests, mock_flask_app):
+def test_create_video_task_ffmpeg_failure(mock_subprocess, mock_flask_app):
     # Arrange
-    mock_requests.side_effect = requests.RequestException('Webhook call failed')
+    mock_subprocess.returncode = 1
+    mock_subprocess.communicate.return_value = (b'', b'error')
 
     data = {
         'record_id': '123',
@@ -264,11 +437,39 @@ def test_create_video_task_webhook_failure(mock_subprocess, mock_requests, mock_
         'request_host': 'localhost'
     }
 
+    # Act / Assert
+    with pytest.raises(subprocess.CalledProcessError):
+        create_video_task(data)
+
+def test_deliver_webhook_task_failure(mock_requests, mocker):
+    # Arrange
+    mock_requests.side_effect = requests.RequestException('Webhook call failed')
+    mocker.patch('app.tasks.Config.WEBHOOK_MAX_RETRIES', 0)
+    mock_dead_letter = mocker.patch('app.tasks.webhooks.dead_letter')
+
     # Act
-    result = create_video_task(data)
+    result = deliver_webhook_task('http://example.com/webhook', {'record_id': '123'})
 
     # Assert
     assert result == 'Webhook call failed'
+    mock_dead_letter.assert_called_once()
+
+def test_deliver_webhook_task_retries(mock_requests, mocker):
+    mock_requests.side_effect = requests.ConnectionError('refused')
+    mock_dead_letter = mocker.patch('app.tasks.webhooks.dead_letter')
+
+    # Called directly, Task.retry re-raises the original error
+    with pytest.raises(requests.ConnectionError):
+        deliver_webhook_task('http://example.com/webhook', {'record_id': '123'})
+    mock_dead_letter.assert_not_called()
+
+def test_deliver_webhook_task_client_error_is_not_retried(mock_requests, mocker):
+    response = MagicMock(status_code=404)
+    mock_requests.return_value.raise_for_status.side_effect = requests.HTTPError('Not Found', response=response)
+    mock_dead_letter = mocker.patch('app.tasks.webhooks.dead_letter')
+
+    assert deliver_webhook_task('http://example.com/webhook', {'record_id': '123'}) == 'Webhook call failed'
+    mock_dead_letter.assert_called_once()
 
 def test_create_video_task_image_different_aspect_ratios(tmp_path, caplog, mock_requests):
     input_file = os.path.join(os.path.dirname(__file__), 'test_data', 'image_1920x1080.jpg')
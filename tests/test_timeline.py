@@ -0,0 +1,123 @@
+# tests/test_timeline.py
+import os
+import copy
+
+from app.timeline import timeline_command, timeline_duration
+from app.tasks import create_timeline_task
+from app.validations import validate_json, timeline_request_error, timeline_schema
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+def clip(name, width, height, duration, **fields):
+    return dict({
+        'type': 'image',
+        'url': f'http://example.com/{name}',
+        'cached_input_file': os.path.join(TEST_DATA, name),
+        'input_sha256': name,
+        'input_width': width,
+        'input_height': height,
+        'duration': duration
+    }, **fields)
+
+def test_timeline_duration_overlaps_transitions():
+    clips = [
+        {'duration': 3},
+        {'duration': 3, 'transition': {'type': 'fade', 'duration': 1}},
+        {'duration': 2},
+        {'duration': 0.5, 'transition': {'type': 'wipeleft', 'duration': 2}}
+    ]
+    # The last transition is capped at its clip's length
+    assert timeline_duration(clips) == 3 + 2 + 2 + 0
+
+def test_timeline_command_builds_single_graph():
+    timeline = {
+        'clips': [
+            clip('image_1920x1080.jpg', 1920, 1080, 3),
+            clip('video_1024x1024.mp4', 1024, 1024, 3, type='video', start=1,
+                 transition={'type': 'fade', 'duration': 1}),
+            clip('image_800x450.jpg', 800, 450, 2, zoom=40)
+        ],
+        'audio': {'cached_input_file': 'audio.m4a', 'volume': 0.5, 'fade_out': 2}
+    }
+
+    command, duration = timeline_command(timeline, 30, 1280, 720, 'output.mp4')
+
+    graph = command[command.index('-filter_complex') + 1]
+    assert duration == 7
+    assert command.count('-i') == 4
+    assert '[v0][v1]xfade=transition=fade:duration=1:offset=2[x1]' in graph
+    assert '[x1][v2]concat=n=2:v=1:a=0[x2]' in graph
+    assert ':d=60:s=1280x720:fps=30' in graph
+    assert '[3:a]atrim=0:7,asetpts=PTS-STARTPTS,volume=0.5,afade=t=out:st=5:d=2[aout]' in graph
+    assert command[command.index('-ss') + 1] == '1'
+    assert command[-1] == 'output.mp4'
+
+def test_timeline_segment_only_decodes_clips_it_shows():
+    timeline = {
+        'clips': [
+            clip('image_1920x1080.jpg', 1920, 1080, 3),
+            clip('video_1024x1024.mp4', 1024, 1024, 3, type='video', start=1,
+                 transition={'type': 'fade', 'duration': 1}),
+            clip('image_800x450.jpg', 800, 450, 2, zoom=40)
+        ]
+    }
+
+    # 4s-5s lies inside the video clip: it is the only input, seeked 2s in
+    command, _ = timeline_command(timeline, 30, 1280, 720, 'part.mp4', frame_range=(120, 30))
+    assert command.count('-i') == 1
+    assert command[command.index('-ss') + 1:command.index('-i')] == ['3', '-t', '1.0']
+    assert 'trim=start_frame=0:end_frame=30' in command[command.index('-filter_complex') + 1]
+
+    # 2.5s-3.5s starts half way through the fade, so the segment starts with the fade and drops its first half
+    command, _ = timeline_command(timeline, 30, 1280, 720, 'part.mp4', frame_range=(75, 30))
+    graph = command[command.index('-filter_complex') + 1]
+    assert command.count('-i') == 2
+    assert command[command.index('-t') + 1] == '1.0'
+    assert '[v0][v1]xfade=transition=fade:duration=1:offset=0[x1]' in graph
+    assert 'trim=start_frame=15:end_frame=45' in graph
+
+    # Zoom clips start their motion part way through instead
+    command, _ = timeline_command(timeline, 30, 1280, 720, 'part.mp4', frame_range=(165, 15))
+    graph = command[command.index('-filter_complex') + 1]
+    assert command.count('-i') == 1
+    assert '(on+15)' in graph and ':d=45:' in graph
+
+def test_timeline_request_validation():
+    data = {
+        'record_id': 'abc',
+        'webhook_url': 'http://example.com/webhook',
+        'framerate': 30,
+        'cache': True,
+        'output_width': 1280,
+        'output_height': 720,
+        'timeline': {'clips': [{'url': 'http://example.com/a.jpg', 'duration': 5}]}
+    }
+    assert validate_json(data, schema=timeline_schema)[0] == True
+    assert timeline_request_error(data) is None
+
+    data['timeline']['clips'].append({'url': 'http://invalid.com/b.jpg', 'duration': 5})
+    assert timeline_request_error(data) == 'Invalid input URL'
+
+def test_create_timeline_task(tmp_path, monkeypatch):
+    monkeypatch.setattr('app.tasks.render_cache.root', str(tmp_path / 'renders'))
+    output_file = str(tmp_path / 'output.mp4')
+    data = {
+        'record_id': 'test_record',
+        'framerate': 30,
+        'output_width': 640,
+        'output_height': 360,
+        'output_file': output_file,
+        'request_host': 'localhost',
+        'timeline': {'clips': [
+            clip('image_1920x1080.jpg', 1920, 1080, 1),
+            clip('image_150x150.jpg', 150, 150, 1, transition={'type': 'fade', 'duration': 0.5})
+        ]}
+    }
+
+    received = copy.deepcopy(data)
+
+    result = create_timeline_task(data)
+
+    assert os.path.getsize(output_file) > 0
+    assert result['output_url'] == 'https://localhost:80/' + output_file
+    assert data == received
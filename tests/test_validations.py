@@ -1,6 +1,6 @@
 import os
 import pytest
-from app.validations import is_valid_url
+from app.validations import is_valid_url, is_valid_encoder_profile, validate_json
 
 def test_is_valid_url(monkeypatch):
     monkeypatch.setenv('ALLOWED_DOMAINS', 'example.com,trusted.com')
@@ -35,3 +35,23 @@ def test_is_valid_url(monkeypatch):
     assert is_valid_url('http://invalid.com') == False
     assert is_valid_url('https://10.0.0.1') == False
     assert is_valid_url('ftp://example.com') == False
+
+def test_is_valid_encoder_profile():
+    assert is_valid_encoder_profile('fast') == True
+    assert is_valid_encoder_profile('balanced') == True
+    assert is_valid_encoder_profile('archive') == True
+    assert is_valid_encoder_profile('ultra') == False
+
+def test_validate_json_rejects_unknown_profile():
+    data = {
+        'record_id': 'abc',
+        'input_url': 'http://example.com/image.jpg',
+        'webhook_url': 'http://example.com/webhook',
+        'framerate': 30,
+        'duration': 10,
+        'cache': True,
+        'output_width': 1024,
+        'output_height': 1024
+    }
+    assert validate_json(dict(data, profile='fast'))[0] == True
+    assert validate_json(dict(data, profile='ultra'))[0] == False